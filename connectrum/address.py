@@ -0,0 +1,145 @@
+#
+# Convert Bitcoin addresses into the scripthashes that Electrum servers want.
+#
+from hashlib import sha256
+from functools import lru_cache
+
+B58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+B58_BYTES = bytes(B58_ALPHABET.find(chr(i)) & 0xff for i in range(256))
+
+BECH32_ALPHABET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+BECH32_CONST = 1
+BECH32M_CONST = 0x2bc830a3
+
+# base58 version byte => (script prefix, script suffix), mainnet and testnet
+B58_SCRIPTS = {
+    0x00: (b'\x76\xa9\x14', b'\x88\xac'),       # P2PKH
+    0x05: (b'\xa9\x14', b'\x87'),               # P2SH
+    0x6f: (b'\x76\xa9\x14', b'\x88\xac'),
+    0xc4: (b'\xa9\x14', b'\x87'),
+}
+
+SEGWIT_HRPS = ('bc', 'tb', 'bcrt')
+
+# how many conversions to remember
+CACHE_SIZE = 100000
+
+
+def _b58_payload(addr):
+    # decode base58check, verify the checksum
+    values = addr.encode('ascii', 'replace').translate(B58_BYTES)
+    if not values or max(values) >= 58:
+        raise ValueError("Not a base58 address: %r" % addr)
+
+    num = 0
+    for v in values:
+        num = num * 58 + v
+
+    # leading 1's are zero bytes
+    zeros = len(addr) - len(addr.lstrip('1'))
+    raw = bytes(zeros) + num.to_bytes((num.bit_length() + 7) // 8, 'big')
+    if len(raw) != 25:
+        raise ValueError("Wrong length for address: %r" % addr)
+
+    body, check = raw[:21], raw[21:]
+    if sha256(sha256(body).digest()).digest()[:4] != check:
+        raise ValueError("Bad checksum in address: %r" % addr)
+
+    return body
+
+BECH32_GEN = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+
+def _bech32_step(chk, v):
+    top = chk >> 25
+    chk = (chk & 0x1ffffff) << 5 ^ v
+    for i in range(5):
+        if (top >> i) & 1:
+            chk ^= BECH32_GEN[i]
+    return chk
+
+# the checksum is linear, so we can do two characters at a time, by table
+BECH32_TABLE = [_bech32_step(_bech32_step(top << 20, 0), 0) for top in range(1024)]
+
+# bech32 characters => values, everything else => 0xff
+BECH32_BYTES = bytes(BECH32_ALPHABET.find(chr(i)) & 0xff for i in range(256))
+
+# values => digits for int(x, 32)
+VALUES_TO_DIGITS = bytes.maketrans(bytes(range(32)), b'0123456789abcdefghijklmnopqrstuv')
+
+def _bech32_polymod(values, chk=1):
+    table = BECH32_TABLE
+    it = iter(values)
+    for a, b in zip(it, it):
+        chk = ((chk & 0xfffff) << 10 ^ a << 5 ^ b) ^ table[chk >> 20]
+    if len(values) % 2:
+        chk = _bech32_step(chk, values[-1])
+    return chk
+
+def _hrp_polymod(hrp):
+    return _bech32_polymod([ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp])
+
+HRP_CHECKSUMS = {hrp: _hrp_polymod(hrp) for hrp in SEGWIT_HRPS}
+
+def _segwit_script(addr):
+    # decode bech32 (witness v0) or bech32m (v1+) into an output script
+    if addr.lower() != addr and addr.upper() != addr:
+        raise ValueError("Mixed case in address: %r" % addr)
+    addr = addr.lower()
+
+    pos = addr.rfind('1')
+    hrp = addr[:pos]
+    if hrp not in HRP_CHECKSUMS or len(addr) > 90 or pos + 8 > len(addr):
+        raise ValueError("Not a segwit address: %r" % addr)
+
+    data = addr[pos+1:].encode('ascii', 'replace').translate(BECH32_BYTES)
+    if max(data) > 31:
+        raise ValueError("Not a bech32 address: %r" % addr)
+
+    version = data[0]
+    const = _bech32_polymod(data, HRP_CHECKSUMS[hrp])
+    if const != (BECH32_CONST if version == 0 else BECH32M_CONST):
+        raise ValueError("Bad checksum in address: %r" % addr)
+
+    # regroup 5-bit values into bytes; leftover bits must be zero
+    values = data[1:-6]
+    pad = len(values) * 5 % 8
+    if not values or pad >= 5 or values[-1] & ((1 << pad) - 1):
+        raise ValueError("Bad padding in address: %r" % addr)
+    prog = (int(values.translate(VALUES_TO_DIGITS), 32) >> pad).to_bytes(len(values) * 5 // 8, 'big')
+
+    if version > 16 or not 2 <= len(prog) <= 40 or (version == 0 and len(prog) not in (20, 32)):
+        raise ValueError("Bad witness program in address: %r" % addr)
+
+    return bytes([version + 0x50 if version else 0, len(prog)]) + prog
+
+def address_script(addr):
+    '''
+        Output script (bytes) that pays to an address. Raises ValueError if
+        it's not a valid Bitcoin address (mainnet, testnet or regtest).
+    '''
+    if addr[:3].lower() in ('bc1', 'tb1') or addr[:5].lower() == 'bcrt1':
+        return _segwit_script(addr)
+
+    body = _b58_payload(addr)
+    try:
+        prefix, suffix = B58_SCRIPTS[body[0]]
+    except KeyError:
+        raise ValueError("Unknown address version: %r" % addr)
+
+    return prefix + body[1:] + suffix
+
+@lru_cache(maxsize=CACHE_SIZE)
+def address_to_scripthash(addr):
+    '''
+        The scripthash an Electrum server uses for an address: sha256 of
+        the output script, byte-reversed, as hex.
+    '''
+    return sha256(address_script(addr)).digest()[::-1].hex()
+
+def addresses_to_scripthashes(addrs):
+    '''
+        Many at once: a list of scripthashes, in the same order.
+    '''
+    return [address_to_scripthash(a) for a in addrs]
+
+# EOF
@@ -0,0 +1,263 @@
+#
+# Cache responses from the server, and forget them when they go stale.
+#
+import time
+from collections import OrderedDict
+
+# How long each kind of response can be trusted. Policy is one of:
+#
+#   'forever'       - never changes
+#   'header'        - forever, if deep enough in the chain; otherwise until next block
+#   'tip'           - until the next block (if we're subscribed to headers,
+#                     otherwise for tip_ttl seconds)
+#   'scripthash'    - until that scripthash has activity (if we're subscribed to it,
+#                     otherwise for unwatched_ttl seconds)
+#   number          - that many seconds
+#
+DEFAULT_POLICIES = {
+    'blockchain.transaction.get':           'forever',      # verbose form is 'tip'
+    'blockchain.transaction.get_merkle':    'header',
+    'blockchain.block.header':              'header',
+    'blockchain.block.headers':             'header',
+    'blockchain.estimatefee':               'tip',
+    'blockchain.relayfee':                  'tip',
+    'blockchain.scripthash.get_balance':    'scripthash',
+    'blockchain.scripthash.get_history':    'scripthash',
+    'blockchain.scripthash.get_mempool':    'scripthash',
+    'blockchain.scripthash.listunspent':    'scripthash',
+    'server.banner':                        300,
+    'server.donation_address':              300,
+    'server.features':                      300,
+}
+
+TIP = '<tip>'
+
+def approx_size(obj):
+    # rough guess at memory used by a decoded JSON response
+    if isinstance(obj, str):
+        return 50 + len(obj)
+    if isinstance(obj, list):
+        return 56 + 8*len(obj) + sum(approx_size(i) for i in obj)
+    if isinstance(obj, dict):
+        return 232 + sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    return 32
+
+
+class ResponseCache:
+    '''
+        LRU cache of responses, keyed on (method, params), bounded by
+        an estimate of the memory used.
+
+        Results are shared between callers: treat them as read-only.
+
+        Give one to StratumClient(cache=...); it will feed us the responses
+        and notifications, so scripthash data is dropped when a status
+        change arrives, and recent headers when a new block does. If nothing
+        subscribed to blockchain.headers.subscribe, we won't hear of new
+        blocks, so anything that depends on the tip is kept for tip_ttl seconds.
+    '''
+    def __init__(self, max_bytes=32*1024*1024, policies=None,
+                        confirmations=6, unwatched_ttl=30, tip_ttl=30):
+        self.max_bytes = max_bytes
+        self.policies = dict(DEFAULT_POLICIES)
+        if policies:
+            self.policies.update(policies)
+        self.confirmations = confirmations      # headers this deep won't change
+        self.unwatched_ttl = unwatched_ttl
+        self.tip_ttl = tip_ttl
+
+        self.entries = OrderedDict()    # key => (result, size, expires, tag)
+        self.tagged = {}                # tag => set of keys
+        self.watching = set()           # scripthashes we get notifications for
+        self.tip_height = None
+        self.following_tip = False      # true once subscribed to headers
+        self.size = 0
+
+        # detect responses that were overtaken by a notification
+        self.epoch = 0
+        self.invalidated_at = {}        # tag => epoch
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _key(method, params):
+        try:
+            key = (method, tuple(params))
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, method, params):
+        '''
+            Returns (True, result) if we have it, (False, None) if not.
+        '''
+        if method not in self.policies:
+            return False, None
+
+        key = self._key(method, params)
+        ent = self.entries.get(key) if key else None
+
+        if ent is None:
+            self.misses += 1
+            return False, None
+
+        result, size, expires, tag = ent
+        if expires and expires < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return False, None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, result
+
+    def _until_next_block(self):
+        # (expires, tag) for things that change with each block
+        if self.following_tip:
+            return None, TIP
+        return time.monotonic() + self.tip_ttl, TIP
+
+    def _policy(self, method, params):
+        # returns (expires, tag) or None if not to be cached
+        policy = self.policies.get(method)
+        if policy is None:
+            return None
+
+        if isinstance(policy, (int, float)):
+            return time.monotonic() + policy, None
+
+        if policy == 'forever':
+            if method == 'blockchain.transaction.get' and len(params) > 1 and params[1]:
+                # verbose form includes number of confirmations
+                return self._until_next_block()
+            return None, None
+
+        if policy == 'tip':
+            return self._until_next_block()
+
+        if policy == 'header':
+            height = params[0]
+            if method == 'blockchain.block.headers':
+                height += params[1] - 1
+            elif method == 'blockchain.transaction.get_merkle':
+                height = params[1]
+
+            if self.tip_height is None or height > self.tip_height - self.confirmations:
+                return self._until_next_block()
+            return None, None
+
+        if policy == 'scripthash':
+            sh = params[0]
+            if sh in self.watching:
+                return None, sh
+            return time.monotonic() + self.unwatched_ttl, sh
+
+        raise ValueError("Unknown cache policy: %r" % policy)
+
+    def put(self, method, params, result, epoch=None):
+        '''
+            A response has arrived, maybe keep it. Epoch is our epoch value
+            when the request was sent, if known.
+        '''
+        if method == 'blockchain.headers.subscribe':
+            self.following_tip = True
+            self._new_tip(result)
+            return
+        if method == 'blockchain.scripthash.subscribe':
+            self.watch(params[0])
+            return
+
+        key = self._key(method, params)
+        how = key and self._policy(method, params)
+        if not how:
+            return
+
+        size = approx_size(result)
+        if size > self.max_bytes // 4:
+            return
+
+        if key in self.entries:
+            self._remove(key)
+
+        expires, tag = how
+        if epoch is not None and self.invalidated_at.get(tag, -1) >= epoch:
+            # things changed while the request was in flight
+            return
+
+        self.entries[key] = (result, size, expires, tag)
+        self.size += size
+        if tag:
+            self.tagged.setdefault(tag, set()).add(key)
+
+        while self.size > self.max_bytes:
+            old = next(iter(self.entries))
+            self._remove(old)
+            self.evictions += 1
+
+    def _remove(self, key):
+        result, size, expires, tag = self.entries.pop(key)
+        self.size -= size
+        if tag:
+            keys = self.tagged.get(tag)
+            keys.discard(key)
+            if not keys:
+                del self.tagged[tag]
+
+    def invalidate(self, tag):
+        # forget everything about a scripthash, or TIP for block-dependent stuff
+        self.invalidated_at[tag] = self.epoch
+        self.epoch += 1
+
+        for key in self.tagged.pop(tag, ()):
+            result, size, expires, _ = self.entries.pop(key)
+            self.size -= size
+            self.invalidations += 1
+
+    def watch(self, sh):
+        # we are subscribed to this scripthash now; whatever we had may be stale
+        self.watching.add(sh)
+        self.invalidate(sh)
+
+    def unwatch(self, sh):
+        self.watching.discard(sh)
+        self.invalidate(sh)
+        self.invalidated_at.pop(sh, None)
+
+    def _new_tip(self, header):
+        height = header.get('height') if isinstance(header, dict) else None
+        if height is None:
+            return
+
+        if self.tip_height is not None and height != self.tip_height:
+            self.invalidate(TIP)
+
+        self.tip_height = height
+
+    def notify(self, method, params):
+        '''
+            Subscription traffic has arrived.
+        '''
+        if method == 'blockchain.scripthash.subscribe':
+            self.invalidate(params[0])
+        elif method == 'blockchain.headers.subscribe':
+            self.invalidate(TIP)
+            self._new_tip(params[0])
+
+    def clear(self):
+        self.entries.clear()
+        self.tagged.clear()
+        self.size = 0
+
+    def stats(self):
+        return dict(entries=len(self.entries), bytes=self.size, hits=self.hits,
+                        misses=self.misses, evictions=self.evictions,
+                        invalidations=self.invalidations)
+
+# EOF
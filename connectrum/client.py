@@ -4,8 +4,21 @@
 
 # Runtime check for optional modules
 from importlib import util as importutil
-import json, warnings, asyncio, ssl
+import json, warnings, asyncio, random, time
+from functools import partial, lru_cache
+from fnmatch import fnmatchcase
 from .protocol import StratumProtocol
+from .framing import DEFAULT_MAX_FRAME
+from .codec import get_codec
+from .stream import RPCStream
+from .subscription import Subscription, subscription_key
+from .watch import ScripthashWatcher
+from .address import address_to_scripthash, addresses_to_scripthashes
+from .metrics import ClientMetrics
+from .tls import get_context
+from .resolver import default_resolver, HAPPY_EYEBALLS_DELAY
+from .cache import ResponseCache
+from .runtime import get_loop
 from . import __version__
 
 # Check if aiosocks is present, and load it if it is.
@@ -15,25 +28,104 @@ if importutil.find_spec("aiosocks") is not None:
 else:
     have_aiosocks = False
 
-from collections import defaultdict
-from .exc import ElectrumErrorResponse
+from collections import deque, OrderedDict
+from .exc import ElectrumErrorResponse, ConnectionLost
+from .constants import IDEMPOTENT_METHODS
 import logging
 
 logger = logging.getLogger('connectrum')
 
+# a connection that lasts this long (seconds) was a good one: reset the backoff
+STABLE_CONNECTION = 60
+
+# requests are sent again after this many lost connections, no more (might be them)
+MAX_REPLAYS = 2
+
+@lru_cache(maxsize=256)
+def is_idempotent(method):
+    # safe to send again, if we don't know whether the server got it
+    return any(fnmatchcase(method, pat) for pat in IDEMPOTENT_METHODS)
+
 class StratumClient:
 
 
-    def __init__(self, loop=None):
+    def __init__(self, loop=None, *, max_frame=DEFAULT_MAX_FRAME, codec=None, cache=None,
+                        txstore=None, auto_batch=False, batch_window=0, max_batch=100,
+                        single_flight=False, max_inflight=None, metrics=True,
+                        auto_reconnect=True, reconnect_delay=(0.5, 60), reconnect_timeout=30,
+                        resolver=None, happy_eyeballs_delay=HAPPY_EYEBALLS_DELAY):
         '''
             Setup state needed to handle req/resp from a single Stratum server.
             Requires a transport (TransportABC) object to do the communication.
+
+            max_frame limits the size of any single message from the server (bytes).
+            codec is the JSON library to use: 'orjson', 'ujson', 'json' or None
+            for the fastest one installed.
+            cache can be a ResponseCache, or True for one with default settings.
+            txstore is a TxStore, to keep raw transactions on disk.
+
+            With auto_batch, requests made within batch_window seconds of each
+            other (or in the same pass of the event loop, if zero) are sent
+            together as a single JSON-RPC batch of up to max_batch requests.
+
+            With single_flight, an RPC() identical to one already in flight
+            is not sent again; the caller shares the answer to the first one.
+
+            max_inflight limits how many requests are sent but not yet answered;
+            more are held here until responses come back. Requests are also
+            held while the transport's write buffer is full.
+
+            metrics counts requests, latency, bytes and so on; see stats().
+
+            If the connection drops, we connect again (with auto_reconnect), waiting
+            between tries from reconnect_delay[0] up to reconnect_delay[1] seconds;
+            each try (including the server.version handshake) gets reconnect_timeout.
+            The wait only starts over once a connection has lasted a while.
+            Read-only requests that were waiting for an answer are sent again (up to
+            MAX_REPLAYS times), the rest fail with ConnectionLost, and subscriptions
+            are made again; their notifications keep coming on the same
+            Subscription objects.
+
+            Server names are looked up by a Resolver, which remembers them for a
+            while (one is shared by all clients, or give your own, or False to
+            look up every time). If a name has several addresses, we try the next
+            if the last hasn't connected after happy_eyeballs_delay seconds,
+            alternating IPv6 and IPv4, and keep the first to connect (None: one
+            at a time).
         '''
         self.protocol = None
+        self.max_frame = max_frame
+        self.codec = get_codec(codec)
+        self.metrics = ClientMetrics() if metrics else None
+
+        self.resolver = default_resolver if resolver is None else resolver
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+
+        self.cache = ResponseCache() if cache is True else cache
+        self.cache_epochs = {}              # req id => cache.epoch when sent
+        self.txstore = txstore
+
+        self.auto_batch = auto_batch
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.outbox = []
+        self.flush_handle = None
+
+        self.single_flight = single_flight
+        self.flights = {}                   # (method, params) => (future, [callers' futures])
+        self.flights_sent = 0
+        self.flights_saved = 0              # requests we didn't have to send
 
         self.next_id = 1
         self.inflight = {}
-        self.subscriptions = defaultdict(list)
+        self.abandoned = set()              # ids cancelled by caller, answer still to come
+        self.batches = {}                   # req id => ids sent in same batch
+
+        self.max_inflight = max_inflight
+        self.sent = set()                   # ids sent but not answered, if max_inflight
+        self.waiting = OrderedDict()        # first req id => frame, not yet sent
+        self.subscriptions = {}             # (method, scripthash or None) => [Subscription]
+        self.streams = {}
 
         # report our version, honestly; and indicate we only understand 1.4
         self.my_version_args = (f'Connectrum/{__version__}', '1.4')
@@ -46,33 +138,212 @@ class StratumClient:
 
         self.ka_task = None
 
-        self.loop = loop or asyncio.get_event_loop()
+        self.on_connect = []            # called with us, after each (re)connection
+        self.watcher = None
+
+        self.loop = get_loop(loop)
 
         self.reconnect = None       # call connect() first
 
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_timeout = reconnect_timeout
+        self.reconnecting = None    # task doing it
+        self.backoff = 0            # seconds to wait before next try
+        self.connected_at = None    # loop time of last successful connect
+        self.unsent = []            # frames to send once we're connected again
+        self.replay = []            # requests to send again once we're connected
+        self.replays = {}           # req id => times sent again
+        self.closed = False
+        self.short_term = False
+
         # next step: call connect()
 
     def _connection_lost(self, protocol):
         # Ignore connection_lost for old connections
+        if protocol is self.protocol:
+            self.protocol = None
+            logger.warn("Electrum server connection lost")
+
+            # cleanup keep alive task
+            if self.ka_task:
+                self.ka_task.cancel()
+                self.ka_task = None
+
+            self._requests_lost()
+
+            if self.auto_reconnect and not self.closed and (not self.short_term
+                                        or self.replay or self.subscriptions):
+                self._start_reconnect()
+
         self.disconnect_callback and self.disconnect_callback(self)
-        if protocol is not self.protocol:
+
+    def _requests_lost(self):
+        # Connection is gone, and we don't know what the server did with requests
+        # we sent on it. Keep those we can safely send again, fail the rest.
+        self.abandoned.clear()
+        self.sent.clear()
+
+        held = set()
+        for frame in list(self.waiting.values()) + [self.outbox] + self.unsent:
+            for msg in (frame if isinstance(frame, list) else [frame]):
+                held.add(msg['id'])
+
+        for req_id, (msg, fut) in list(self.inflight.items()):
+            if req_id in held or fut.done():
+                continue
+
+            method = msg['method']
+            if (self.auto_reconnect and not self.closed and req_id not in self.streams
+                    and (is_idempotent(method) or method.endswith('subscribe'))
+                    and self.replays.get(req_id, 0) < MAX_REPLAYS):
+                self.replays[req_id] = self.replays.get(req_id, 0) + 1
+                self.replay.append(msg)
+                continue
+
+            del self.inflight[req_id]
+            self.cache_epochs.pop(req_id, None)
+            if req_id in self.replays:
+                fut.set_exception(ConnectionLost("Connection lost %d times before response to %s"
+                                                    % (self.replays[req_id] + 1, method)))
+            else:
+                fut.set_exception(ConnectionLost("Connection lost before response to %s" % method))
+
+    def _start_reconnect(self):
+        if self.reconnect is None or self.closed:
+            # connect() hasn't been called yet; it will send what we have
             return
+        if not self.reconnecting or self.reconnecting.done():
+            self.reconnecting = self.loop.create_task(self._reconnect_loop())
+
+    def _more_backoff(self):
+        min_delay, max_delay = self.reconnect_delay
+        self.backoff = min(max(self.backoff * 2, min_delay), max_delay)
+
+    async def _reconnect_loop(self):
+        # keep trying, waiting longer each time (with jitter, so a crowd
+        # of clients doesn't come back all at once)
+        if self.connected_at is not None:
+            if self.loop.time() - self.connected_at >= STABLE_CONNECTION:
+                self.backoff = 0
+            else:
+                # server dropped us soon after we connected; don't rush back
+                self._more_backoff()
+
+        while not self.protocol and not self.closed:
+            if self.backoff:
+                wait = random.uniform(self.backoff / 2, self.backoff)
+                logger.info("Reconnecting to %s in %.1fs" % (self.server_info, wait))
+                await asyncio.sleep(wait)
+                if self.closed:
+                    break
 
-        self.protocol = None
-        logger.warn("Electrum server connection lost")
+            try:
+                await asyncio.wait_for(self.reconnect(), self.reconnect_timeout)
+            except Exception as exc:
+                # includes timeouts, ConnectionLost and error responses, during the handshake
+                logger.warning("Reconnect to %s failed: %r" % (self.server_info, exc))
+                self._drop_connection()
+                self._more_backoff()
 
-        # cleanup keep alive task
+        if self.protocol:
+            self._resume()
+
+    def _drop_connection(self):
+        # give up on a connection that didn't finish connecting; its
+        # connection_lost() is then ignored
+        protocol, self.protocol = self.protocol, None
+        if protocol:
+            protocol.close()
         if self.ka_task:
             self.ka_task.cancel()
             self.ka_task = None
+        self.abandoned.clear()
+        self.sent.clear()
+
+    def _resume(self):
+        # new connection is up: send again what the old one lost, and what waited for it
+        replay, self.replay = self.replay, []
+        replay = [m for m in replay if m['id'] in self.inflight]
+
+        # subscriptions that will be asked for anyway: sent again now, or
+        # still to be sent for the first time
+        held = list(replay)
+        for frame in self.unsent + list(self.waiting.values()) + [self.outbox]:
+            held.extend(frame if isinstance(frame, list) else [frame])
+        renewing = set(subscription_key(m['method'], m['params']) for m in held
+                            if m['method'].endswith('subscribe') and m['id'] in self.inflight)
+
+        if replay:
+            logger.info("Sending %d requests again" % len(replay))
+            if len(replay) == 1:
+                self._send_frame(replay[0])
+            else:
+                self._send_batch_frame(replay)
+
+        for key, subs in list(self.subscriptions.items()):
+            live = [sub for sub in subs if sub.params is not None and not sub.closed]
+            if live and key not in renewing:
+                self._resubscribe(key, live[0].params)
+
+        # these haven't been counted against max_inflight yet; and
+        # some may have been cancelled while they waited
+        unsent, self.unsent = self.unsent, []
+        for frame in unsent:
+            if isinstance(frame, list):
+                frame = [m for m in frame if m['id'] in self.inflight]
+                if len(frame) == 1:
+                    frame = frame[0]
+            elif frame['id'] not in self.inflight:
+                frame = None
+
+            if frame:
+                self._submit(frame)
+
+        self._pump()
+
+    def _resubscribe(self, key, params):
+        # the server has forgotten about this subscription; ask again
+        method = key[0]
+        msg, fut = self._new_request(method, list(params))
+        fut.add_done_callback(partial(self._resubscribed, key, params))
+        self._send_frame(msg)
+
+    def _resubscribed(self, key, params, fut):
+        if fut.cancelled():
+            return
+        if fut.exception():
+            logger.warning("Could not subscribe again to %s: %s" % (key[0], fut.exception()))
+            return
+
+        # we may have missed notifications; pass on the current state, in their format
+        result = fut.result()
+        note = [params[0], result] if key[1] is not None else [result]
+        for sub in self.subscriptions.get(key, ()):
+            if sub.params is not None:
+                sub._put(note)
+
+    def _make_protocol(self):
+        # protocol factory for create_connection()
+        return StratumProtocol(max_frame=self.max_frame, codec=self.codec, metrics=self.metrics)
 
     def close(self):
+        self.closed = True
         if self.protocol:
             self.protocol.close()
             self.protocol = None
         if self.ka_task:
             self.ka_task.cancel()
             self.ka_task = None
+        if self.reconnecting:
+            self.reconnecting.cancel()
+            self.reconnecting = None
+
+        # nobody will answer these now
+        for msg, fut in list(self.inflight.values()):
+            fut.cancel()
+        self.replay = []
+        self.unsent = []
 
 
     async def connect(self, server_info, proto_code=None, *,
@@ -84,6 +355,8 @@ class StratumClient:
         '''
         self.server_info = server_info
         self.disconnect_callback = disconnect_callback
+        self.short_term = short_term
+        self.closed = False
         if not proto_code:
              proto_code,*_ = server_info.protocols
         self.proto_code = proto_code
@@ -119,16 +392,17 @@ class StratumClient:
             else:
                 logger.debug("Error: want to use tor, but no aiosocks module.")
 
-        if use_ssl == True and disable_cert_verify:
-            # Create a more liberal SSL context that won't
-            # object to self-signed certicates. This is
-            # very bad on public Internet, but probably ok
-            # over Tor
-            use_ssl = ssl.create_default_context()
-            use_ssl.check_hostname = False
-            use_ssl.verify_mode = ssl.CERT_NONE
+        if use_ssl == True:
+            # Shared context, which also lets us resume TLS sessions on reconnect
+            # (but not over Tor or a proxy: that would link our connections).
+            # With disable_cert_verify, it won't object to self-signed
+            # certicates. This is very bad on public Internet, but
+            # probably ok over Tor
+            use_ssl = get_context(verify=not disable_cert_verify,
+                                    resume=not (use_tor or proxy))
 
-            logger.debug(" .. SSL cert check disabled")
+            if disable_cert_verify:
+                logger.debug(" .. SSL cert check disabled")
 
         async def _reconnect():
             if self.protocol: return        # race/duplicate work
@@ -136,16 +410,27 @@ class StratumClient:
             if proxy:
                 if have_aiosocks:
                     transport, protocol = await aiosocks.create_connection(
-                                            StratumProtocol, proxy=proxy,
+                                            self._make_protocol, proxy=proxy,
                                             proxy_auth=None,
                                             remote_resolve=True, ssl=use_ssl,
                                             dst=(hostname, port))
                 else:
                     logger.debug("Error: want to use proxy, but no aiosocks module.")
+            elif self.resolver:
+                # cached lookup, and race the addresses
+                t0 = self.loop.time()
+                sock, addr = await self.resolver.connect(hostname, port,
+                                                            delay=self.happy_eyeballs_delay)
+                transport, protocol = await self.loop.create_connection(
+                                                        self._make_protocol, sock=sock, ssl=use_ssl,
+                                                        server_hostname=hostname if use_ssl else None)
+                connect_time = self.loop.time() - t0
             else:
+                t0 = self.loop.time()
                 transport, protocol = await self.loop.create_connection(
-                                                        StratumProtocol, host=hostname,
+                                                        self._make_protocol, host=hostname,
                                                         port=port, ssl=use_ssl)
+                connect_time = self.loop.time() - t0
 
             self.protocol = protocol
             protocol.client = self
@@ -155,28 +440,163 @@ class StratumClient:
                                             ssl=bool(use_ssl), tor=bool(proxy))
             self.actual_connection['ip_addr'] = transport.get_extra_info('peername',
                                                         default=['unknown'])[0]
+            if not proxy:
+                # lookup, TCP and TLS; ip_addr says which address won
+                self.actual_connection['connect_time'] = connect_time
 
             # always report our version, and get server's version
             await self.get_server_version()
             logger.debug(f"Server version/protocol: {self.server_version} / {self.protocol_version}")
 
+            ssl_object = transport.get_extra_info('ssl_object')
+            if ssl_object is not None and hasattr(use_ssl, 'remember'):
+                # by now we have the session ticket, keep it for next time
+                resumed = use_ssl.remember(ssl_object)
+                self.actual_connection['tls_resumed'] = resumed
+                if self.metrics:
+                    self.metrics.tls_handshake(resumed)
+
             if not short_term:
                 self.ka_task = self.loop.create_task(self._keepalive())
 
             logger.debug("Connected to: %r" % server_info)
 
+            if self.metrics:
+                self.metrics.connects += 1
+            self.connected_at = self.loop.time()
+
+            for cb in list(self.on_connect):
+                cb(self)
+
         # close whatever we had
         if self.protocol:
             self.protocol.close()
             self.protocol = None
 
         self.reconnect = _reconnect
-        await self.reconnect()
+        try:
+            await self.reconnect()
+        except BaseException:
+            # don't leave a half-open connection (ie. handshake failed)
+            self._drop_connection()
+            raise
+
+        # anything asked for before we were connected
+        self._resume()
+
+    @classmethod
+    async def connect_fastest(cls, servers, proto_code='s', *, count=3, timeout=15,
+                                    client_kws={}, **connect_kws):
+        '''
+            Connect to several servers at once, and return a client for whichever
+            finishes connecting (including the server.version handshake) first.
+            The others are closed.
+
+            servers is a list of ServerInfo, or a KnownServers: then we try the
+            first `count` from its select(), and record how each one did in its
+            health data (those that lost are allowed to finish, for that).
+
+            client_kws go to StratumClient(), the rest to connect().
+        '''
+        from .svr_info import KnownServers
+
+        known = servers if isinstance(servers, KnownServers) else None
+        if known is not None:
+            candidates = known.select(protocol=proto_code)[:count]
+        else:
+            candidates = list(servers)
+
+        if not candidates:
+            raise RuntimeError("No servers to try")
+
+        async def attempt(client, svr):
+            t0 = time.monotonic()
+            await client.connect(svr, proto_code, **connect_kws)
+            return time.monotonic() - t0
+
+        tries = {}          # task => (client, server_info)
+        for svr in candidates:
+            client = cls(**client_kws)
+            tries[asyncio.ensure_future(attempt(client, svr))] = (client, svr)
+
+        def outcome(task):
+            client, svr = tries[task]
+            if task.cancelled():
+                return None
+            if task.exception() is not None:
+                logger.debug("Race: %s failed: %r" % (svr, task.exception()))
+                if known is not None:
+                    known.health_of(svr).failed()
+                return None
+            if known is not None:
+                known.health_of(svr).connected(task.result(), client.server_version)
+            return client
+
+        deadline = time.monotonic() + timeout
+        pending = set(tries)
+        winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, timeout=deadline - time.monotonic(),
+                                                        return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+
+                for task in done:
+                    client = outcome(task)
+                    if winner is None and client is not None:
+                        winner = client
+                        winner.actual_connection['handshake_time'] = task.result()
+                    elif client is not None:
+                        # a tie
+                        client.close()
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            for client, _ in tries.values():
+                client.close()
+            raise
+
+        async def finish(task):
+            # let it get there, to learn how long it takes, then hang up
+            client, svr = tries[task]
+            try:
+                await asyncio.wait_for(task, deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                known.health_of(svr).failed()
+            except Exception:
+                pass
+            outcome(task)
+            client.close()
+
+        timed_out = bool(pending)
+
+        for task in pending:
+            if known is not None and winner is not None:
+                asyncio.ensure_future(finish(task))
+            else:
+                task.cancel()
+                tries[task][0].close()
+
+        for task, (client, _) in tries.items():
+            if client is not winner and task.done():
+                client.close()
+
+        if winner is None and timed_out:
+            raise asyncio.TimeoutError("None of %d servers connected in time" % len(candidates))
+        if winner is None:
+            raise RuntimeError("Could not connect to any of %d servers" % len(candidates))
+
+        logger.debug("Race won by %s" % winner.server_info)
+        return winner
 
     async def get_server_version(self):
         # fetch version strings, save them
         # - can only be done once in v1.4
-        self.server_version, pv = await self.RPC('server.version', *self.my_version_args)
+        # - goes straight out, not held back by max_inflight like other requests
+        msg, fut = self._new_request('server.version', list(self.my_version_args))
+        self.protocol.send_data(msg)
+        self.server_version, pv = await fut
         self.protocol_version = float(pv)
 
     async def _keepalive(self):
@@ -192,12 +612,8 @@ class StratumClient:
             await asyncio.sleep(5*60)
 
 
-    def _send_request(self, method, params=[], is_subscribe = False):
-        '''
-            Send a new request to the server. Serialized the JSON and
-            tracks id numbers and optional callbacks.
-        '''
-
+    def _new_request(self, method, params):
+        # allocate an id and a future for a request, and track it
         if method.startswith('blockchain.address.'):
             # these methods have changed, but we can patch them
             method, params = self.patch_addr_methods(method, params)
@@ -209,75 +625,180 @@ class StratumClient:
         # serialize as JSON
         msg = {'id': req_id, 'method': method, 'params': params}
 
-        # subscriptions are a Q, normal requests are a future
-        if is_subscribe:
-            waitQ = asyncio.Queue()
-            self.subscriptions[method].append(waitQ)
-
-        fut = asyncio.Future(loop=self.loop)
+        fut = self.loop.create_future()
+        if self.metrics:
+            self.metrics.request_sent(method)
+            fut.add_done_callback(partial(self._request_done, req_id, method, self.loop.time()))
+        else:
+            fut.add_done_callback(partial(self._request_done, req_id, method, None))
 
         self.inflight[req_id] = (msg, fut)
 
-        logger.debug(" REQ: %r" % msg)
+        if self.cache is not None and not method.endswith('subscribe'):
+            self.cache_epochs[req_id] = self.cache.epoch
 
-        # send it via the transport, which serializes it
-        if not self.protocol:
-            logger.debug("Need to reconnect to server")
+        return msg, fut
 
-            async def connect_first():
-                await self.reconnect()
-                self.protocol.send_data(msg)
-
-            self.loop.create_task(connect_first())
-        else:
-            # typical case, send request immediatedly, response is a future
-            self.protocol.send_data(msg)
-
-        return fut if not is_subscribe else (fut, waitQ)
-
-    def _send_batch_requests(self, requests):
+    def _send_request(self, method, params=[], is_subscribe = False, **sub_kws):
         '''
-            Send a new batch of requests to the server.
+            Send a new request to the server. Serialized the JSON and
+            tracks id numbers and optional callbacks.
         '''
+        msg, fut = self._new_request(method, params)
 
-        full_msg = []
+        # subscriptions are a Q, normal requests are a future
+        if is_subscribe:
+            waitQ = self._add_subscription(msg['method'], msg['params'], **sub_kws)
 
-        for method, *params in requests:
+        logger.debug(" REQ: %r" % msg)
 
-            if method.startswith('blockchain.address.'):
-                # these methods have changed, but we can patch them
-                method, params = self.patch_addr_methods(method, params)
+        self._submit(msg)
 
-            # pick a new ID
-            self.next_id += 1
-            req_id = self.next_id
+        return fut if not is_subscribe else (fut, waitQ)
 
-            # serialize as JSON
-            msg = {'id': req_id, 'method': method, 'params': params}
+    def _can_send(self):
+        # are we under our limits? (auto-batching may be holding a few, about to go)
+        if self.protocol and self.protocol.write_paused:
+            return False
+        return not self.max_inflight or len(self.sent) + len(self.outbox) < self.max_inflight
+
+    def _submit(self, frame):
+        # send a request (or list of them) now, or later if we're over our limits
+        if self.closed:
+            # close() was called: it would never be sent, so fail it now
+            for msg in (frame if isinstance(frame, list) else [frame]):
+                _, fut = self.inflight.pop(msg['id'], (None, None))
+                self.cache_epochs.pop(msg['id'], None)
+                if fut and not fut.done():
+                    fut.set_exception(ConnectionLost("Client is closed, can't send %s"
+                                                        % msg['method']))
+            return
 
-            full_msg.append(msg)
+        if self.waiting:
+            self._pump()
 
-        fut = asyncio.Future(loop=self.loop)
-        first_msg = full_msg[0]
+        if self.waiting or not self._can_send():
+            first = frame[0] if isinstance(frame, list) else frame
+            self.waiting[first['id']] = frame
+            return
 
-        self.inflight[first_msg['id']] = (full_msg, fut)
+        self._post(frame)
+
+    def _pump(self):
+        # send what we've been holding, as far as limits allow
+        while self.waiting and self._can_send():
+            _, frame = self.waiting.popitem(last=False)
+            self._post(frame)
+
+    def _post(self, frame):
+        if isinstance(frame, list):
+            self._send_batch_frame(frame)
+        elif self.auto_batch:
+            # wait a moment, to see if more requests come along
+            self.outbox.append(frame)
+            if len(self.outbox) >= self.max_batch:
+                self._flush_outbox()
+            elif not self.flush_handle:
+                if self.batch_window:
+                    self.flush_handle = self.loop.call_later(self.batch_window, self._flush_outbox)
+                else:
+                    self.flush_handle = self.loop.call_soon(self._flush_outbox)
+        else:
+            self._send_frame(frame)
+
+    @property
+    def waiters(self):
+        # number of requests held back by max_inflight or a full write buffer
+        return sum(len(f) if isinstance(f, list) else 1 for f in self.waiting.values())
+
+    @property
+    def write_buffer_size(self):
+        # bytes in the transport's write buffer
+        return self.protocol.write_buffer_size if self.protocol else 0
+
+    def _flush_outbox(self):
+        # send whatever auto-batching has collected, as one frame
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        msgs, self.outbox = self.outbox, []
+        if not msgs:
+            return
+
+        if len(msgs) == 1:
+            self._send_frame(msgs[0])
+        else:
+            self._send_batch_frame(msgs)
 
-        logger.debug(" REQ: %r" % full_msg)
+    def _send_batch_frame(self, msgs):
+        # remember which requests went together, in case the server skips some
+        ids = tuple(m['id'] for m in msgs)
+        for req_id in ids:
+            self.batches[req_id] = ids
 
+        logger.debug(" REQ: %r" % msgs)
+        self._send_frame(msgs)
+
+    def _send_frame(self, frame):
         # send it via the transport, which serializes it
         if not self.protocol:
             logger.debug("Need to reconnect to server")
 
-            async def connect_first():
-                await self.reconnect()
-                self.protocol.send_data(full_msg)
-
-            self.loop.create_task(connect_first())
+            # hold it, until we are
+            self.unsent.append(frame)
+            self._start_reconnect()
         else:
-            # typical case, send request immediately, response is a future
-            self.protocol.send_data(full_msg)
+            # typical case, send request immediatedly, response is a future
+            if self.max_inflight:
+                # counts against the window once it's really on its way
+                if isinstance(frame, list):
+                    self.sent.update(m['id'] for m in frame)
+                else:
+                    self.sent.add(frame['id'])
+            self.protocol.send_data(frame)
+
+    def _request_done(self, req_id, method, t0, fut):
+        if t0 is not None:
+            self.metrics.request_done(method, self.loop.time() - t0, fut)
+
+        # if the caller cancels a request, forget about it
+        self.batches.pop(req_id, None)
+        self.replays.pop(req_id, None)
+        if fut.cancelled():
+            self.cache_epochs.pop(req_id, None)
+            if (self.inflight.pop(req_id, None) is not None
+                    and self.waiting.pop(req_id, None) is None and self.protocol):
+                # was sent; the server will still answer it
+                self.abandoned.add(req_id)
+
+        if self.sent:
+            self.sent.discard(req_id)
+            self._pump()
+
+    def _send_batch(self, requests):
+        '''
+            Send a batch of requests to the server, as one frame.
+            Returns a list of futures, one for each.
+        '''
+        msgs, futs = [], []
 
-        return fut
+        addrs = [r[1] for r in requests if r[0].startswith('blockchain.address.')]
+        if addrs:
+            # convert them all in one go
+            shs = iter(addresses_to_scripthashes(addrs))
+            requests = [(r[0].replace('.address.', '.scripthash.'), next(shs)) + r[2:]
+                            if r[0].startswith('blockchain.address.') else r
+                                for r in requests]
+
+        for method, *params in requests:
+            msg, fut = self._new_request(method, params)
+            msgs.append(msg)
+            futs.append(fut)
+
+        self._submit(msgs)
+
+        return futs
 
     def _got_response(self, msg):
         '''
@@ -289,41 +810,21 @@ class StratumClient:
         logger.debug("RESP: %r" % msg)
 
         if isinstance(msg, list):
-            # we are dealing with a batch request
-
-            inf = None
+            # response to a batch request: each one has its own future
+            sent = None
             for response in msg:
-                resp_id = response.get('id', None)
-                inf = self.inflight.pop(resp_id, None)
-                if inf:
-                    break
-
-            if not inf:
-                first_msg = msg[0]
-                logger.error("Incoming server message had unknown ID in it: %s" % first_msg['id'])
-                return
-
-            # it's a future which is done now
-            full_req, rv = inf
-
-            response_map = {resp['id']: resp for resp in msg}
-            results = []
-            for request in full_req:
-                req_id = request.get('id', None)
+                resp_id = response.get('id', None) if isinstance(response, dict) else None
+                sent = sent or self.batches.get(resp_id)
+                self._got_response(response)
+
+            for req_id in sent or ():
+                # server left some out
+                inf = self.inflight.pop(req_id, None)
+                if inf and not inf[1].done():
+                    logger.error("Batch response is missing ID: %s" % req_id)
+                    inf[1].set_exception(ElectrumErrorResponse(
+                                    dict(code=-1, message="missing from batch response"), inf[0]))
 
-                response = response_map.get(req_id, None)
-                if not response:
-                    logger.error("Incoming server message had missing ID: %s" % req_id)
-
-                error = response.get('error', None)
-                if error:
-                    logger.info("Error response: '%s'" % error)
-                    rv.set_exception(ElectrumErrorResponse(error, request))
-
-                result = response.get('result')
-                results.append(result)
-
-            rv.set_result(results)
             return
 
         resp_id = msg.get('id', None)
@@ -340,9 +841,20 @@ class StratumClient:
 
             logger.debug("Traffic on subscription: %s" % method)
 
-            subs = self.subscriptions.get(method)
-            for q in subs:
-                self.loop.create_task(q.put(result))
+            if self.metrics:
+                self.metrics.notified(method)
+
+            if self.cache is not None:
+                self.cache.notify(method, result)
+
+            key = subscription_key(method, result)
+            for sub in self.subscriptions.get(key, ()):
+                sub._put(result)
+
+            if key[1] is not None:
+                # also those listening to everything for this method
+                for sub in self.subscriptions.get((method, None), ()):
+                    sub._put(result)
 
             return
 
@@ -350,14 +862,38 @@ class StratumClient:
         result = msg.get('result')
 
         # fetch and forget about the request
-        inf = self.inflight.pop(resp_id)
+        inf = self.inflight.pop(resp_id, None)
         if not inf:
-            logger.error("Incoming server message had unknown ID in it: %s" % resp_id)
+            if resp_id in self.abandoned:
+                self.abandoned.discard(resp_id)
+                logger.debug("Response to a cancelled request: %s" % resp_id)
+            elif isinstance(resp_id, int) and resp_id <= self.next_id:
+                logger.debug("Response to a cancelled request: %s" % resp_id)
+            else:
+                logger.error("Incoming server message had unknown ID in it: %s" % resp_id)
             return
 
         # it's a future which is done now
         req, rv = inf
 
+        if (self.txstore is not None and 'error' not in msg
+                and req['method'] == 'blockchain.transaction.get' and not req['params'][1:2]):
+            try:
+                self.txstore.put(req['params'][0], bytes.fromhex(result))
+            except ValueError as exc:
+                # server is lying to us
+                logger.error("Bad transaction from server: %s" % exc)
+                msg = dict(error=dict(code=-1, message=str(exc)))
+
+        if self.cache is not None:
+            epoch = self.cache_epochs.pop(resp_id, None)
+            if 'error' not in msg:
+                self.cache.put(req['method'], req['params'], result, epoch=epoch)
+
+        if rv.done():
+            # caller gave up on it
+            return
+
         if 'error' in msg:
             err = msg['error']
 
@@ -367,6 +903,52 @@ class StratumClient:
         else:
             rv.set_result(result)
 
+    def stats(self):
+        '''
+            Snapshot of what we've been doing, as a dict. See also
+            metrics.render_prometheus().
+        '''
+        rv = self.metrics.snapshot() if self.metrics else {}
+
+        rv.update(inflight=len(self.inflight), waiting=self.waiters,
+                    write_buffer=self.write_buffer_size,
+                    subscriptions=sum(len(s) for s in self.subscriptions.values()),
+                    connected=bool(self.protocol))
+
+        if self.single_flight:
+            rv.update(flights_sent=self.flights_sent, flights_saved=self.flights_saved)
+        if self.cache is not None:
+            rv['cache'] = self.cache.stats()
+        if self.txstore is not None:
+            rv['txstore'] = self.txstore.stats()
+
+        return rv
+
+    def _sole_request(self):
+        # if exactly one request is outstanding, its ID; but not while answers
+        # to cancelled requests may still arrive, they'd look the same
+        if len(self.inflight) == 1 and not self.abandoned:
+            return next(iter(self.inflight))
+        return None
+
+    def _stream_items(self, req_id, items):
+        # protocol has decoded some list items of a streamed response
+        stream = self.streams.get(req_id)
+        if stream:
+            stream._feed(items)
+
+    def _stream_done(self, req_id, resp_id):
+        # streamed response is complete
+        if resp_id is not None and resp_id != req_id:
+            logger.error("Streamed response was for ID %s, not %s" % (resp_id, req_id))
+
+        # it was the answer, even if the caller has given up on it
+        self.abandoned.discard(req_id)
+        self.cache_epochs.pop(req_id, None)
+        inf = self.inflight.pop(req_id, None)
+        if inf and not inf[1].done():
+            inf[1].set_result(None)
+
     def RPC(self, method, *params):
         '''
             Perform a remote command.
@@ -383,9 +965,114 @@ class StratumClient:
         assert '.' in method
         #assert not method.endswith('subscribe')
 
+        if self.cache is not None:
+            if method.startswith('blockchain.address.'):
+                method, params = self.patch_addr_methods(method, params)
+
+            hit, result = self.cache.get(method, params)
+            if hit:
+                fut = self.loop.create_future()
+                fut.set_result(result)
+                return fut
+
+        if (self.txstore is not None and method == 'blockchain.transaction.get'
+                and not params[1:2]):
+            # raw transaction might be on disk already
+            raw = self.txstore.get(params[0])
+            if raw is not None:
+                fut = self.loop.create_future()
+                fut.set_result(raw.hex())
+                return fut
+
+        if self.single_flight and not method.endswith('subscribe'):
+            return self._join_flight(method, params)
+
         return self._send_request(method, params)
 
-    def batch_rpc(self, requests):
+    def _join_flight(self, method, params):
+        # share the answer with an identical request already in flight,
+        # or send one, if there isn't
+        try:
+            key = (method, tuple(params))
+            hash(key)
+        except TypeError:
+            return self._send_request(method, params)
+
+        flight = self.flights.get(key)
+        if flight is None:
+            shared = self._send_request(method, params)
+            flight = self.flights[key] = (shared, [])
+            shared.add_done_callback(partial(self._flight_done, key))
+            self.flights_sent += 1
+        else:
+            self.flights_saved += 1
+
+        # each caller gets their own future, so they can cancel it alone
+        fut = self.loop.create_future()
+        fut.add_done_callback(partial(self._flight_left, key))
+        flight[1].append(fut)
+
+        return fut
+
+    def _flight_done(self, key, shared):
+        # answer is in: pass it along
+        flight = self.flights.get(key)
+        if not flight or flight[0] is not shared:
+            # everyone gave up on it already
+            return
+        del self.flights[key]
+
+        for fut in flight[1]:
+            if fut.done():
+                continue
+            if shared.cancelled():
+                fut.cancel()
+            elif shared.exception():
+                fut.set_exception(shared.exception())
+            else:
+                fut.set_result(shared.result())
+
+    def _flight_left(self, key, fut):
+        # a caller has cancelled; if nobody is waiting anymore, cancel the request
+        if not fut.cancelled():
+            return
+
+        flight = self.flights.get(key)
+        if flight and all(f.done() for f in flight[1]):
+            del self.flights[key]
+            flight[0].cancel()
+
+    def RPC_stream(self, method, *params):
+        '''
+            Perform a remote command which returns a (long) list, such as:
+
+                blockchain.scripthash.get_history
+
+            Returns an async iterator, which yields the items of the list one
+            at a time as they are decoded off the wire, so memory use stays
+            flat and you can start work before the transfer is finished:
+
+                async for tx in client.RPC_stream('blockchain.scripthash.get_history', sh):
+                    ...
+
+            Incremental decoding is only possible when we can tell the response
+            is ours before it ends; so either the server puts the "id" first, or
+            nothing else is outstanding on this connection (including answers
+            to requests that were cancelled). Otherwise, the items are delivered
+            all at once when the response is complete.
+        '''
+        assert '.' in method
+
+        fut = self._send_request(method, params)
+
+        # _send_request() has just used this id
+        req_id = self.next_id
+        stream = RPCStream(self, req_id, fut)
+        self.streams[req_id] = stream
+
+        return stream
+
+    def batch_rpc(self, requests, chunk_size=None, max_chunks=4, return_exceptions=False):
         '''
             Perform a batch of remote commands.
 
@@ -397,32 +1084,103 @@ class StratumClient:
             .. and sometimes take arguments, all of which are positional.
 
             Returns a future which will you should await for the list of results for each command
-            from the server. Failures are returned as exceptions.
+            from the server. Failures are returned as exceptions: the first one is raised,
+            or with return_exceptions, each takes the place of its result in the list.
+
+            Long lists are split into batches of chunk_size requests (max_batch
+            by default), with up to max_chunks of them in flight at once.
+        '''
+        it = self.batch_rpc_iter(requests, chunk_size, max_chunks, return_exceptions)
+
+        async def collect():
+            return [r async for r in it]
+
+        return self.loop.create_task(collect())
+
+    async def batch_rpc_iter(self, requests, chunk_size=None, max_chunks=4,
+                                    return_exceptions=False):
+        '''
+            Same as batch_rpc(), but an async iterator which yields the results,
+            in order, as each batch comes back:
+
+                async for bal in client.batch_rpc_iter(requests):
+                    ...
         '''
+        requests = list(requests)
         for request in requests:
             assert isinstance(request, tuple)
             method, *params = request
             assert '.' in method
 
-        return self._send_batch_requests(requests)
+        size = chunk_size or self.max_batch
+        pending = deque()       # futures of batches in flight
+        pos = 0
+
+        try:
+            while pos < len(requests) or pending:
+                # keep the pipeline full
+                while pos < len(requests) and len(pending) < max_chunks:
+                    pending.append(self._send_batch(requests[pos:pos+size]))
+                    pos += size
+
+                futs = pending.popleft()
+                await asyncio.wait(futs)
+
+                for fut in futs:
+                    exc = fut.exception()
+                    if exc is None:
+                        yield fut.result()
+                    elif return_exceptions:
+                        yield exc
+                    else:
+                        raise exc
+        finally:
+            # caller stopped early, or failed
+            for futs in pending:
+                for fut in futs:
+                    fut.cancel()
 
     def patch_addr_methods(self, method, params):
         # blockchain.address.get_balance(addr) => blockchain.scripthash.get_balance(sh)
-        from hashlib import sha256
-        from binascii import b2a_hex
-        try:
-            from pycoin.symbols.btc import network as BTC       # bitcoin only!
-        except ImportError:
-            raise RuntimeError("we can patch obsolete protocol msgs, but need pycoin>=0.90")
+        return method.replace('.address.', '.scripthash.'), \
+                    [address_to_scripthash(params[0])]+list(params[1:])
+
+    def _add_subscription(self, method, params, **kws):
+        key = subscription_key(method, params)
+        sub = Subscription(self, key, **kws)
+        sub.params = tuple(params)
+        self.subscriptions.setdefault(key, []).append(sub)
+        return sub
+
+    def _drop_subscription(self, sub):
+        subs = self.subscriptions.get(sub.key, [])
+        if sub in subs:
+            subs.remove(sub)
+        if not subs:
+            self.subscriptions.pop(sub.key, None)
+
+    def listen(self, method, **kws):
+        '''
+            Get all notifications for a subscription method (for any scripthash,
+            say) without sending anything to the server. Returns a Subscription.
+        '''
+        sub = self._add_subscription(method, (), **kws)
+        sub.params = None
+        return sub
 
-        # convert from base58 into sha256(binary of script)?
-        addr = BTC.parse(params[0])
-        sh = sha256(addr.script()).digest()[::-1]
+    async def watch(self, scripthashes, **kws):
+        '''
+            Subscribe to lots of scripthashes at once. Returns a ScripthashWatcher,
+            which yields (scripthash, status) when any of them change. Calling
+            again adds more to the same watcher. Keyword args go to ScripthashWatcher.
+        '''
+        if self.watcher is None or self.watcher.closed:
+            self.watcher = ScripthashWatcher(self, **kws)
 
-        return method.replace('.address.', '.scripthash.'), \
-                    [str(b2a_hex(sh), 'ascii')]+list(params[1:])
+        await self.watcher.add(scripthashes)
+        return self.watcher
 
-    def subscribe(self, method, *params):
+    def subscribe(self, method, *params, maxsize=1000, overflow=None):
         '''
             Perform a remote command which will stream events/data to us.
 
@@ -430,14 +1188,16 @@ class StratumClient:
                 server.peers.subscribe
             .. and sometimes take arguments, all of which are positional.
 
-            Returns a tuple: (Future, asyncio.Queue).
+            Returns a tuple: (Future, Subscription).
             The future will have the result of the initial
-            call, and the queue will receive additional
-            responses as they happen.
+            call, and the subscription (an async iterator, which
+            also works like an asyncio.Queue) will receive additional
+            responses as they happen. See Subscription for maxsize and overflow.
         '''
         assert '.' in method
         assert method.endswith('subscribe')
-        return self._send_request(method, params, is_subscribe=True)
+        return self._send_request(method, params, is_subscribe=True,
+                                        maxsize=maxsize, overflow=overflow)
 
 
 if __name__ == '__main__':
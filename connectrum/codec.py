@@ -0,0 +1,84 @@
+#
+# JSON encoding for the wire. Uses the fastest library we can find.
+#
+
+# Runtime check for optional modules
+from importlib import util as importutil
+import json
+
+# Check for faster JSON libraries, and load them if present.
+if importutil.find_spec("orjson") is not None:
+    import orjson
+    have_orjson = True
+else:
+    have_orjson = False
+
+if importutil.find_spec("ujson") is not None:
+    import ujson
+    have_ujson = True
+else:
+    have_ujson = False
+
+
+class StdlibCodec:
+    '''
+        Python's own json module. Always available, slowest.
+
+        encode() gives bytes (without the newline), and decode() takes
+        bytes, bytearray or memoryview. Bad input raises ValueError.
+    '''
+    name = 'json'
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data):
+        return json.loads(str(data, 'utf-8'))
+
+class OrjsonCodec(StdlibCodec):
+    name = 'orjson'
+
+    def encode(self, obj):
+        return orjson.dumps(obj)
+
+    def decode(self, data):
+        # takes memoryview directly, no copies
+        return orjson.loads(data)
+
+class UjsonCodec(StdlibCodec):
+    name = 'ujson'
+
+    def encode(self, obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+    def decode(self, data):
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return ujson.loads(data)
+
+
+# by preference
+CODECS = {}
+if have_orjson:
+    CODECS['orjson'] = OrjsonCodec()
+if have_ujson:
+    CODECS['ujson'] = UjsonCodec()
+CODECS['json'] = StdlibCodec()
+
+def get_codec(codec=None):
+    '''
+        Find a codec by name, or pick the fastest one available if None.
+        Objects having encode/decode methods are passed through.
+    '''
+    if codec is None:
+        return next(iter(CODECS.values()))
+
+    if isinstance(codec, str):
+        try:
+            return CODECS[codec]
+        except KeyError:
+            raise ValueError("JSON codec '%s' not available" % codec)
+
+    return codec
+
+# EOF
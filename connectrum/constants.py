@@ -12,6 +12,9 @@ PROTOCOL_CODES = dict(t='TCP (plaintext)', h='HTTP (plaintext)', s='SSL', g='Web
 #
 DEFAULT_PORTS = { 't':50001, 's':50002, 'h':8081, 'g':8082}
 
+# Requests which only read data, so are safe to send more than once (fnmatch patterns)
+IDEMPOTENT_METHODS = ('blockchain.*.get*', 'blockchain.transaction.get', 'blockchain.block.header*')
+
 BOOTSTRAP_SERVERS = {
     'erbium1.sytes.net': {'t':50001, 's':50002},
     'ecdsa.net': {'t':50001, 's':110},
@@ -0,0 +1,154 @@
+#
+# Find Electrum servers by asking the ones we know about their peers, and so on.
+#
+import asyncio, time
+from .client import StratumClient
+import logging
+
+logger = logging.getLogger('connectrum')
+
+
+class PeerCrawler:
+    '''
+        Breadth-first crawl over server.peers.subscribe, starting from the
+        servers in a KnownServers. New servers are added to it as they're
+        found, and (with save_as) it's saved every so often along the way.
+
+            ks = KnownServers()
+            ks.from_json('servers.json')
+            crawler = PeerCrawler(ks, 's', save_as='servers.json')
+            await crawler.crawl()
+
+        At most `workers` servers are contacted at once. Each gets
+        connect_timeout for the connection (TCP, TLS and the server.version
+        handshake) and peers_timeout to give us its peers list.
+
+        With use_tor (True, or (host, port) of the SOCKS proxy) every connection
+        goes through that one Tor proxy, and .onion servers are crawled too.
+    '''
+    def __init__(self, servers, proto_code='s', *, workers=20, connect_timeout=10,
+                        peers_timeout=10, max_depth=None, use_tor=False,
+                        save_as=None, save_every=25):
+        self.servers = servers              # a KnownServers instance
+        self.proto_code = proto_code
+        self.workers = workers
+        self.connect_timeout = connect_timeout
+        self.peers_timeout = peers_timeout
+        self.max_depth = max_depth          # None for no limit
+        self.use_tor = use_tor
+        self.save_as = save_as
+        self.save_every = save_every
+
+        self.seen = set()                   # hostnames, queued at some point
+        self.connected = set()
+        self.failed = set()
+        self.found = set()                  # new to us
+        self._unsaved = 0
+
+    def _usable(self, svr):
+        return svr.select(self.proto_code, is_onion=None if self.use_tor else False)
+
+    def _queue(self, queue, svr, depth):
+        key = str(svr)
+        if key in self.seen or not self._usable(svr):
+            return
+        if self.max_depth is not None and depth > self.max_depth:
+            return
+
+        self.seen.add(key)
+        queue.put_nowait((svr, depth))
+
+    async def probe(self, svr):
+        '''
+            Connect and get the peers list. Returns it, or None if that didn't work.
+        '''
+        conn = StratumClient(metrics=False, auto_reconnect=False)
+        health = self.servers.health_of(svr)
+
+        try:
+            t0 = time.monotonic()
+            await asyncio.wait_for(conn.connect(svr, self.proto_code, use_tor=self.use_tor,
+                                                    short_term=True),
+                                    self.connect_timeout)
+            health.connected(time.monotonic() - t0, conn.server_version)
+
+            t0 = time.monotonic()
+            peers = await asyncio.wait_for(conn.RPC('server.peers.subscribe'),
+                                                self.peers_timeout)
+            health.responded(time.monotonic() - t0)
+
+        except Exception as exc:
+            logger.debug("Crawl: %s failed: %r" % (svr, exc))
+            health.failed()
+            return None
+
+        finally:
+            conn.close()
+
+        return peers
+
+    async def _worker(self, queue):
+        while True:
+            svr, depth = await queue.get()
+            try:
+                peers = await self.probe(svr)
+
+                if peers is None:
+                    self.failed.add(str(svr))
+                else:
+                    self.connected.add(str(svr))
+
+                    try:
+                        more = self.servers.add_peer_response(peers)
+                    except Exception as exc:
+                        logger.info("Crawl: junk peers list from %s: %r" % (svr, exc))
+                        more = set()
+
+                    if more:
+                        logger.info("Crawl: %d new servers from %s" % (len(more), svr))
+                        self.found.update(more)
+
+                    for row in peers:
+                        peer = self.servers.get(str(row[1]).lower())
+                        if peer is not None:
+                            self._queue(queue, peer, depth+1)
+
+                self._unsaved += 1
+                if self.save_as and self._unsaved >= self.save_every:
+                    self.save()
+            except Exception as exc:
+                # keep going: if every worker died, crawl() would wait forever
+                logger.warning("Crawl: trouble with %s: %r" % (svr, exc))
+            finally:
+                queue.task_done()
+
+    def save(self):
+        self._unsaved = 0
+        self.servers.save_json(self.save_as)
+
+    async def crawl(self, seeds=None):
+        '''
+            Crawl, starting from seeds (ServerInfo's), or everything we know.
+            Returns when there's nothing left to try; see stats().
+        '''
+        queue = asyncio.Queue()
+        for svr in (self.servers.values() if seeds is None else seeds):
+            self._queue(queue, svr, 0)
+
+        workers = [asyncio.ensure_future(self._worker(queue)) for _ in range(self.workers)]
+        try:
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+
+            if self.save_as and self._unsaved:
+                self.save()
+
+        return self.stats()
+
+    def stats(self):
+        return dict(tried=len(self.connected) + len(self.failed), connected=len(self.connected),
+                        failed=len(self.failed), found=len(self.found), known=len(self.servers))
+
+# EOF
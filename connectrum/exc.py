@@ -5,3 +5,11 @@
 
 class ElectrumErrorResponse(RuntimeError):
     pass
+
+class ConnectionLost(ConnectionError):
+    # request was sent, but the connection dropped before the answer came
+    pass
+
+class FrameTooLarge(ValueError):
+    # server sent a line longer than we are willing to buffer
+    pass
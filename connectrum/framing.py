@@ -0,0 +1,89 @@
+#
+# Unframe the newline-delimited stream of JSON we get from Electrum servers.
+#
+from .exc import FrameTooLarge
+
+# Busy addresses can produce responses of many megabytes, but nothing
+# legitimate comes near this. Protects us from a hostile server.
+DEFAULT_MAX_FRAME = 64 * 1024 * 1024
+
+
+class LineFramer:
+    '''
+        Collect bytes from the transport and split out complete lines.
+
+        Only newly arrived bytes are scanned for the delimiter, so a huge
+        response that arrives in thousands of small pieces takes linear time.
+
+        Lines are returned as memoryview slices of our buffer, and are only
+        valid until the next call to feed(). Copy them if you need to keep them.
+    '''
+    def __init__(self, max_frame=DEFAULT_MAX_FRAME):
+        self.max_frame = max_frame
+        self.buf = bytearray()
+        self.start = 0          # where the current (partial) frame begins
+        self.scanned = 0        # no delimiter in buf[start:scanned]
+
+    @property
+    def pending(self):
+        # size of the partial frame we are holding
+        return len(self.buf) - self.start
+
+    def take_pending(self):
+        '''
+            Remove and return the partial frame we are holding.
+        '''
+        rv = bytes(self.buf[self.start:])
+        self.start = self.scanned = len(self.buf)
+        return rv
+
+    def _compact(self):
+        # forget about the lines we've already given out
+        if not self.start:
+            return
+
+        try:
+            del self.buf[:self.start]
+        except BufferError:
+            # someone is still holding a view of an old line; leave
+            # them with the old buffer and move on with a fresh one.
+            self.buf = bytearray(memoryview(self.buf)[self.start:])
+
+        self.scanned -= self.start
+        self.start = 0
+
+    def feed(self, data):
+        '''
+            Add more bytes, and return a list of complete lines (without the newline).
+        '''
+        self._compact()
+
+        buf = self.buf
+        buf += data
+
+        lines = []
+        mv = None
+        pos = self.start
+        nl = buf.find(b'\n', self.scanned)
+
+        while nl >= 0:
+            if nl - pos > self.max_frame:
+                raise FrameTooLarge(nl - pos)
+
+            if nl > pos:
+                if mv is None:
+                    mv = memoryview(buf)
+                lines.append(mv[pos:nl])
+
+            pos = nl + 1
+            nl = buf.find(b'\n', pos)
+
+        self.start = pos
+        self.scanned = len(buf)
+
+        if self.pending > self.max_frame:
+            raise FrameTooLarge(self.pending)
+
+        return lines
+
+# EOF
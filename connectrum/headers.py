@@ -0,0 +1,257 @@
+#
+# Keep the block headers locally, in a memory-mapped flat file indexed by height.
+#
+import os, mmap, asyncio
+from hashlib import sha256
+import logging
+
+logger = logging.getLogger('connectrum')
+
+HEADER_SIZE = 80
+
+# servers give at most this many headers per request
+CHUNK_SIZE = 2016
+
+def header_hash(raw):
+    # hash of a header, in internal byte order
+    return sha256(sha256(raw).digest()).digest()
+
+def prev_hash(raw):
+    return bytes(raw[4:36])
+
+
+class HeaderStore:
+    '''
+        Flat file of 80-byte block headers, where height N is at offset N*80.
+        Lookups are memoryview slices of a memory map, so no copies are made.
+
+        Fill it with sync(), which downloads missing headers in chunks, with
+        several requests in flight at once (give it a StratumClientPool to
+        spread them over several servers). Then follow() keeps it current,
+        rolling back any blocks that the server says were reorganized away.
+
+        Headers are checked to link together by hash; proof of work is not checked.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR|os.O_CREAT, 0o644)
+        self.count = self._valid_count()
+
+        self._map = None
+        self._view = None
+        self._remap()
+
+        self.lock = asyncio.Lock()
+        self.reorgs = 0
+
+    def _valid_count(self):
+        # Number of headers in the file. A rollback leaves zeros after the
+        # end of the chain (we never shrink a file that might be mapped).
+        count = os.fstat(self.fd).st_size // HEADER_SIZE
+        zero = bytes(HEADER_SIZE)
+
+        while count:
+            n = min(count, CHUNK_SIZE)
+            tail = os.pread(self.fd, n*HEADER_SIZE, (count-n)*HEADER_SIZE)
+            for i in range(n-1, -1, -1):
+                if tail[i*HEADER_SIZE:(i+1)*HEADER_SIZE] != zero:
+                    return count - n + i + 1
+            count -= n
+
+        return 0
+
+    def _remap(self):
+        # Map everything we have. Old maps are left for the garbage collector,
+        # since callers may still hold views into them.
+        size = self.count * HEADER_SIZE
+        if not size:
+            self._map = self._view = None
+            return
+
+        self._map = mmap.mmap(self.fd, size, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            try:
+                self._map.close()
+            except BufferError:
+                # still in use by someone; it'll be closed when they're done
+                pass
+            self._map = self._view = None
+
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def height(self):
+        # height of our best block, or -1 if empty
+        return self.count - 1
+
+    def header(self, height):
+        '''
+            Header at a height, as a memoryview (80 bytes).
+        '''
+        return self.headers(height, 1)
+
+    def headers(self, start, count):
+        '''
+            Consecutive headers, as one memoryview.
+        '''
+        if start < 0 or count < 0 or start + count > self.count:
+            raise IndexError("Don't have headers %d..%d" % (start, start+count-1))
+
+        end = (start + count) * HEADER_SIZE
+        if self._view is None or end > len(self._view):
+            self._remap()
+
+        return self._view[start*HEADER_SIZE:end]
+
+    def block_hash(self, height):
+        # as displayed (hex, reversed)
+        return header_hash(self.header(height))[::-1].hex()
+
+    def _check_links(self, start, raw):
+        # verify headers in raw link to each other, and onto ours at start-1
+        prev = header_hash(self.header(start-1)) if start else bytes(32)
+
+        for pos in range(0, len(raw), HEADER_SIZE):
+            hdr = raw[pos:pos+HEADER_SIZE]
+            if prev_hash(hdr) != prev:
+                return False
+            prev = header_hash(hdr)
+
+        return True
+
+    def _write(self, start, raw):
+        assert start <= self.count
+        os.pwrite(self.fd, raw, start*HEADER_SIZE)
+        self.count = max(self.count, start + len(raw) // HEADER_SIZE)
+
+    def rollback(self, height):
+        '''
+            Forget headers above this height.
+        '''
+        if height >= self.height:
+            return
+
+        logger.warning("Rolling back headers from %d to %d" % (self.height, height))
+
+        first = height + 1
+        os.pwrite(self.fd, bytes((self.count - first) * HEADER_SIZE), first*HEADER_SIZE)
+        self.count = first
+
+    async def _fetch(self, client, start, count):
+        res = await client.RPC('blockchain.block.headers', start, count)
+        raw = bytes.fromhex(res['hex'])
+        if len(raw) != res['count'] * HEADER_SIZE:
+            raise ValueError("Server sent wrong number of headers")
+        return raw
+
+    async def sync(self, client, tip_height=None, concurrency=8):
+        '''
+            Download headers we don't have yet, up to tip_height (or server's tip).
+            Client may be a StratumClient or StratumClientPool.
+        '''
+        if tip_height is None:
+            tip = await client.RPC('blockchain.headers.subscribe')
+            tip_height = tip['height']
+
+        async with self.lock:
+            await self._sync(client, tip_height, concurrency)
+
+    async def _sync(self, client, tip_height, concurrency):
+        reorgs = 0
+
+        while self.height < tip_height:
+            # a wave of chunk requests, all at once
+            starts = range(self.count, tip_height+1, CHUNK_SIZE)[:concurrency]
+            wave = [self._fetch(client, s, min(CHUNK_SIZE, tip_height+1-s)) for s in starts]
+
+            for start, raw in zip(starts, await asyncio.gather(*wave)):
+                if start != self.count:
+                    # earlier chunk came up short
+                    break
+
+                if not raw:
+                    return
+
+                if not self._check_links(start, raw):
+                    if start == 0:
+                        raise ValueError("Server's headers do not link together")
+
+                    # chain changed underneath us
+                    reorgs += 1
+                    if reorgs > 10:
+                        raise ValueError("Server's chain keeps changing")
+
+                    await self._reorg(client, start)
+                    break
+
+                self._write(start, raw)
+
+            logger.debug("Have headers up to %d (of %d)" % (self.height, tip_height))
+
+    async def _find_fork(self, client, height):
+        # highest height (below height) where server agrees with us
+        top = min(height, self.count) - 1
+        step = 16
+
+        while top >= 0:
+            start = max(0, top - step + 1)
+            theirs = await self._fetch(client, start, top - start + 1)
+
+            for i in range(len(theirs) // HEADER_SIZE - 1, -1, -1):
+                if theirs[i*HEADER_SIZE:(i+1)*HEADER_SIZE] == self.header(start+i):
+                    return start + i
+
+            top = start - 1
+            step = min(step*4, CHUNK_SIZE)
+
+        return -1
+
+    async def _reorg(self, client, height):
+        # server's header at height doesn't connect to ours
+        fork = await self._find_fork(client, height)
+        self.reorgs += 1
+        self.rollback(fork)
+
+    async def _new_tip(self, client, hdr):
+        height = hdr['height']
+        raw = bytes.fromhex(hdr['hex'])
+
+        async with self.lock:
+            if height == self.count and self._check_links(height, raw):
+                # typical case: next block
+                self._write(height, raw)
+                return
+
+            if height < self.count and raw == self.header(height):
+                # nothing new
+                return
+
+            if height <= self.count:
+                await self._reorg(client, height)
+
+            await self._sync(client, height, 8)
+
+    async def follow(self, client):
+        '''
+            Stay current with the server's chain, forever. Catches up first.
+        '''
+        fut, q = client.subscribe('blockchain.headers.subscribe')
+        tip = await fut
+
+        await self.sync(client, tip['height'])
+        await self._new_tip(client, tip)
+
+        while 1:
+            hdr, = await q.get()
+            await self._new_tip(client, hdr)
+
+# EOF
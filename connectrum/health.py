@@ -0,0 +1,188 @@
+#
+# Keep track of how well each server has been doing: speed, failures, and being up to date.
+#
+import asyncio, time, random
+import logging
+
+logger = logging.getLogger('connectrum')
+
+# weight of each new sample in the moving averages
+EWMA_ALPHA = 0.2
+
+# when we know nothing about a server, assume it's this slow (seconds)
+UNKNOWN_LATENCY = 1.0
+
+# a server this many blocks behind the best tip we've seen is out of date
+STALE_BLOCKS = 2
+
+# even the worst server gets picked now and then, so we notice when it gets better
+EXPLORE_WEIGHT = 0.02
+
+
+class ServerHealth:
+    '''
+        What we've seen of one server. Times are in seconds.
+    '''
+    __slots__ = ('connect_time', 'rtt', 'failures', 'last_ok', 'last_fail',
+                    'tip_height', 'server_version')
+
+    FIELDS = __slots__
+
+    def __init__(self, **kws):
+        for fn in self.FIELDS:
+            setattr(self, fn, kws.get(fn))
+        self.failures = self.failures or 0
+
+    @staticmethod
+    def _avg(prev, value):
+        return value if prev is None else (1-EWMA_ALPHA)*prev + EWMA_ALPHA*value
+
+    def connected(self, elapsed, server_version=None):
+        # connect worked, including the server.version handshake
+        self.connect_time = self._avg(self.connect_time, elapsed)
+        self.failures = 0
+        self.last_ok = time.time()
+        if server_version:
+            self.server_version = server_version
+
+    def responded(self, elapsed):
+        # round trip of one request
+        self.rtt = self._avg(self.rtt, elapsed)
+        self.last_ok = time.time()
+
+    def failed(self):
+        self.failures += 1
+        self.last_fail = time.time()
+
+    def saw_tip(self, height):
+        self.tip_height = height
+
+    @property
+    def latency(self):
+        if self.rtt is not None:
+            return self.rtt
+        if self.connect_time is not None:
+            # about two round trips, or more with TLS
+            return self.connect_time / 2
+        return UNKNOWN_LATENCY
+
+    def weight(self, best_tip=None):
+        '''
+            How much we'd like to use this server, relative to others.
+        '''
+        w = 1.0 / (0.05 + self.latency)
+
+        if self.failures:
+            w *= 0.5 ** min(self.failures, 10)
+
+        if best_tip and self.tip_height is not None and self.tip_height < best_tip - STALE_BLOCKS:
+            w *= 0.1
+
+        return w
+
+    def to_dict(self):
+        return {fn: getattr(self, fn) for fn in self.FIELDS if getattr(self, fn) is not None}
+
+    def __repr__(self):
+        return '<ServerHealth rtt=%s connect=%s failures=%d tip=%s>' % (
+                    self.rtt, self.connect_time, self.failures, self.tip_height)
+
+
+def weighted_order(items, weights):
+    '''
+        Random order, where heavier items tend to come first (and lighter
+        ones still get a turn). Weights must be > 0.
+    '''
+    keyed = [(random.random() ** (1.0 / w), i) for i, w in zip(items, weights)]
+    keyed.sort(key=lambda kv: kv[0], reverse=True)
+    return [i for _, i in keyed]
+
+
+class HealthProber:
+    '''
+        Connect to servers in the background, a few at a time, and record
+        how they are doing in the KnownServers health data.
+
+            prober = HealthProber(known, proto_code='s')
+            await prober.probe_all()                # once
+            loop.create_task(prober.run(600))       # or, forever
+
+        Extra keywords go to StratumClient.connect() (ie. use_tor=True).
+    '''
+    def __init__(self, servers, proto_code='s', *, concurrency=20, timeout=10,
+                        is_onion=None, save_as=None, **connect_kws):
+        self.servers = servers              # a KnownServers instance
+        self.proto_code = proto_code
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.is_onion = is_onion
+        self.save_as = save_as              # call save_json() with this, after each round
+        self.connect_kws = connect_kws
+
+        self.probes = 0
+        self.failures = 0
+
+    async def probe(self, server_info):
+        '''
+            Connect, ask for the tip, hang up. Returns True if it all worked.
+        '''
+        from .client import StratumClient
+
+        health = self.servers.health_of(server_info)
+        client = StratumClient(metrics=False, auto_reconnect=False)
+        self.probes += 1
+        try:
+            t0 = time.monotonic()
+            await asyncio.wait_for(client.connect(server_info, self.proto_code,
+                                                    short_term=True, **self.connect_kws),
+                                    self.timeout)
+            health.connected(time.monotonic() - t0, client.server_version)
+
+            t0 = time.monotonic()
+            hdr = await asyncio.wait_for(client.RPC('blockchain.headers.subscribe'),
+                                            self.timeout)
+            health.responded(time.monotonic() - t0)
+            health.saw_tip(hdr['height'])
+
+        except Exception as exc:
+            logger.debug("Probe of %s failed: %r" % (server_info, exc))
+            health.failed()
+            self.failures += 1
+            return False
+
+        finally:
+            client.close()
+
+        return True
+
+    async def probe_all(self, servers=None):
+        '''
+            Probe all the servers (that we could use), at most `concurrency` at once.
+        '''
+        if servers is None:
+            servers = [s for s in self.servers.values()
+                            if s.select(self.proto_code, is_onion=self.is_onion)]
+
+        sem = asyncio.Semaphore(self.concurrency)
+
+        async def one(svr):
+            async with sem:
+                return await self.probe(svr)
+
+        results = await asyncio.gather(*[one(s) for s in servers])
+
+        if self.save_as:
+            self.servers.save_json(self.save_as)
+
+        return sum(results)
+
+    async def run(self, interval=600):
+        '''
+            Probe everything, every `interval` seconds (with some jitter), forever.
+        '''
+        while True:
+            ok = await self.probe_all()
+            logger.info("Probed servers: %d answered" % ok)
+            await asyncio.sleep(interval * random.uniform(0.8, 1.2))
+
+# EOF
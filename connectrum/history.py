@@ -0,0 +1,187 @@
+#
+# Keep the transaction history of scripthashes up to date, without refetching all of it.
+#
+import json, asyncio
+from hashlib import sha256
+import logging
+
+logger = logging.getLogger('connectrum')
+
+
+def status_hash(history):
+    '''
+        Electrum's "status" of a scripthash: sha256 over "tx_hash:height:" for each
+        item of its history, in order (as hex). None if there is no history.
+    '''
+    if not history:
+        return None
+    pre = ''.join('%s:%d:' % (tx_hash, height) for tx_hash, height in history)
+    return sha256(pre.encode('ascii')).hexdigest()
+
+
+class HistorySync:
+    '''
+        Local copy of the history of many scripthashes, as lists of (tx_hash, height).
+
+        The server only tells us a scripthash's status has changed. Rather than
+        fetch the whole history again, we guess it from what we have, plus the
+        mempool (get_mempool is small), and check the guess against the status.
+        That works when there are new unconfirmed transactions, or when
+        ours have been mined since. Anything else (a reorg, several blocks at
+        once) and we fetch the whole history, as before.
+
+        Keep it running with follow(), which takes the changes from a
+        ScripthashWatcher (see StratumClient.watch):
+
+            watcher = await client.watch(scripthashes)
+            async for sh, added, removed in hist.follow(watcher):
+                ...
+    '''
+    def __init__(self, client):
+        self.client = client
+        self.confirmed = {}         # scripthash => [(tx_hash, height)]
+        self.mempool = {}           # scripthash => [(tx_hash, height)]
+
+        self.full_fetches = 0
+        self.mempool_fetches = 0
+        self.unchanged = 0
+
+    def __len__(self):
+        return len(self.confirmed)
+
+    def history(self, sh):
+        # as the server would give it
+        return self.confirmed.get(sh, []) + self.mempool.get(sh, [])
+
+    def status(self, sh):
+        return status_hash(self.history(sh))
+
+    @staticmethod
+    def _items(rows):
+        return [(r['tx_hash'], r['height']) for r in rows]
+
+    def _store(self, sh, items):
+        # server puts unconfirmed (height 0, or -1) last
+        n = len(items)
+        while n and items[n-1][1] <= 0:
+            n -= 1
+
+        self.confirmed[sh] = items[:n]
+        self.mempool[sh] = items[n:]
+
+    async def _tip_height(self):
+        cache = self.client.cache
+        if cache is not None and cache.tip_height is not None:
+            return cache.tip_height
+
+        hdr = await self.client.RPC('blockchain.headers.subscribe')
+        return hdr['height']
+
+    async def _fetch_all(self, sh):
+        self.full_fetches += 1
+        items = self._items(await self.client.RPC('blockchain.scripthash.get_history', sh))
+        self._store(sh, items)
+
+    async def _try_mempool(self, sh, status):
+        # can we get to the new status with just the mempool?
+        self.mempool_fetches += 1
+        mempool = self._items(await self.client.RPC('blockchain.scripthash.get_mempool', sh))
+        confirmed = self.confirmed.get(sh, [])
+
+        if status_hash(confirmed + mempool) == status:
+            self.mempool[sh] = mempool
+            return True
+
+        # maybe our unconfirmed ones were mined (in the latest block)
+        now = set(tx_hash for tx_hash, _ in mempool)
+        mined = [tx_hash for tx_hash, _ in self.mempool.get(sh, []) if tx_hash not in now]
+        if not mined:
+            return False
+
+        tip = await self._tip_height()
+        confirmed = confirmed + [(tx_hash, tip) for tx_hash in mined]
+        if status_hash(confirmed + mempool) == status:
+            self.confirmed[sh] = confirmed
+            self.mempool[sh] = mempool
+            return True
+
+        return False
+
+    async def update(self, sh, status):
+        '''
+            Bring our copy up to date with the server's status for a scripthash.
+            Returns (added, removed): lists of (tx_hash, height) that changed.
+        '''
+        before = self.history(sh)
+
+        if sh in self.confirmed and status_hash(before) == status:
+            self.unchanged += 1
+            return [], []
+
+        if status is None:
+            # no history at all (anymore)
+            self.confirmed[sh] = []
+            self.mempool[sh] = []
+
+        elif sh not in self.confirmed or not await self._try_mempool(sh, status):
+            await self._fetch_all(sh)
+
+            if self.status(sh) != status:
+                # changed again while we were asking; another notification will follow
+                logger.debug("History of %s does not match its status (yet)" % sh)
+
+        after = self.history(sh)
+        old, new = set(before), set(after)
+        return [i for i in after if i not in old], [i for i in before if i not in new]
+
+    def forget(self, sh):
+        self.confirmed.pop(sh, None)
+        self.mempool.pop(sh, None)
+
+    async def sync(self, watcher, concurrency=50):
+        '''
+            Update every scripthash the watcher knows about whose status doesn't
+            match what we have (all of them, the first time).
+        '''
+        todo = [(sh, status) for sh, status in watcher.status.items()
+                        if status is not Ellipsis and (sh not in self.confirmed
+                                                        or self.status(sh) != status)]
+
+        for pos in range(0, len(todo), concurrency):
+            await asyncio.gather(*[self.update(sh, status)
+                                        for sh, status in todo[pos:pos+concurrency]])
+
+    async def follow(self, watcher):
+        '''
+            Async iterator of (scripthash, added, removed) as histories change,
+            forever. Catches up first, silently.
+        '''
+        await self.sync(watcher)
+
+        async for sh, status in watcher:
+            added, removed = await self.update(sh, status)
+            if added or removed:
+                yield sh, added, removed
+
+    def save_json(self, fname):
+        '''
+            Write our copy of the histories to a file, for next time.
+        '''
+        rows = {sh: self.history(sh) for sh in self.confirmed}
+        with open(fname, 'wt') as fp:
+            json.dump(rows, fp)
+
+    def from_json(self, fname):
+        '''
+            Read histories saved by save_json(); sync() will then only fetch
+            those that changed since.
+        '''
+        with open(fname, 'rt') as fp:
+            for sh, rows in json.load(fp).items():
+                self._store(sh, [tuple(i) for i in rows])
+
+    def stats(self):
+        return dict(scripthashes=len(self.confirmed), full_fetches=self.full_fetches,
+                        mempool_fetches=self.mempool_fetches, unchanged=self.unchanged)
+
+# EOF
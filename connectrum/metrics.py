@@ -0,0 +1,227 @@
+#
+# Count what the client does: requests, latency, errors, bytes and notifications.
+#
+import time
+from bisect import bisect_left
+
+# upper bounds of latency histogram buckets (seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    '''
+        Counts of values falling in each bucket (plus one for the rest), as Prometheus does.
+    '''
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # estimate, by interpolating inside the bucket
+        if not self.count:
+            return None
+
+        want = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, n in zip(self.bounds, self.counts):
+            if seen + n >= want and n:
+                return lower + (upper - lower) * (want - seen) / n
+            seen += n
+            lower = upper
+
+        return self.bounds[-1]
+
+    def snapshot(self):
+        return dict(count=self.count, sum=self.sum, buckets=list(self.counts),
+                        p50=self.quantile(0.5), p99=self.quantile(0.99))
+
+
+class RateCounter:
+    '''
+        Events per second, over the last `window` seconds.
+    '''
+    __slots__ = ('window', 'buckets', 'current', 'total')
+
+    def __init__(self, window=60):
+        self.window = window
+        self.buckets = {}       # whole second => count
+        self.current = None
+        self.total = 0
+
+    def add(self, n=1):
+        sec = int(time.monotonic())
+        if sec != self.current:
+            self.current = sec
+            self.buckets[sec] = 0
+            if len(self.buckets) > self.window:
+                for old in [s for s in self.buckets if s <= sec - self.window]:
+                    del self.buckets[old]
+
+        self.buckets[sec] += n
+        self.total += n
+
+    def rate(self):
+        since = int(time.monotonic()) - self.window
+        return sum(n for s, n in self.buckets.items() if s > since) / self.window
+
+
+class ClientMetrics:
+    '''
+        Everything we count for one StratumClient. Cheap enough to leave on:
+        a dict lookup and a few additions for each request.
+    '''
+    def __init__(self):
+        self.started = time.monotonic()
+
+        self.requests = {}          # method => count sent
+        self.errors = {}            # method => error responses
+        self.cancelled = {}         # method => gave up waiting
+        self.latency = {}           # method => Histogram
+
+        self.notifications = {}     # method => RateCounter
+
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.connects = 0
+
+        self.tls_handshakes = 0
+        self.tls_resumed = 0        # of those, how many resumed a session
+
+    def request_sent(self, method):
+        try:
+            self.requests[method] += 1
+        except KeyError:
+            self.requests[method] = 1
+            self.latency[method] = Histogram()
+
+    def request_done(self, method, elapsed, fut):
+        if fut.cancelled():
+            self.cancelled[method] = self.cancelled.get(method, 0) + 1
+            return
+
+        if fut.exception() is not None:
+            self.errors[method] = self.errors.get(method, 0) + 1
+
+        self.latency[method].observe(elapsed)
+
+    def notified(self, method):
+        rc = self.notifications.get(method)
+        if rc is None:
+            rc = self.notifications[method] = RateCounter()
+        rc.add()
+
+    def tls_handshake(self, resumed):
+        self.tls_handshakes += 1
+        if resumed:
+            self.tls_resumed += 1
+
+    @property
+    def reconnects(self):
+        return max(0, self.connects - 1)
+
+    @property
+    def tls_resume_rate(self):
+        return (self.tls_resumed / self.tls_handshakes) if self.tls_handshakes else None
+
+    def snapshot(self):
+        return dict(uptime=time.monotonic() - self.started,
+                    requests=dict(self.requests),
+                    errors=dict(self.errors),
+                    cancelled=dict(self.cancelled),
+                    latency={m: h.snapshot() for m, h in self.latency.items()},
+                    notifications={m: rc.total for m, rc in self.notifications.items()},
+                    notification_rate={m: rc.rate() for m, rc in self.notifications.items()},
+                    bytes_in=self.bytes_in,
+                    bytes_out=self.bytes_out,
+                    connects=self.connects,
+                    reconnects=self.reconnects,
+                    tls_handshakes=self.tls_handshakes,
+                    tls_resumed=self.tls_resumed,
+                    tls_resume_rate=self.tls_resume_rate)
+
+
+def _labels(base, **more):
+    labels = dict(base, **more)
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                                for k, v in sorted(labels.items())) + '}'
+
+def render_prometheus(clients, prefix='connectrum_'):
+    '''
+        Prometheus text format for one or more StratumClients (with metrics on).
+        Each is labeled with the server it's connected to.
+    '''
+    if not isinstance(clients, (list, tuple, set)):
+        clients = [clients]
+
+    out = {}        # metric name => (type, help, [lines])
+
+    def add(name, kind, help, labels, value, suffix=''):
+        name = prefix + name
+        if name not in out:
+            out[name] = (kind, help, [])
+        out[name][2].append('%s%s%s %s' % (name, suffix, labels, value))
+
+    for client in clients:
+        m = client.metrics
+        if m is None:
+            continue
+
+        conn = client.actual_connection
+        base = dict(server='%s:%s' % (conn['hostname'], conn['port'])) if conn else {}
+
+        for method, n in m.requests.items():
+            add('requests_total', 'counter', 'Requests sent', _labels(base, method=method), n)
+        for method, n in m.errors.items():
+            add('errors_total', 'counter', 'Error responses', _labels(base, method=method), n)
+        for method, n in m.cancelled.items():
+            add('cancelled_total', 'counter', 'Requests given up on', _labels(base, method=method), n)
+
+        for method, h in m.latency.items():
+            cum = 0
+            for le, n in zip(h.bounds + ('+Inf',), h.counts):
+                cum += n
+                add('request_duration_seconds', 'histogram', 'Time until response',
+                        _labels(base, method=method, le=le), cum, '_bucket')
+            add('request_duration_seconds', 'histogram', None, _labels(base, method=method),
+                        h.sum, '_sum')
+            add('request_duration_seconds', 'histogram', None, _labels(base, method=method),
+                        h.count, '_count')
+
+        for method, rc in m.notifications.items():
+            add('notifications_total', 'counter', 'Subscription notifications received',
+                    _labels(base, method=method), rc.total)
+
+        add('received_bytes_total', 'counter', 'Bytes received', _labels(base), m.bytes_in)
+        add('sent_bytes_total', 'counter', 'Bytes sent', _labels(base), m.bytes_out)
+        add('reconnects_total', 'counter', 'Connections made after the first', _labels(base), m.reconnects)
+        add('tls_handshakes_total', 'counter', 'TLS handshakes', _labels(base), m.tls_handshakes)
+        add('tls_resumed_total', 'counter', 'TLS handshakes that resumed a session', _labels(base),
+                m.tls_resumed)
+        add('inflight_requests', 'gauge', 'Requests waiting for a response', _labels(base),
+                len(client.inflight))
+        add('waiting_requests', 'gauge', 'Requests not yet sent, because of limits', _labels(base),
+                client.waiters)
+        add('write_buffer_bytes', 'gauge', 'Bytes not yet written to the socket', _labels(base),
+                client.write_buffer_size)
+
+    lines = []
+    for name, (kind, help, rows) in out.items():
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s %s' % (name, kind))
+        lines.extend(rows)
+
+    return '\n'.join(lines) + '\n'
+
+# EOF
@@ -0,0 +1,336 @@
+#
+# A pool of connections to several Electrum servers, used as if it were one.
+#
+import asyncio, time
+from functools import partial
+from collections import deque
+from .client import StratumClient, is_idempotent
+from .runtime import get_loop
+import logging
+
+logger = logging.getLogger('connectrum')
+
+# don't try a server that failed us again for this long (seconds)
+RETRY_DELAY = 5*60
+
+# hedge after this long, until we have enough samples to know better
+HEDGE_DELAY = 0.5
+HEDGE_MIN_SAMPLES = 20
+
+# read-only requests can be sent to a second server
+can_hedge = is_idempotent
+
+class StratumClientPool:
+    '''
+        Keep connections to a few different servers, picked from a KnownServers
+        list, and spread requests over them. Has the same RPC(), batch_rpc(),
+        RPC_stream() and subscribe() methods as StratumClient.
+
+        Each request goes to the connection with the fewest requests outstanding
+        (route='least_loaded'), or the lowest recent latency (route='fastest'),
+        with the other measure used to break ties.
+
+        Members that die are dropped, and replaced in the background. Servers
+        that failed are tried again after RETRY_DELAY. Requests made while
+        there are no members wait up to connect_timeout for one, then fail.
+        Subscriptions stay with the member they were made on.
+
+        To cut tail latency, set hedge_percentile (ie. 95): if a read-only
+        request takes longer than that percentile of recent response times,
+        it is sent again to another member. First answer wins, and the
+        other is cancelled. See hedge_counts for how that's working out.
+    '''
+    def __init__(self, servers, size=3, proto_code='s', *, loop=None,
+                        route='least_loaded', is_onion=None, min_prune=0,
+                        connect_timeout=15, hedge_percentile=None, **connect_kws):
+        assert route in ('least_loaded', 'fastest')
+
+        self.servers = servers              # a KnownServers instance
+        self.size = size
+        self.proto_code = proto_code
+        self.route = route
+        self.select_kws = dict(protocol=proto_code, is_onion=is_onion, min_prune=min_prune)
+        self.connect_timeout = connect_timeout
+        self.connect_kws = connect_kws      # passed to StratumClient.connect()
+
+        self.loop = get_loop(loop)
+
+        self.members = []
+        self.latency = {}       # member => EWMA of response time (seconds)
+        self.failed = {}        # hostname => time of last failure
+        self.connecting = set() # hostnames
+        self.closed = False
+
+        self.hedge_percentile = hedge_percentile
+        self.samples = deque(maxlen=500)    # recent response times
+        self._hedge_delay = None
+        self._new_samples = 0
+        self.hedge_counts = dict(requests=0, fired=0, won=0)
+        self._filler = None
+        self._refill = None     # timer, to try failed servers again
+        self._ready = asyncio.Event()
+
+    async def connect(self):
+        '''
+            Open connections until we have enough of them, or have run out of servers.
+            Fails if we could not connect to any.
+        '''
+        await self._fill()
+
+        if not self.members:
+            raise RuntimeError("Could not connect to any servers")
+
+        logger.debug("Pool connected to %d servers" % len(self.members))
+
+    def close(self):
+        self.closed = True
+        if self._filler:
+            self._filler.cancel()
+            self._filler = None
+        if self._refill:
+            self._refill.cancel()
+            self._refill = None
+
+        for m in self.members:
+            m.close()
+        self.members.clear()
+        self.latency.clear()
+        self._ready.clear()
+
+    def _candidates(self, count):
+        # servers we could connect to next
+        busy = set(str(m.server_info) for m in self.members) | self.connecting
+        too_soon = time.time() - RETRY_DELAY
+
+        rv = []
+        for svr in self.servers.select(**self.select_kws):
+            if str(svr) in busy or self.failed.get(str(svr), 0) > too_soon:
+                continue
+            rv.append(svr)
+            if len(rv) >= count:
+                break
+
+        return rv
+
+    def _next_retry(self):
+        # seconds until a server that failed can be tried again, or None
+        now = time.time()
+        waits = [self.failed[str(svr)] + RETRY_DELAY - now
+                    for svr in self.servers.select(**self.select_kws) if str(svr) in self.failed]
+        return max(min(waits), 1) if waits else None
+
+    async def _fill(self):
+        while len(self.members) < self.size and not self.closed:
+            cands = self._candidates(self.size - len(self.members))
+            if not cands:
+                retry = self._next_retry()
+                logger.warning("Pool has %d members and no more servers to try%s"
+                                    % (len(self.members),
+                                       (', for %d seconds' % retry) if retry else ''))
+                if retry:
+                    self._refill_later(retry)
+                break
+
+            await asyncio.gather(*[self._add_member(svr) for svr in cands])
+
+    def _refill_later(self, delay):
+        if self._refill:
+            self._refill.cancel()
+        self._refill = self.loop.call_later(delay, self._refill_now)
+
+    def _refill_now(self):
+        self._refill = None
+        if not self.closed and (not self._filler or self._filler.done()):
+            self._filler = self.loop.create_task(self._fill())
+
+    async def _add_member(self, server_info):
+        key = str(server_info)
+        self.connecting.add(key)
+
+        # we replace members that die, rather than have them reconnect
+        client = StratumClient(loop=self.loop, auto_reconnect=False)
+        health = self.servers.health_of(server_info)
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(client.connect(server_info, self.proto_code,
+                                                    disconnect_callback=self._member_lost,
+                                                    **self.connect_kws),
+                                    self.connect_timeout)
+        except Exception as exc:
+            logger.info("Pool failed to connect to %s: %r" % (key, exc))
+            self.failed[key] = time.time()
+            health.failed()
+            client.close()
+            return
+        finally:
+            self.connecting.discard(key)
+
+        health.connected(time.monotonic() - t0, client.server_version)
+
+        if self.closed:
+            client.close()
+            return
+
+        self.members.append(client)
+        self.latency[client] = None
+        self._ready.set()
+
+    def _member_lost(self, client):
+        if client not in self.members:
+            return
+
+        logger.warning("Pool lost connection to %s" % client.server_info)
+
+        self.members.remove(client)
+        self.latency.pop(client, None)
+        self.failed[str(client.server_info)] = time.time()
+        self.servers.health_of(client.server_info).failed()
+        client.close()
+
+        if not self.members:
+            self._ready.clear()
+
+        self._refill_now()
+
+    def _pick(self):
+        # which member should get the next request
+        if self.route == 'fastest':
+            key = lambda m: (self.latency[m] or 0, len(m.inflight))
+        else:
+            key = lambda m: (len(m.inflight), self.latency[m] or 0)
+
+        return min(self.members, key=key)
+
+    def _timed(self, member, t0, fut):
+        # track response times of each member
+        if fut.cancelled() or member not in self.latency:
+            return
+
+        dt = self.loop.time() - t0
+        prev = self.latency[member]
+        self.latency[member] = dt if prev is None else (0.8*prev + 0.2*dt)
+        self.servers.health_of(member.server_info).responded(dt)
+
+        self.samples.append(dt)
+        self._new_samples += 1
+        if self._new_samples >= 50:
+            # time to recalculate
+            self._new_samples = 0
+            self._hedge_delay = None
+
+    def hedge_delay(self):
+        '''
+            How long to wait before hedging a request (seconds).
+        '''
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DELAY
+
+        if self._hedge_delay is None:
+            ordered = sorted(self.samples)
+            idx = min(len(ordered)-1, int(len(ordered) * self.hedge_percentile / 100))
+            self._hedge_delay = ordered[idx]
+
+        return self._hedge_delay
+
+    def _send_timed(self, member, method, params):
+        t0 = self.loop.time()
+        fut = member.RPC(method, *params)
+        fut.add_done_callback(partial(self._timed, member, t0))
+        return fut
+
+    async def _hedged(self, method, params):
+        counts = self.hedge_counts
+        counts['requests'] += 1
+
+        first = self._pick()
+        orig = self._send_timed(first, method, params)
+        futs = [orig]
+
+        try:
+            done, _ = await asyncio.wait(futs, timeout=self.hedge_delay())
+            others = [m for m in self.members if m is not first]
+
+            if done or not others:
+                return await orig
+
+            # taking too long, ask someone else as well
+            counts['fired'] += 1
+            second = min(others, key=lambda m: (len(m.inflight), self.latency[m] or 0))
+            futs.append(self._send_timed(second, method, params))
+
+            pending = futs
+            while 1:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = orig if orig in done else done.pop()
+
+                if winner.exception() is None or not pending:
+                    break
+
+                # failed, but the other one may still work out
+
+            if winner is not orig and winner.exception() is None:
+                counts['won'] += 1
+
+            return winner.result()
+
+        finally:
+            # cancel the loser, which removes it from that client's inflight too
+            for f in futs:
+                if not f.done():
+                    f.cancel()
+
+    def _dispatch(self, fn, timed=False):
+        # call fn(member) on the best member, now or when we have one; timed
+        # for single requests, so their response times count for the member
+        if self.members:
+            member = self._pick()
+            t0 = self.loop.time()
+            rv = fn(member)
+            if timed:
+                rv.add_done_callback(partial(self._timed, member, t0))
+            return rv
+
+        async def later():
+            try:
+                await asyncio.wait_for(self._ready.wait(), self.connect_timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError("No servers connected") from None
+            return await self._dispatch(fn, timed)
+
+        return self.loop.create_task(later())
+
+    def RPC(self, method, *params):
+        '''
+            Same as StratumClient.RPC(), on the best connection.
+        '''
+        if self.hedge_percentile and len(self.members) > 1 and can_hedge(method):
+            return self.loop.create_task(self._hedged(method, params))
+
+        return self._dispatch(lambda m: m.RPC(method, *params), timed=True)
+
+    def batch_rpc(self, requests, **kws):
+        '''
+            Same as StratumClient.batch_rpc(), all requests go to one connection.
+        '''
+        return self._dispatch(lambda m: m.batch_rpc(requests, **kws))
+
+    def batch_rpc_iter(self, requests, **kws):
+        if not self.members:
+            raise RuntimeError("No servers connected")
+        return self._pick().batch_rpc_iter(requests, **kws)
+
+    def RPC_stream(self, method, *params):
+        if not self.members:
+            raise RuntimeError("No servers connected")
+        return self._pick().RPC_stream(method, *params)
+
+    def subscribe(self, method, *params, **kws):
+        '''
+            Same as StratumClient.subscribe(). The subscription is made on
+            one connection, and ends if that connection does.
+        '''
+        if not self.members:
+            raise RuntimeError("No servers connected")
+        return self._pick().subscribe(method, *params, **kws)
+
+# EOF
@@ -2,8 +2,12 @@
 # Implement an asyncio.Protocol for Electrum (clients)
 #
 #
-import asyncio, json
+import asyncio
 import logging
+from .framing import LineFramer, DEFAULT_MAX_FRAME
+from .codec import get_codec
+from .stream import ItemDecoder, STREAM_HEAD, STREAM_HEAD_SIZE
+from .exc import FrameTooLarge
 
 logger = logging.getLogger('connectrum')
 
@@ -11,7 +15,16 @@ class StratumProtocol(asyncio.Protocol):
     client = None
     closed = False
     transport = None
-    buf = b""
+    write_paused = False
+
+    def __init__(self, max_frame=DEFAULT_MAX_FRAME, codec=None, metrics=None):
+        self.framer = LineFramer(max_frame)
+        self.codec = get_codec(codec)
+        self.metrics = metrics
+
+        # when streaming a list result, this is decoding the current message
+        self.stream_decoder = None
+        self.head_checked = False
 
     def connection_made(self, transport):
         self.transport = transport
@@ -23,43 +36,114 @@ class StratumProtocol(asyncio.Protocol):
             self.close()
             self.client._connection_lost(self)
 
+    def pause_writing(self):
+        # transport's buffer is full; client should hold further requests
+        logger.debug("Transport write buffer full")
+        self.write_paused = True
+
+    def resume_writing(self):
+        self.write_paused = False
+        if self.client:
+            self.client._pump()
+
+    @property
+    def write_buffer_size(self):
+        # bytes written, but not yet sent
+        if not self.transport or self.closed:
+            return 0
+        return self.transport.get_write_buffer_size()
+
     def data_received(self, data):
-        self.buf += data
+        if self.metrics:
+            self.metrics.bytes_in += len(data)
 
-        # Unframe the mesage. Expecting JSON.
-        *lines, self.buf = self.buf.split(b'\n')
+        if self.stream_decoder:
+            data = self._stream_data(data)
+            if not data: return
 
-        for line in lines:
-            if not line: continue
+        # Unframe the mesage(s). Expecting JSON.
+        try:
+            lines = self.framer.feed(data)
+        except FrameTooLarge as exc:
+            logger.error("Server sent an oversized message (%d bytes)" % exc.args[0])
+            self.connection_lost(exc)
+            return
 
-            try:
-                msg = line.decode('utf-8', "error").strip()
-            except UnicodeError as exc:
-                logger.exception("Encoding issue on %r" % line)
-                self.connection_lost(exc)
-                return
+        if lines:
+            # we're into a new message now
+            self.head_checked = False
 
+        decode = self.codec.decode
+
+        for line in lines:
             try:
-                msg = json.loads(msg)
+                msg = decode(line)
             except ValueError as exc:
-                logger.exception("Bad JSON received from server: %r" % msg)
+                # includes UnicodeError
+                logger.exception("Bad JSON received from server: %r" % bytes(line))
                 self.connection_lost(exc)
                 return
 
-            #logger.debug("RX:\n%s", json.dumps(msg, indent=2))
-
             try:
                 self.client._got_response(msg)
             except Exception as e:
                 logger.exception("Trouble handling response! (%s)" % e)
                 continue
 
+        if (not self.head_checked and self.client.streams
+                and self.framer.pending >= STREAM_HEAD_SIZE):
+            self._check_stream_head()
+
+    def _check_stream_head(self):
+        # A large message is arriving. If it's the response to a streamed
+        # request, take over and decode the list items as they arrive.
+        self.head_checked = True
+
+        fr = self.framer
+        m = STREAM_HEAD.match(fr.buf, fr.start, fr.start + STREAM_HEAD_SIZE)
+        if not m:
+            return
+
+        # when the server puts the id last, we can only be sure who it's for
+        # if there is nothing else outstanding
+        req_id = int(m.group(1)) if m.group(1) else self.client._sole_request()
+        if req_id not in self.client.streams:
+            return
+
+        tail = fr.take_pending()
+        self.stream_decoder = ItemDecoder(req_id, self.codec, fr.max_frame)
+        self._stream_data(tail[m.end() - m.start():])
+
+    def _stream_data(self, data):
+        # feed the stream decoder; returns bytes following the message, if it's done
+        dec = self.stream_decoder
+        try:
+            items, leftover = dec.feed(data)
+        except ValueError as exc:
+            logger.exception("Bad JSON received from server in list result")
+            self.stream_decoder = None
+            self.connection_lost(exc)
+            return None
+
+        if items:
+            self.client._stream_items(dec.req_id, items)
+
+        if leftover is None:
+            return None
+
+        self.stream_decoder = None
+        self.head_checked = False           # next message hasn't been looked at
+        self.client._stream_done(dec.req_id, dec.trailer_id)
+
+        return leftover
+
     def send_data(self, message):
         '''
             Given an object, encode as JSON and transmit to the server.
         '''
-        #logger.debug("TX:\n%s", json.dumps(message, indent=2))
-        data = json.dumps(message).encode('utf-8') + b'\n'
+        data = self.codec.encode(message) + b'\n'
+        if self.metrics:
+            self.metrics.bytes_out += len(data)
         self.transport.write(data)
 
     def close(self):
@@ -0,0 +1,181 @@
+#
+# Look up server addresses (remembering them for a while), and connect to
+# the first address that answers, trying IPv6 and IPv4 in turn.
+#
+import asyncio, socket, time
+import logging
+from .runtime import get_loop
+
+logger = logging.getLogger('connectrum')
+
+# getaddrinfo doesn't tell us the real TTL, so use these (seconds)
+DNS_TTL = 300
+DNS_FAILED_TTL = 15
+
+# start the next address if the last hasn't connected in this long (RFC 8305)
+HAPPY_EYEBALLS_DELAY = 0.25
+
+
+def interleave(infos):
+    # alternate address families, starting with the one the resolver put first
+    by_family = {}
+    for info in infos:
+        by_family.setdefault(info[0], []).append(info)
+
+    groups = list(by_family.values())
+    rv = []
+    while groups:
+        for g in groups:
+            rv.append(g.pop(0))
+        groups = [g for g in groups if g]
+
+    return rv
+
+async def _attempt(loop, info):
+    family, type_, proto, _, addr = info
+    sock = socket.socket(family, type_, proto)
+    try:
+        sock.setblocking(False)
+        await loop.sock_connect(sock, addr)
+    except BaseException:
+        # includes being cancelled, because another one won
+        sock.close()
+        raise
+
+    return sock, addr
+
+async def race_connect(infos, delay=HAPPY_EYEBALLS_DELAY, loop=None):
+    '''
+        Connect to one of the addresses (from getaddrinfo). Starts with
+        the first, and if it hasn't connected after `delay` seconds (or has
+        failed), starts the next as well, and so on. First to connect wins, the
+        others are stopped. With delay=None, tries them one at a time.
+
+        Returns (socket, address).
+    '''
+    loop = get_loop(loop)
+    todo = list(infos)
+    pending = set()
+    errors = []
+
+    try:
+        while todo or pending:
+            if todo:
+                pending.add(loop.create_task(_attempt(loop, todo.pop(0))))
+
+            wait = delay if (todo and delay is not None) else None
+            done, pending = await asyncio.wait(pending, timeout=wait,
+                                                    return_when=asyncio.FIRST_COMPLETED)
+
+            winner = None
+            for t in done:
+                if t.exception() is not None:
+                    errors.append(t.exception())
+                elif winner is None:
+                    winner = t.result()
+                else:
+                    # a tie; don't need this one
+                    t.result()[0].close()
+
+            if winner:
+                return winner
+    finally:
+        for t in pending:
+            if t.done() and not t.cancelled() and t.exception() is None:
+                # connected just as we gave up
+                t.result()[0].close()
+            t.cancel()
+
+    if len(errors) == 1:
+        raise errors[0]
+    raise OSError('All connection attempts failed: %s' % ', '.join(str(e) for e in errors))
+
+
+class Resolver:
+    '''
+        DNS lookups, remembered for `ttl` seconds (failures for `failed_ttl`).
+        Lookups for the same name at the same time are done once.
+        One of these is shared by all StratumClients unless you give them another.
+    '''
+    def __init__(self, ttl=DNS_TTL, failed_ttl=DNS_FAILED_TTL):
+        self.ttl = ttl
+        self.failed_ttl = failed_ttl
+        self.cache = {}             # (host, port) => (expires, infos or exception)
+        self.lookups = {}           # (host, port) => future, while resolving
+        self.winners = {}           # (host, port) => address that connected last time
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, host, port):
+        '''
+            List of (family, type, proto, canonname, sockaddr), like getaddrinfo.
+        '''
+        key = (host, port)
+        entry = self.cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            if isinstance(entry[1], Exception):
+                raise entry[1]
+            return entry[1]
+
+        fut = self.lookups.get(key)
+        if fut is not None:
+            # someone is already asking
+            self.hits += 1
+            return await asyncio.shield(fut)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        fut = self.lookups[key] = loop.create_future()
+        try:
+            infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError as exc:
+            self.cache[key] = (time.monotonic() + self.failed_ttl, exc)
+            fut.set_exception(exc)
+            fut.exception()     # we raise it ourselves; don't warn if no-one else was waiting
+            raise
+        except BaseException:
+            fut.cancel()
+            raise
+        finally:
+            self.lookups.pop(key, None)
+
+        self.cache[key] = (time.monotonic() + self.ttl, infos)
+        fut.set_result(infos)
+
+        return infos
+
+    def forget(self, host, port):
+        self.cache.pop((host, port), None)
+        self.winners.pop((host, port), None)
+
+    async def connect(self, host, port, delay=HAPPY_EYEBALLS_DELAY):
+        '''
+            Resolve (maybe from the cache) and connect, racing the addresses.
+            The one that worked last time goes first. Returns (socket, address).
+        '''
+        key = (host, port)
+        infos = interleave(await self.resolve(host, port))
+
+        last = self.winners.get(key)
+        if last is not None:
+            infos.sort(key=lambda info: info[4] != last)
+
+        try:
+            sock, addr = await race_connect(infos, delay)
+        except OSError:
+            # maybe the addresses have changed; look again next time
+            self.forget(host, port)
+            raise
+
+        self.winners[key] = addr
+        return sock, addr
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, cached=len(self.cache))
+
+
+# shared by all clients, unless told otherwise
+default_resolver = Resolver()
+
+# EOF
@@ -0,0 +1,82 @@
+#
+# Which event loop we run on: the one that's running, whatever the policy
+# made it (asyncio's own, uvloop, ...), and helpers to pick uvloop if it's there.
+#
+import asyncio
+from importlib import util as importutil
+
+# Runtime check for optional modules
+have_uvloop = (importutil.find_spec("uvloop") is not None)
+
+
+def get_loop(loop=None):
+    '''
+        The loop to use: the one given, else the running loop, else the
+        current policy's loop for this thread (when set up outside a coroutine).
+    '''
+    if loop is not None:
+        return loop
+
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.get_event_loop_policy().get_event_loop()
+
+def loop_name(loop=None):
+    '''
+        Short name for the kind of loop, like 'asyncio' or 'uvloop'.
+    '''
+    loop = get_loop(loop)
+    return type(loop).__module__.split('.')[0]
+
+def use_uvloop():
+    '''
+        Make uvloop the event loop policy, if it's installed. Do this early,
+        before making any loops. Returns True if it did.
+    '''
+    if not have_uvloop:
+        return False
+
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+def new_event_loop(kind=None):
+    '''
+        A new loop: kind='uvloop' or 'asyncio', or None for whatever
+        the current policy makes.
+    '''
+    if kind == 'uvloop':
+        if not have_uvloop:
+            raise RuntimeError("uvloop is not installed")
+        import uvloop
+        return uvloop.new_event_loop()
+    elif kind == 'asyncio':
+        return asyncio.DefaultEventLoopPolicy().new_event_loop()
+    elif kind is None:
+        return asyncio.new_event_loop()
+
+    raise ValueError(kind)
+
+def run(main, kind=None, debug=False):
+    '''
+        Like asyncio.run(), but on the kind of loop you choose (see new_event_loop).
+    '''
+    loop = new_event_loop(kind)
+    try:
+        asyncio.set_event_loop(loop)
+        loop.set_debug(debug)
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            # stop whatever was left running, like asyncio.run() does
+            left = asyncio.all_tasks(loop)
+            for t in left:
+                t.cancel()
+            loop.run_until_complete(asyncio.gather(*left, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+# EOF
@@ -0,0 +1,183 @@
+#
+# Streaming of long list results (get_history, listunspent) item by item,
+# decoded as the bytes arrive rather than after the whole response is here.
+#
+import re, asyncio
+from collections import deque
+from .exc import FrameTooLarge
+
+# Start of a response whose result is a list, such as:
+#   {"jsonrpc":"2.0","result":[
+#   {"id":12,"jsonrpc":"2.0","result":[
+STREAM_HEAD = re.compile(rb'\s*\{\s*(?:"jsonrpc"\s*:\s*"2\.0"\s*,\s*)?'
+                         rb'(?:"id"\s*:\s*(\d+)\s*,\s*)?'
+                         rb'(?:"jsonrpc"\s*:\s*"2\.0"\s*,\s*)?'
+                         rb'"result"\s*:\s*\[')
+
+# need this much of a message before we decide if it's to be streamed
+STREAM_HEAD_SIZE = 256
+
+# decode items in batches at least this big (bytes)
+MIN_BATCH = 16 * 1024
+
+
+class ItemDecoder:
+    '''
+        Incremental decoder for the items of a JSON list result. Give it the
+        bytes following the opening bracket, in pieces of any size.
+
+        We cut the text we have at a comma, and try to decode everything before
+        it as a list. That only works if the cut is between two items of the
+        top-level list: anywhere else leaves a string or bracket unclosed. So a
+        few tries, starting from the end, finds a batch of complete items,
+        and the codec does all the real work.
+
+        At the end of the line, the remainder is decoded along with the rest
+        of the message, and we give back whatever follows it.
+    '''
+    def __init__(self, req_id, codec, max_item, min_batch=MIN_BATCH):
+        self.req_id = req_id
+        self.codec = codec
+        self.max_item = max_item
+        self.min_batch = min_batch
+        self.buf = bytearray()
+        self.trailer_id = None
+
+    def feed(self, data):
+        '''
+            Returns (items, leftover). Leftover is None until the whole
+            message has been consumed.
+        '''
+        buf = self.buf
+        searched = len(buf)
+        buf += data
+
+        nl = buf.find(b'\n', searched)
+        if nl >= 0:
+            # last part, plus the rest of the message
+            msg = self.codec.decode(b'{"result":[' + buf[:nl])
+            self.trailer_id = msg.get('id')
+
+            return msg['result'], bytes(buf[nl+1:])
+
+        items = []
+        if len(buf) >= self.min_batch:
+            cut = len(buf)
+            for _ in range(4):
+                cut = buf.rfind(b',', 0, cut)
+                if cut <= 0:
+                    break
+
+                try:
+                    items = self.codec.decode(b'[' + buf[:cut] + b']')
+                except ValueError:
+                    continue
+
+                del buf[:cut+1]
+                break
+
+        if len(buf) > self.max_item:
+            raise FrameTooLarge(len(buf))
+
+        return items, None
+
+
+class RPCStream:
+    '''
+        Async iterator over the items of a list result, yielding each one
+        as soon as it is decoded. See StratumClient.RPC_stream()
+
+        If the server is too quick for us, we stop reading from the
+        socket until the consumer catches up.
+    '''
+    def __init__(self, client, req_id, fut, high_water=10000):
+        self.client = client
+        self.req_id = req_id
+        self.fut = fut
+        self.high_water = high_water
+
+        self.items = deque()
+        self.streamed = False       # true if we got items incrementally
+        self.finished = False
+        self.error = None
+        self.paused = None          # transport we paused
+        self._wakeup = None
+
+        fut.add_done_callback(self._fut_done)
+
+    def _wake(self):
+        if self._wakeup and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def _fut_done(self, fut):
+        # request is over: either streamed already, or result is the whole list
+        if fut.cancelled():
+            self.error = asyncio.CancelledError()
+        elif fut.exception():
+            self.error = fut.exception()
+        elif not self.streamed:
+            result = fut.result()
+            if isinstance(result, list):
+                self.items.extend(result)
+            elif result is not None:
+                self.items.append(result)
+
+        self.finished = True
+        self.client.streams.pop(self.req_id, None)
+        self._wake()
+
+    def _feed(self, items):
+        # more items decoded off the wire
+        self.streamed = True
+        self.items.extend(items)
+        self._wake()
+
+        if len(self.items) >= self.high_water and not self.paused:
+            proto = self.client.protocol
+            if proto and proto.transport:
+                self.paused = proto.transport
+                self.paused.pause_reading()
+
+    def _resume(self):
+        if self.paused:
+            if not self.paused.is_closing():
+                self.paused.resume_reading()
+            self.paused = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.items:
+            if self.finished:
+                self._resume()
+                if self.error:
+                    err, self.error = self.error, None
+                    raise err
+                raise StopAsyncIteration
+
+            self._wakeup = self.client.loop.create_future()
+            await self._wakeup
+            self._wakeup = None
+
+        rv = self.items.popleft()
+
+        if self.paused and len(self.items) <= self.high_water // 2:
+            self._resume()
+
+        return rv
+
+    def close(self):
+        '''
+            Stop listening; remaining items will be discarded.
+        '''
+        self.client.streams.pop(self.req_id, None)
+        self.items.clear()
+        self._resume()
+        if not self.fut.done():
+            self.fut.cancel()
+
+    async def aclose(self):
+        self.close()
+
+# EOF
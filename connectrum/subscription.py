@@ -0,0 +1,142 @@
+#
+# Deliver notifications from the server to whoever subscribed to them.
+#
+import asyncio
+from collections import deque
+
+# Notifications for these methods name what they are about in their first
+# param, so we can route them to just the subscribers for that scripthash.
+KEYED_METHODS = {
+    'blockchain.scripthash.subscribe',
+}
+
+# only the most recent one matters
+LATEST_ONLY = {
+    'blockchain.headers.subscribe',
+}
+
+def subscription_key(method, params):
+    # what a subscription, or a notification, is about: (method, scripthash) or (method, None)
+    if method in KEYED_METHODS and params:
+        return (method, params[0])
+    return (method, None)
+
+
+class Subscription:
+    '''
+        Notifications for one subscription, as an async iterator:
+
+            async for params in sub:
+                ...
+
+        It's also enough like an asyncio.Queue (get, get_nowait, qsize, empty)
+        that code written for the old queues still works.
+
+        At most maxsize notifications are buffered. When full, overflow is either
+        'drop_oldest' (the default), or 'latest', which keeps only the newest
+        one and is the default for blockchain.headers.subscribe.
+    '''
+    def __init__(self, client, key, maxsize=1000, overflow=None):
+        self.client = client
+        self.key = key
+        self.maxsize = max(1, maxsize)
+        self.overflow = overflow or ('latest' if key[0] in LATEST_ONLY else 'drop_oldest')
+        if self.overflow not in ('drop_oldest', 'latest'):
+            raise ValueError("Unknown overflow policy: %r" % self.overflow)
+
+        self.items = deque()
+        self.dropped = 0
+        self.closed = False
+        self._getters = deque()     # futures of those waiting in get(), like asyncio.Queue
+
+        # what to subscribe with again, after a reconnect (None if just listening)
+        self.params = None
+
+    @property
+    def method(self):
+        return self.key[0]
+
+    def _put(self, params):
+        # notification arrived; never blocks
+        if self.overflow == 'latest':
+            self.dropped += len(self.items)
+            self.items.clear()
+        elif len(self.items) >= self.maxsize:
+            self.items.popleft()
+            self.dropped += 1
+
+        self.items.append(params)
+        self._wake_next()
+
+    def _wake_next(self):
+        # one item for one waiter
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                break
+
+    def qsize(self):
+        return len(self.items)
+
+    def empty(self):
+        return not self.items
+
+    def full(self):
+        return len(self.items) >= self.maxsize
+
+    def get_nowait(self):
+        if not self.items:
+            raise asyncio.QueueEmpty
+        return self.items.popleft()
+
+    async def get(self):
+        while not self.items:
+            if self.closed:
+                raise asyncio.CancelledError
+            getter = self.client.loop.create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except BaseException:
+                getter.cancel()
+                try:
+                    self._getters.remove(getter)
+                except ValueError:
+                    pass
+                if self.items and not getter.cancelled():
+                    # we were woken for an item, but won't take it; pass it on
+                    self._wake_next()
+                raise
+
+        return self.items.popleft()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and not self.items:
+            raise StopAsyncIteration
+        try:
+            return await self.get()
+        except asyncio.CancelledError:
+            if self.closed:
+                raise StopAsyncIteration
+            raise
+
+    def close(self):
+        '''
+            Stop delivering notifications here. The server isn't told.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        self.client._drop_subscription(self)
+
+        while self._getters:
+            self._getters.popleft().cancel()
+
+    async def aclose(self):
+        self.close()
+
+# EOF
@@ -11,28 +11,86 @@ if importutil.find_spec("bottom") is not None:
 else:
     have_bottom = False
 
-import time, random, json
+import time, random, json, os, sys
+from collections.abc import MutableMapping
 from .constants import DEFAULT_PORTS
+from .health import ServerHealth, weighted_order, EXPLORE_WEIGHT
 
 
-class ServerInfo(dict):
+# parsed ports lists, shared between servers; there are only a few different ones
+_PORTS_SEEN = {}
+
+def _split_ports(ports):
+    # => (ports, (protocol, port number or None) for each, set of protocols,
+    #       version, pruning limit), the last two None unless given in the list
+    ports = tuple(ports.split() if isinstance(ports, str) else ports)
+    try:
+        return _PORTS_SEEN[ports]
+    except KeyError:
+        pass
+
+    raw = ports
+    version = pruning_limit = None
+    pairs = []
+    for p in raw:
+        # check we don't have junk in the ports list
+        if p[0] == 'v':
+            version = p[1:]
+            continue
+        if p[0] == 'p':
+            try:
+                pruning_limit = int(p[1:])
+            except ValueError:
+                # ignore junk
+                pass
+            continue
+
+        port = None
+        if len(p) >= 2:
+            try:
+                port = int(p[1:])
+            except ValueError:
+                pass
+        pairs.append((p[0], port))
+
+    ports = tuple(p for p in raw if p[0] not in 'vp')
+    rv = (ports, tuple(pairs), frozenset(code for code, _ in pairs), version, pruning_limit)
+    if len(_PORTS_SEEN) < 10000:
+        _PORTS_SEEN[raw] = rv
+
+    return rv
+
+
+class ServerInfo(MutableMapping):
     '''
         Information to be stored on a server. Originally based on IRC data published to a channel.
 
+        Works like the dict it used to be (same keys, and anything else you
+        care to store), but the usual fields live in slots, and the ports list is
+        parsed once, when set (and is a tuple now). Use to_dict() where you need
+        a real dict, such as for JSON.
     '''
     FIELDS = ['nickname', 'hostname', 'ports', 'version', 'pruning_limit' ]
 
+    # keys kept in slots (named with an underscore), in the order we've always written them out
+    SLOT_KEYS = {k: '_' + k for k in ('nickname', 'hostname', 'ip_addr', 'ports',
+                                            'version', 'pruning_limit', 'seen_at')}
+
+    __slots__ = tuple(SLOT_KEYS.values()) + ('extra', 'protocols', 'is_onion', '_port_list')
+
     def __init__(self, nickname_or_dict, hostname=None, ports=None,
                         version=None, pruning_limit=None, ip_addr=None):
+        self.extra = None
 
         if not hostname and not ports:
             # promote a dict, or similar
-            super(ServerInfo, self).__init__(nickname_or_dict)
+            self.update(nickname_or_dict)
             return
 
-        self['nickname'] = nickname_or_dict or None
-        self['hostname'] = hostname
-        self['ip_addr'] = ip_addr or None
+        self._nickname = nickname_or_dict or None
+        self._hostname = hostname
+        self.is_onion = hostname.lower().endswith('.onion')
+        self._ip_addr = ip_addr or None
 
         # For 'ports', take
         # - a number (int), assumed to be TCP port, OR
@@ -42,27 +100,106 @@ class ServerInfo(dict):
         #
         if isinstance(ports, int):
             ports = ['t%d' % ports]
-        elif isinstance(ports, str):
-            ports = ports.split()
 
-        # check we don't have junk in the ports list
-        for p in ports.copy():
-            if p[0] == 'v':
-                version = p[1:]
-                ports.remove(p)
-            elif p[0] == 'p':
-                try:
-                    pruning_limit = int(p[1:])
-                except ValueError:
-                    # ignore junk
-                    pass
-                ports.remove(p)
+        ports, self._port_list, self.protocols, v, p = _split_ports(ports)
+        if v is not None:
+            version = v
+        if p is not None:
+            pruning_limit = p
 
         assert ports, "Must have at least one port/protocol"
 
-        self['ports'] = ports
-        self['version'] = version
-        self['pruning_limit'] = int(pruning_limit or 0)
+        self._ports = ports
+        self._version = sys.intern(version) if isinstance(version, str) else version
+        self._pruning_limit = int(pruning_limit or 0)
+
+    # -- mapping interface --
+
+    def __getitem__(self, key):
+        slot = self.SLOT_KEYS.get(key)
+        if slot:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(key)
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        slot = self.SLOT_KEYS.get(key)
+        if not slot:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+            return
+
+        if key == 'ports':
+            value, self._port_list, self.protocols, _, _ = _split_ports(value)
+        elif key == 'hostname':
+            self.is_onion = value.lower().endswith('.onion')
+        elif key == 'version' and isinstance(value, str):
+            # only a few different ones
+            value = sys.intern(value)
+
+        setattr(self, slot, value)
+
+    def __delitem__(self, key):
+        slot = self.SLOT_KEYS.get(key)
+        if slot:
+            try:
+                delattr(self, slot)
+            except AttributeError:
+                raise KeyError(key)
+        elif self.extra is None:
+            raise KeyError(key)
+        else:
+            del self.extra[key]
+
+    def __iter__(self):
+        for key, slot in self.SLOT_KEYS.items():
+            if hasattr(self, slot):
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        slot = self.SLOT_KEYS.get(key)
+        if slot:
+            return hasattr(self, slot)
+        return self.extra is not None and key in self.extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        rv = {}
+        for key, slot in self.SLOT_KEYS.items():
+            try:
+                rv[key] = getattr(self, slot)
+            except AttributeError:
+                pass
+        if 'ports' in rv:
+            rv['ports'] = list(rv['ports'])
+        if self.extra:
+            rv.update(self.extra)
+        return rv
+
+    def copy(self):
+        return ServerInfo(self.to_dict())
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.extra = None
+        self.update(state)
 
     @classmethod
     def from_response(cls, response_list):
@@ -92,25 +229,19 @@ class ServerInfo(dict):
         n = d.pop('nickname', None)
         h = d.pop('hostname')
         p = d.pop('ports')
-        rv = cls(n, h, p)
-        rv.update(d)
-        return rv
-
-
-    @property
-    def protocols(self):
-        rv = set(i[0] for i in self['ports'])
-        assert 'p' not in rv, 'pruning limit got in there'
-        assert 'v' not in rv, 'version got in there'
+        rv = cls(n, h, p, version=d.pop('version', None),
+                    pruning_limit=d.pop('pruning_limit', None), ip_addr=d.pop('ip_addr', None))
+        for key, value in d.items():
+            rv[key] = value
         return rv
 
     @property
     def pruning_limit(self):
-        return self.get('pruning_limit', 100)
+        return getattr(self, '_pruning_limit', 100)
 
     @property
     def hostname(self):
-        return self.get('hostname')
+        return getattr(self, '_hostname', None)
 
     def get_port(self, for_protocol):
         '''
@@ -123,22 +254,11 @@ class ServerInfo(dict):
 
         if 'port' in self: return self['hostname'], int(self['port']), use_ssl
 
-        rv = next(i for i in self['ports'] if i[0] == for_protocol)
-
-        port = None
-        if len(rv) >= 2:
-            try:
-                port = int(rv[1:])
-            except:
-                pass
+        port = next(port for code, port in self._port_list if code == for_protocol)
         port = port or DEFAULT_PORTS[for_protocol]
 
         return self['hostname'], port, use_ssl
 
-    @property
-    def is_onion(self):
-        return self['hostname'].lower().endswith('.onion')
-
     def select(self, protocol='s', is_onion=None, min_prune=0):
         # predicate function for selection based on features/properties
         return ((protocol in self.protocols)
@@ -151,11 +271,11 @@ class ServerInfo(dict):
 
     def __str__(self):
         # used as a dict key in a few places.
-        return self['hostname'].lower()
+        return self._hostname.lower()
 
     def __hash__(self):
         # this one-line allows use as a set member, which is really handy!
-        return hash(self['hostname'].lower())
+        return hash(self._hostname.lower())
 
 class KnownServers(dict):
     '''
@@ -166,7 +286,113 @@ class KnownServers(dict):
         - can read from IRC channel to find current hosts
 
         We are a dictionary, with key being the hostname (in lowercase) of the server.
+        We keep indexes by protocol, .onion-ness and pruning limit, so select() is
+        quick on big lists; if you change a ServerInfo in place, store it again.
+
+        We also keep health data for each server (see health.py): how fast it
+        connects and answers, failures, and its tip height. select() favours
+        the servers that are doing well.
     '''
+    def __init__(self, *args, **kws):
+        super(KnownServers, self).__init__()
+        self.health = {}            # hostname (lowercase) => ServerHealth
+
+        # built when first needed, then kept up to date
+        self.indexed = False
+        self.by_protocol = {}       # protocol code => set of hostnames
+        self.by_pruning = {}        # pruning limit => set of hostnames
+        self.onions = set()         # hostnames
+
+        self.update(*args, **kws)
+
+    # -- keep the indexes up to date --
+
+    def _reindex(self):
+        self.by_protocol.clear()
+        self.by_pruning.clear()
+        self.onions.clear()
+        for key, svr in self.items():
+            self._index(key, svr)
+        self.indexed = True
+
+    def _index(self, key, svr):
+        by_protocol = self.by_protocol
+        for code in svr.protocols:
+            try:
+                by_protocol[code].add(key)
+            except KeyError:
+                by_protocol[code] = {key}
+
+        limit = svr.pruning_limit
+        try:
+            self.by_pruning[limit].add(key)
+        except KeyError:
+            self.by_pruning[limit] = {key}
+
+        if svr.is_onion:
+            self.onions.add(key)
+
+    def _unindex(self, key, svr):
+        for code in svr.protocols:
+            self.by_protocol[code].discard(key)
+        self.by_pruning[svr.pruning_limit].discard(key)
+        self.onions.discard(key)
+
+    def __setitem__(self, key, svr):
+        if self.indexed:
+            if key in self:
+                self._unindex(key, self[key])
+            self._index(key, svr)
+        super(KnownServers, self).__setitem__(key, svr)
+
+    def __delitem__(self, key):
+        if self.indexed:
+            self._unindex(key, self[key])
+        super(KnownServers, self).__delitem__(key)
+
+    def update(self, *args, **kws):
+        for key, svr in dict(*args, **kws).items():
+            self[key] = svr
+
+    def setdefault(self, key, svr=None):
+        if key not in self:
+            self[key] = svr
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super(KnownServers, self).pop(key, *default)
+        svr = self[key]
+        del self[key]
+        return svr
+
+    def popitem(self):
+        key, svr = super(KnownServers, self).popitem()
+        if self.indexed:
+            self._unindex(key, svr)
+        return key, svr
+
+    def clear(self):
+        super(KnownServers, self).clear()
+        self.indexed = False
+
+    def health_of(self, server_info):
+        key = str(server_info)
+        rv = self.health.get(key)
+        if rv is None:
+            rv = self.health[key] = ServerHealth()
+        return rv
+
+    @property
+    def best_tip(self):
+        return max((h.tip_height for h in self.health.values() if h.tip_height is not None),
+                            default=None)
+
+    @staticmethod
+    def health_fname(fname):
+        # health data lives next to the server list: servers.json => servers.health.json
+        base, ext = os.path.splitext(fname)
+        return base + '.health' + (ext or '.json')
 
     def from_json(self, fname):
         '''
@@ -177,6 +403,13 @@ class KnownServers(dict):
                 nn = ServerInfo.from_dict(row)
                 self[str(nn)] = nn
 
+        try:
+            with open(self.health_fname(fname), 'rt') as fp:
+                for key, row in json.load(fp).items():
+                    self.health[key] = ServerHealth(**row)
+        except FileNotFoundError:
+            pass
+
     def from_irc(self, irc_nickname=None, irc_password=None):
         '''
             Connect to the IRC channel and find all servers presently connected.
@@ -241,22 +474,50 @@ class KnownServers(dict):
         '''
         rows = sorted(self.keys())
         with open(fname, 'wt') as fp:
-            json.dump([self[k] for k in rows], fp, indent=1)
+            json.dump([self[k].to_dict() for k in rows], fp, indent=1)
+
+        if self.health:
+            with open(self.health_fname(fname), 'wt') as fp:
+                json.dump({k: self.health[k].to_dict() for k in rows if k in self.health},
+                                fp, indent=1)
 
     def dump(self):
         return '\n'.join(repr(i) for i in self.values())
 
-    def select(self, **kws):
+    def select(self, protocol='s', is_onion=None, min_prune=0, weighted=True):
         '''
-            Find all servers with indicated protocol support. Shuffled.
+            Find all servers with indicated protocol support. Shuffled, but
+            fast, healthy, up-to-date servers tend to come first (unless weighted=False).
 
             Filter by TOR support, and pruning level.
         '''
-        lst = [i for i in self.values() if i.select(**kws)]
+        if not self.indexed:
+            self._reindex()
+
+        keys = self.by_protocol.get(protocol, set())
+
+        if is_onion is not None:
+            keys = (self.onions & keys) if is_onion else (keys - self.onions)
+
+        if min_prune > 0:
+            keys = set().union(*[keys & ks for limit, ks in self.by_pruning.items()
+                                                if limit >= min_prune])
+
+        lst = [self[k] for k in keys]
+
+        if not weighted or not self.health:
+            random.shuffle(lst)
+            return lst
+
+        best_tip = self.best_tip
+        unknown = ServerHealth()
+        weights = [self.health.get(str(i), unknown).weight(best_tip) for i in lst]
 
-        random.shuffle(lst)
+        # never rule anything out completely
+        floor = EXPLORE_WEIGHT * max(weights, default=0)
+        weights = [max(w, floor) for w in weights]
 
-        return lst
+        return weighted_order(lst, weights)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,98 @@
+#
+# TLS for server connections: a few shared SSL contexts, and resuming sessions.
+#
+import ssl
+
+# sessions to remember, per context (one per server, roughly)
+MAX_SESSIONS = 2000
+
+
+class ResumingContext(ssl.SSLContext):
+    '''
+        SSLContext that offers the server our last session with it, so a
+        reconnect can skip the full handshake (when the server agrees).
+
+        asyncio doesn't let us pass a session in, but it does call wrap_bio()
+        with the hostname, so we do it there.
+    '''
+    def __init__(self, *args, **kws):
+        super(ResumingContext, self).__init__()
+        self.sessions = {}          # hostname => SSLSession
+        self.handshakes = 0
+        self.resumed = 0
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None,
+                        session=None):
+        if session is None and not server_side and server_hostname:
+            session = self.sessions.get(server_hostname)
+
+        return super(ResumingContext, self).wrap_bio(incoming, outgoing, server_side=server_side,
+                                                    server_hostname=server_hostname,
+                                                    session=session)
+
+    def remember(self, ssl_object):
+        '''
+            Call once the connection has been used a little (TLS 1.3 sends
+            the session ticket after the handshake). Returns True if this
+            connection resumed an earlier session.
+        '''
+        self.handshakes += 1
+        resumed = ssl_object.session_reused
+        if resumed:
+            self.resumed += 1
+
+        hostname = ssl_object.server_hostname
+        session = ssl_object.session
+        if hostname and session is not None:
+            self.sessions.pop(hostname, None)
+            if len(self.sessions) >= MAX_SESSIONS:
+                # forget the oldest
+                del self.sessions[next(iter(self.sessions))]
+            self.sessions[hostname] = session
+
+        return resumed
+
+    def forget(self, hostname):
+        self.sessions.pop(hostname, None)
+
+
+_contexts = {}
+_private = {}           # verify => context that never resumes
+
+def get_context(verify=True, resume=True):
+    '''
+        Shared client context: verify=True checks certificates and hostnames
+        as usual, verify=False accepts anything (self-signed certs, over Tor).
+
+        With resume=False, sessions are never offered or kept: use that over
+        Tor or a proxy, where a resumed session would tie connections together
+        (and to us) for anyone watching the server.
+    '''
+    contexts = _contexts if resume else _private
+    ctx = contexts.get(verify)
+    if ctx is None:
+        if resume:
+            ctx = ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+        else:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            ctx.options |= ssl.OP_NO_TICKET
+        if verify:
+            ctx.load_default_certs(ssl.Purpose.SERVER_AUTH)
+        else:
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+        contexts[verify] = ctx
+
+    return ctx
+
+def stats():
+    '''
+        Handshakes done, and how many resumed a session, for all connections.
+    '''
+    handshakes = sum(c.handshakes for c in _contexts.values())
+    resumed = sum(c.resumed for c in _contexts.values())
+    return dict(handshakes=handshakes, resumed=resumed,
+                    hit_rate=(resumed / handshakes) if handshakes else None,
+                    sessions=sum(len(c.sessions) for c in _contexts.values()))
+
+# EOF
@@ -0,0 +1,199 @@
+#
+# Keep raw transactions on disk, so we don't have to fetch them again.
+#
+
+# Runtime check for optional modules
+from importlib import util as importutil
+import os, struct
+from hashlib import sha256
+import logging
+
+# Check if we can lock files (not on Windows); needed for multiple writers.
+if importutil.find_spec("fcntl") is not None:
+    import fcntl
+    have_fcntl = True
+else:
+    have_fcntl = False
+
+logger = logging.getLogger('connectrum')
+
+# index record: txid (as displayed), offset and length in data file
+INDEX_REC = struct.Struct('<32sQI')
+
+
+def _varint(raw, pos):
+    # bitcoin's compact size: value, and position after it
+    n = raw[pos]
+    if n < 0xfd:
+        return n, pos+1
+    size = 1 << (n - 0xfc)
+    return int.from_bytes(raw[pos+1:pos+1+size], 'little'), pos+1+size
+
+def strip_witness(raw):
+    '''
+        Segwit transactions (BIP144) have a marker and flag (00 01) after the
+        version, and witness data before the locktime; neither is part of
+        the txid. Returns the transaction without them (or as-is, if not segwit).
+    '''
+    if raw[4:6] != b'\x00\x01':
+        return raw
+
+    try:
+        pos = 6
+        n_in, pos = _varint(raw, pos)
+        for _ in range(n_in):
+            ln, pos = _varint(raw, pos + 36)        # prevout, then script
+            pos += ln + 4                           # ... and sequence
+        n_out, pos = _varint(raw, pos)
+        for _ in range(n_out):
+            ln, pos = _varint(raw, pos + 8)         # value, then script
+            pos += ln
+        io_end = pos
+
+        for _ in range(n_in):
+            items, pos = _varint(raw, pos)
+            for _ in range(items):
+                ln, pos = _varint(raw, pos)
+                pos += ln
+    except IndexError:
+        pos = None
+
+    if pos is None or pos + 4 != len(raw):
+        # not really segwit (zero inputs, say); hash it as it is
+        return raw
+
+    return raw[:4] + raw[6:io_end] + raw[-4:]
+
+def txid_of(raw):
+    # txid for raw (binary) transaction, in usual display order (hex)
+    return sha256(sha256(strip_witness(raw)).digest()).digest()[::-1].hex()
+
+
+class TxStore:
+    '''
+        Append-only file of raw transactions, plus a file of fixed-size index
+        records (txid, offset, length). Transactions are checked against their
+        txid before they go in.
+
+        Any number of processes can read the same store, and pick up what
+        others have added. Writers take a lock (if the OS has fcntl) for
+        each append; data is always written before its index record, so a
+        reader never sees a partial transaction.
+
+        Give one to StratumClient(txstore=...) and blockchain.transaction.get
+        is answered from here whenever possible.
+    '''
+    def __init__(self, path, fsync=False):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.fsync = fsync
+
+        self.data_fd = os.open(os.path.join(path, 'txns.dat'), os.O_RDWR|os.O_CREAT|os.O_APPEND, 0o644)
+        self.idx_fd = os.open(os.path.join(path, 'txns.idx'), os.O_RDWR|os.O_CREAT|os.O_APPEND, 0o644)
+
+        self.index = {}         # txid (bytes) => (offset, length)
+        self.idx_pos = 0        # how much of the index file we've read
+        self.hits = 0
+        self.misses = 0
+
+        self._refresh()
+
+    def close(self):
+        if self.data_fd is not None:
+            os.close(self.data_fd)
+            os.close(self.idx_fd)
+            self.data_fd = self.idx_fd = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, txid):
+        return self._lookup(txid) is not None
+
+    def _refresh(self):
+        # read index records added since last time (maybe by others)
+        end = os.fstat(self.idx_fd).st_size
+        end -= (end - self.idx_pos) % INDEX_REC.size      # partial record, still being written
+
+        if end <= self.idx_pos:
+            return False
+
+        data_size = os.fstat(self.data_fd).st_size
+        chunk = self._read(self.idx_fd, end - self.idx_pos, self.idx_pos)
+
+        for txid, offset, length in INDEX_REC.iter_unpack(chunk):
+            if offset + length > data_size:
+                # crash left a record without its data; ignore it
+                logger.warning("TxStore: index record past end of data (%s)" % txid[::-1].hex())
+                continue
+            self.index[txid] = (offset, length)
+
+        self.idx_pos = end
+        return True
+
+    @staticmethod
+    def _read(fd, length, offset):
+        if hasattr(os, 'pread'):
+            return os.pread(fd, length, offset)
+
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, length)
+
+    def _lookup(self, txid):
+        key = bytes.fromhex(txid)
+        rv = self.index.get(key)
+        if rv is None and self._refresh():
+            rv = self.index.get(key)
+        return rv
+
+    def get(self, txid):
+        '''
+            Raw transaction (bytes) for a txid (hex), or None if we don't have it.
+        '''
+        loc = self._lookup(txid)
+        if loc is None:
+            self.misses += 1
+            return None
+
+        offset, length = loc
+        self.hits += 1
+        return self._read(self.data_fd, length, offset)
+
+    def put(self, txid, raw):
+        '''
+            Add a transaction, after checking it hashes to txid.
+            Raises ValueError if not.
+        '''
+        if txid_of(raw) != txid.lower():
+            raise ValueError("Transaction does not match txid %s" % txid)
+
+        key = bytes.fromhex(txid)
+        if key in self.index:
+            return
+
+        if have_fcntl:
+            fcntl.flock(self.idx_fd, fcntl.LOCK_EX)
+        try:
+            # someone else may have just added it
+            self._refresh()
+            if key in self.index:
+                return
+
+            offset = os.fstat(self.data_fd).st_size
+            os.write(self.data_fd, raw)
+            if self.fsync:
+                os.fsync(self.data_fd)
+
+            os.write(self.idx_fd, INDEX_REC.pack(key, offset, len(raw)))
+
+            self.index[key] = (offset, len(raw))
+            self.idx_pos += INDEX_REC.size
+        finally:
+            if have_fcntl:
+                fcntl.flock(self.idx_fd, fcntl.LOCK_UN)
+
+    def stats(self):
+        return dict(entries=len(self.index), hits=self.hits, misses=self.misses,
+                        bytes=os.fstat(self.data_fd).st_size)
+
+# EOF
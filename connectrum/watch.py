@@ -0,0 +1,146 @@
+#
+# Watch a large set of scripthashes for activity.
+#
+import logging
+from .subscription import Subscription
+from .exc import ElectrumErrorResponse
+
+logger = logging.getLogger('connectrum')
+
+SH_SUBSCRIBE = 'blockchain.scripthash.subscribe'
+
+
+class ScripthashWatcher(Subscription):
+    '''
+        Subscribes to any number of scripthashes, in batches, and remembers
+        the last status hash of each. Iterate over it to get (scripthash, status)
+        as they change:
+
+            watcher = await client.watch(scripthashes)
+            async for sh, status in watcher:
+                ...
+
+        Servers limit what each connection may do, so subscribe requests go
+        in batches of chunk_size, with at most max_chunks of them outstanding.
+        Scripthashes the server refuses are returned by add(), and not watched.
+        Those that failed for other reasons (lost connection, say) are returned
+        too, but stay in the set, with unknown status (Ellipsis) until the next
+        resubscribe.
+
+        After the client reconnects, everything is subscribed again (the
+        server has forgotten us), but only scripthashes whose status is
+        different from what we remember show up as changes.
+    '''
+    def __init__(self, client, chunk_size=500, max_chunks=2, maxsize=100000):
+        super().__init__(client, (SH_SUBSCRIBE, None), maxsize=maxsize, overflow='drop_oldest')
+
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.status = {}            # scripthash => last status (None if no history)
+        self.resubscribing = None
+
+        client.subscriptions.setdefault(self.key, []).append(self)
+        client.on_connect.append(self._connected)
+
+    def __len__(self):
+        return len(self.status)
+
+    def __contains__(self, sh):
+        return sh in self.status
+
+    def _put(self, params):
+        # notification for some scripthash; pass it on if it's ours and it changed
+        sh, status = params
+        if sh in self.status and self.status[sh] != status:
+            self.status[sh] = status
+            super()._put((sh, status))
+
+    async def _subscribe(self, scripthashes):
+        # returns those that failed
+        requests = [(SH_SUBSCRIBE, sh) for sh in scripthashes]
+        failed = []
+        refused = 0
+
+        it = self.client.batch_rpc_iter(requests, self.chunk_size, self.max_chunks,
+                                                return_exceptions=True)
+        pos = 0
+        async for status in it:
+            sh = scripthashes[pos]
+            pos += 1
+
+            if isinstance(status, Exception):
+                failed.append(sh)
+                if isinstance(status, ElectrumErrorResponse):
+                    # server said no
+                    refused += 1
+                    self.status.pop(sh, None)
+                elif sh in self.status:
+                    # never got an answer; we don't know its status
+                    self.status[sh] = Ellipsis
+                continue
+
+            if sh not in self.status:
+                # removed meanwhile
+                continue
+
+            old = self.status[sh]
+            self.status[sh] = status
+            if old is not Ellipsis and old != status:
+                Subscription._put(self, (sh, status))
+
+        if refused:
+            logger.warning("Server refused to watch %d scripthashes" % refused)
+        if len(failed) > refused:
+            logger.warning("Could not subscribe to %d scripthashes" % (len(failed) - refused))
+
+        return failed
+
+    async def add(self, scripthashes):
+        '''
+            Start watching these too. Returns a list of those that failed
+            (refused by the server, or no answer).
+        '''
+        new = [sh for sh in dict.fromkeys(scripthashes) if sh not in self.status]
+        for sh in new:
+            self.status[sh] = Ellipsis         # don't know yet
+
+        return await self._subscribe(new)
+
+    async def remove(self, scripthashes):
+        '''
+            Stop watching these. Servers before protocol 1.4.2 can't
+            unsubscribe; their notifications will be ignored.
+        '''
+        gone = [sh for sh in dict.fromkeys(scripthashes) if sh in self.status]
+        for sh in gone:
+            del self.status[sh]
+
+        if gone:
+            await self.client.batch_rpc([('blockchain.scripthash.unsubscribe', sh) for sh in gone],
+                                            self.chunk_size, self.max_chunks, return_exceptions=True)
+
+    async def resubscribe(self):
+        '''
+            Subscribe to everything again, as needed after a new connection.
+        '''
+        return await self._subscribe(list(self.status))
+
+    def _connected(self, client):
+        # client has (re)connected; server knows nothing about our subscriptions
+        if not self.status or self.closed:
+            return
+
+        if self.resubscribing and not self.resubscribing.done():
+            self.resubscribing.cancel()
+
+        logger.info("Subscribing to %d scripthashes again" % len(self.status))
+        self.resubscribing = client.loop.create_task(self.resubscribe())
+
+    def close(self):
+        super().close()
+        if self._connected in self.client.on_connect:
+            self.client.on_connect.remove(self._connected)
+        if self.resubscribing:
+            self.resubscribing.cancel()
+
+# EOF
@@ -1,48 +1,18 @@
 #! /usr/bin/env python3
 #
-# Find all Electrum servers, everywhere... It will connect to one at random (from
-# a hard-coded list) and then expand it's list of peers based on what it sees
-# at each server.
+# Find all Electrum servers, everywhere... It will connect to those we know
+# and then expand it's list of peers based on what it sees at each server,
+# and what those peers know, and so on.
 #
 # THIS IS A DEMO PROGRAM ONLY. It would be anti-social to run this frequently or
 # as part of any periodic task.
 #
 import sys, asyncio, argparse
-from connectrum.client import StratumClient
 from connectrum.svr_info import KnownServers
+from connectrum.discovery import PeerCrawler
 
 ks = KnownServers()
 
-connected = set()
-failed = set()
-
-async def probe(svr, proto_code, use_tor):
-    conn = StratumClient()
-
-    try:
-        await conn.connect(svr, proto_code, use_tor=(svr.is_onion or use_tor), short_term=True)
-    except:
-        failed.add(str(svr))
-        return None
-
-    peers, _ = conn.subscribe('server.peers.subscribe')
-
-    peers = await peers
-    print("%s gave %d peers" % (svr, len(peers)))
-
-    connected.add(str(svr))
-
-    # track them all.
-    more = ks.add_peer_response(peers)
-
-    if more:
-        print("found %d more servers from %s: %s" % (len(more), svr, ', '.join(more)))
-    
-
-    conn.close()
-
-    return str(svr)
-
 
 if __name__ == '__main__':
 
@@ -62,6 +32,10 @@ if __name__ == '__main__':
                         help='File to save resulting server list into (JSON)')
     parser.add_argument('--timeout', default=30, type=int,
                         help='Total time to take (overall)')
+    parser.add_argument('--workers', default=20, type=int,
+                        help='How many servers to talk to at once')
+    parser.add_argument('--depth', default=None, type=int,
+                        help='How many rounds of peers-of-peers to follow')
 
     args = parser.parse_args()
 
@@ -89,20 +63,23 @@ if __name__ == '__main__':
     candidates = ks.select(protocol=args.protocol, is_onion=args.onion)
     print("%d servers are right protocol" % len(candidates))
 
-    all_done = asyncio.wait([probe(i, args.protocol, args.tor) for i in candidates],
-                                            timeout=args.timeout)
+    crawler = PeerCrawler(ks, args.protocol, workers=args.workers, max_depth=args.depth,
+                                use_tor=args.tor, save_as=args.output)
 
-    loop.run_until_complete(all_done)
+    try:
+        loop.run_until_complete(asyncio.wait_for(crawler.crawl(candidates), args.timeout))
+    except asyncio.TimeoutError:
+        print("Stopped after %d seconds" % args.timeout)
     loop.close()
 
-    if not connected:
+    if not crawler.connected:
         print("WARNING: did not successfully connect to any existing servers!")
     else:
-        print("%d servers connected and answered correctly" % len(connected))
+        print("%d servers connected and answered correctly" % len(crawler.connected))
 
-    if failed:
-        print("%d FAILURES: " % len(failed))
-        for i in failed:
+    if crawler.failed:
+        print("%d FAILURES: " % len(crawler.failed))
+        for i in crawler.failed:
             print('  %s' % i)
 
     print("%d servers are now known" % len(ks))
@@ -111,6 +88,7 @@ if __name__ == '__main__':
             print('  %s  [%s]' % (i.hostname, ' '.join(i.protocols)))
 
     if args.output:
+        # also saved along the way
         ks.save_json(args.output)
     
 # EOF
@@ -0,0 +1,105 @@
+#! /usr/bin/env python3
+#
+# Speed of turning addresses into scripthashes: the old way (pycoin, if installed)
+# vs. connectrum.address, without and with its cache.
+#
+#   python3 testing/bench_address.py [--count 1000000] [--unique 100000]
+#
+import sys, os, time, random, argparse
+from hashlib import sha256
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from connectrum.address import (address_script, address_to_scripthash,
+                                    addresses_to_scripthashes, B58_ALPHABET,
+                                    BECH32_ALPHABET, _bech32_polymod)
+
+def b58check(payload):
+    raw = payload + sha256(sha256(payload).digest()).digest()[:4]
+    num = int.from_bytes(raw, 'big')
+    out = ''
+    while num:
+        num, r = divmod(num, 58)
+        out = B58_ALPHABET[r] + out
+    return '1' * (len(raw) - len(raw.lstrip(b'\0'))) + out
+
+def bech32(version, prog):
+    data = [version]
+    acc = bits = 0
+    for b in prog:
+        acc = (acc << 8) | b
+        bits += 8
+        while bits >= 5:
+            bits -= 5
+            data.append((acc >> bits) & 31)
+    if bits:
+        data.append((acc << (5 - bits)) & 31)
+
+    const = 1 if version == 0 else 0x2bc830a3
+    expanded = [3, 3, 0, 2, 3]      # 'bc'
+    poly = _bech32_polymod(expanded + data + [0]*6) ^ const
+    data += [(poly >> 5 * (5 - i)) & 31 for i in range(6)]
+
+    return 'bc1' + ''.join(BECH32_ALPHABET[d] for d in data)
+
+def random_address():
+    kind = random.randrange(4)
+    if kind == 0:
+        return b58check(b'\x00' + os.urandom(20))
+    if kind == 1:
+        return b58check(b'\x05' + os.urandom(20))
+    if kind == 2:
+        return bech32(0, os.urandom(20))
+    return bech32(1, os.urandom(32))
+
+def pycoin_way(addr):
+    # what StratumClient.patch_addr_methods used to do, every call
+    from hashlib import sha256
+    from binascii import b2a_hex
+    from pycoin.symbols.btc import network as BTC
+    sh = sha256(BTC.parse(addr).script()).digest()[::-1]
+    return str(b2a_hex(sh), 'ascii')
+
+def uncached(addr):
+    return sha256(address_script(addr)).digest()[::-1].hex()
+
+def timed(label, fn, count):
+    t = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t
+    print("%-22s %7.3fs  %8.0f /sec" % (label, dt, count / dt))
+
+def main(args):
+    unique = [random_address() for _ in range(args.unique)]
+    addrs = [random.choice(unique) for _ in range(args.count)]
+    print("%d conversions of %d different addresses\n" % (args.count, args.unique))
+
+    try:
+        import pycoin
+        n = min(args.count, 20000)
+        timed('pycoin (%d only):' % n, lambda: [pycoin_way(a) for a in addrs[:n]], n)
+    except ImportError:
+        print("pycoin:                (not installed)")
+
+    timed('uncached:', lambda: [uncached(a) for a in addrs], args.count)
+
+    address_to_scripthash.cache_clear()
+    timed('cached, one by one:', lambda: [address_to_scripthash(a) for a in addrs], args.count)
+
+    address_to_scripthash.cache_clear()
+    timed('cached, bulk:', lambda: addresses_to_scripthashes(addrs), args.count)
+
+    timed('bulk again (warm):', lambda: addresses_to_scripthashes(addrs), args.count)
+
+    assert addresses_to_scripthashes(addrs[:100]) == [uncached(a) for a in addrs[:100]]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark address to scripthash conversion')
+    parser.add_argument('--count', default=1000000, type=int,
+                        help='Number of conversions')
+    parser.add_argument('--unique', default=100000, type=int,
+                        help='Number of different addresses among them')
+    args = parser.parse_args()
+
+    main(args)
+
+# EOF
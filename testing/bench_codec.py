@@ -0,0 +1,71 @@
+#! /usr/bin/env python3
+#
+# Encode/decode throughput of each JSON codec we have, on typical Electrum traffic.
+#
+#   python3 testing/bench_codec.py [--seconds 0.5]
+#
+import sys, os, time, json, random, argparse
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from connectrum.codec import CODECS
+
+def rand_hex(nbytes):
+    return random.getrandbits(nbytes*8).to_bytes(nbytes, 'big').hex()
+
+def payloads():
+    # responses as they arrive from the server: dict with result & id
+    def resp(result):
+        return {'jsonrpc': '2.0', 'result': result, 'id': 42}
+
+    yield 'request', {'id': 42, 'method': 'blockchain.scripthash.get_history',
+                                'params': [rand_hex(32)]}
+
+    # blockchain.block.headers: one full chunk of 2016 headers
+    yield 'headers', resp({'count': 2016, 'hex': rand_hex(80*2016), 'max': 2016})
+
+    yield 'history', resp([{'tx_hash': rand_hex(32), 'height': 600000+i}
+                                    for i in range(1000)])
+
+    yield 'listunspent', resp([{'tx_hash': rand_hex(32), 'tx_pos': i % 4,
+                                'height': 600000+i, 'value': random.randint(546, 10**8)}
+                                    for i in range(1000)])
+
+    # a large-ish transaction
+    yield 'raw tx', resp(rand_hex(2500))
+
+def measure(fn, arg, seconds):
+    n = 0
+    t = time.perf_counter()
+    end = t + seconds
+    while 1:
+        for _ in range(10):
+            fn(arg)
+        n += 10
+        now = time.perf_counter()
+        if now >= end: break
+    return n / (now - t)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON codecs')
+    parser.add_argument('--seconds', default=0.5, type=float,
+                        help='Time to spend on each measurement')
+    args = parser.parse_args()
+
+    print("Codecs available: %s\n" % ', '.join(CODECS))
+    print("%-12s %-7s %9s %14s %14s" % ('payload', 'codec', 'bytes', 'encode MB/s', 'decode MB/s'))
+
+    for label, obj in payloads():
+        for name, codec in CODECS.items():
+            wire = codec.encode(obj)
+            assert codec.decode(memoryview(wire)) == obj
+
+            enc = measure(codec.encode, obj, args.seconds)
+            dec = measure(codec.decode, memoryview(wire), args.seconds)
+            mb = len(wire) / 1e6
+
+            print("%-12s %-7s %9d %14.1f %14.1f" % (label, name, len(wire), enc*mb, dec*mb))
+
+if __name__ == '__main__':
+    main()
+
+# EOF
@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+#
+# Finding servers: the old spider (everything at once, one round, save at the end)
+# vs. PeerCrawler, against a fleet of stand-in servers on 127.0.0.x. Some of
+# them are down, and some accept connections but never answer.
+#
+#   python3 testing/bench_discovery.py [--servers 100] [--seeds 3]
+#
+import sys, os, time, asyncio, argparse, random
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from connectrum.client import StratumClient
+from connectrum.svr_info import KnownServers
+from connectrum.discovery import PeerCrawler
+from fake_server import start_fleet
+
+PORT = 50321
+
+def seed_list(fleet, count):
+    ks = KnownServers()
+    for svr in fleet[:count]:
+        ks.add_single(svr.host, 't%d' % PORT)
+    return ks
+
+async def old_spider(ks, timeout):
+    # as examples/spider.py did it
+    connected = set()
+
+    async def probe(svr):
+        conn = StratumClient(auto_reconnect=False)
+        try:
+            await conn.connect(svr, 't', short_term=True)
+            peers = await conn.RPC('server.peers.subscribe')
+        except Exception:
+            return
+        finally:
+            conn.close()
+        connected.add(str(svr))
+        ks.add_peer_response(peers)
+
+    await asyncio.wait([asyncio.ensure_future(probe(s)) for s in ks.select(protocol='t')],
+                            timeout=timeout)
+    return len(connected)
+
+async def main(args):
+    fleet = await start_fleet(args.servers, port=PORT)
+
+    # the first few are always good, so both start from somewhere
+    others = fleet[args.seeds:]
+    for svr in random.sample(others, int(len(others) * args.dead)):
+        await svr.close()
+    for svr in random.sample(others, int(len(others) * args.silent)):
+        svr.latency = 3600
+
+    up = sum(1 for s in fleet if s._server and s.latency == 0)
+    print("%d servers, %d answer, starting from %d\n" % (args.servers, up, args.seeds))
+
+    ks = seed_list(fleet, args.seeds)
+    t = time.perf_counter()
+    ok = await old_spider(ks, args.timeout)
+    print("%-14s %7.3fs  %4d connected, %4d known" % ('old spider:',
+                                    time.perf_counter() - t, ok, len(ks)))
+
+    # run it again and again, on everything, until nothing new turns up
+    t = time.perf_counter()
+    rounds, before = 1, 0
+    while len(ks) != before:
+        before = len(ks)
+        ok = await old_spider(ks, args.timeout)
+        rounds += 1
+    print("%-14s %7.3fs  %4d connected, %4d known  (%d rounds)" % ('  repeated:',
+                                    time.perf_counter() - t, ok, len(ks), rounds))
+
+    ks = seed_list(fleet, args.seeds)
+    crawler = PeerCrawler(ks, 't', workers=args.workers,
+                                connect_timeout=args.timeout, peers_timeout=args.timeout)
+    t = time.perf_counter()
+    stats = await crawler.crawl()
+    print("%-14s %7.3fs  %4d connected, %4d known  (%d failed)" % ('PeerCrawler:',
+                    time.perf_counter() - t, stats['connected'], stats['known'], stats['failed']))
+
+    for svr in fleet:
+        await svr.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark peer discovery')
+    parser.add_argument('--servers', default=100, type=int,
+                        help='Number of stand-in servers (on 127.0.0.2 and up)')
+    parser.add_argument('--seeds', default=3, type=int,
+                        help='Number of them we know about at the start')
+    parser.add_argument('--dead', default=0.1, type=float,
+                        help='Fraction that refuse connections')
+    parser.add_argument('--silent', default=0.05, type=float,
+                        help='Fraction that never answer')
+    parser.add_argument('--workers', default=20, type=int,
+                        help='PeerCrawler workers')
+    parser.add_argument('--timeout', default=2, type=float,
+                        help='Per-host timeout (PeerCrawler), total time (old spider)')
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
+
+# EOF
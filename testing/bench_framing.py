@@ -0,0 +1,95 @@
+#! /usr/bin/env python3
+#
+# Compare the original (split everything, every time) unframing in StratumProtocol
+# against the incremental LineFramer, for responses of various sizes arriving
+# in realistically sized pieces.
+#
+#   python3 testing/bench_framing.py [--full]
+#
+import sys, os, time, json, argparse
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from connectrum.protocol import StratumProtocol
+
+SIZES = [('1 KB', 1024), ('1 MB', 1024*1024), ('50 MB', 50*1024*1024)]
+
+# TCP segment, TLS record, typical and maximum asyncio read sizes
+CHUNKS = [1460, 16*1024, 64*1024, 256*1024]
+
+# skip legacy runs that would copy more than this many bytes in total
+LEGACY_BUDGET = 16 * 1024**3
+
+
+class Collector:
+    streams = {}
+
+    def __init__(self):
+        self.count = 0
+
+    def _got_response(self, msg):
+        self.count += 1
+
+
+class LegacyProtocol(StratumProtocol):
+    # data_received() as it was, before the LineFramer
+    buf = b""
+
+    def data_received(self, data):
+        self.buf += data
+
+        *lines, self.buf = self.buf.split(b'\n')
+
+        for line in lines:
+            if not line: continue
+            msg = line.decode('utf-8', "error").strip()
+            msg = json.loads(msg)
+            self.client._got_response(msg)
+
+
+def make_response(size):
+    # something like a blockchain.scripthash.get_history response
+    item = {'tx_hash': 'ab'*32, 'height': 654321}
+    per = len(json.dumps(item)) + 2
+    body = {'jsonrpc': '2.0', 'result': [item] * max(1, size // per), 'id': 7}
+    return json.dumps(body).encode('utf-8') + b'\n'
+
+def run(proto_cls, payload, chunk):
+    p = proto_cls()
+    p.client = Collector()
+    t = time.perf_counter()
+    for pos in range(0, len(payload), chunk):
+        p.data_received(payload[pos:pos+chunk])
+    dt = time.perf_counter() - t
+    assert p.client.count == 1
+    return dt
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark response unframing')
+    parser.add_argument('--full', default=False, action="store_true",
+                        help='Run every legacy case, even the very slow ones')
+    args = parser.parse_args()
+
+    print("%-6s %8s %8s %12s %12s %8s" % ('size', 'chunk', 'pieces', 'legacy', 'framer', 'gain'))
+
+    for label, size in SIZES:
+        payload = make_response(size)
+
+        for chunk in CHUNKS:
+            if chunk >= 2*len(payload) and chunk != CHUNKS[0]:
+                continue
+
+            pieces = (len(payload) + chunk - 1) // chunk
+            new = run(StratumProtocol, payload, chunk)
+
+            if args.full or (pieces * len(payload)) <= LEGACY_BUDGET:
+                old = run(LegacyProtocol, payload, chunk)
+                print("%-6s %8d %8d %11.4fs %11.4fs %7.1fx"
+                            % (label, chunk, pieces, old, new, old/new))
+            else:
+                print("%-6s %8d %8d %12s %11.4fs %8s"
+                            % (label, chunk, pieces, 'skipped', new, '-'))
+
+if __name__ == '__main__':
+    main()
+
+# EOF
@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+#
+# How much does it cost to keep up with a busy wallet: fetching the whole history
+# on each status change, or letting HistorySync work it out from the mempool?
+#
+#   python3 testing/bench_history.py [--history 5000] [--changes 200]
+#
+import sys, os, time, asyncio, argparse, random
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from connectrum.client import StratumClient
+from connectrum.history import HistorySync
+from fake_server import FakeElectrumServer
+
+SH = '%064x' % 1
+
+def random_tx():
+    return '%064x' % random.getrandbits(256)
+
+async def activity(svr, changes):
+    # new unconfirmed payments, mined now and then
+    history = svr.histories[SH]
+    for n in range(changes):
+        if n % 5 == 4:
+            svr.new_block()
+            history.extend(dict(tx_hash=t['tx_hash'], height=svr.chain.height)
+                                for t in svr.mempool.pop(SH))
+        else:
+            svr.mempool.setdefault(SH, []).append(dict(tx_hash=random_tx(), height=0, fee=200))
+        svr.notify_scripthash(SH)
+        await asyncio.sleep(0.02)
+
+async def run(svr, changes, incremental):
+    conn = StratumClient()
+    await conn.connect(svr.server_info(), 't', short_term=True)
+
+    hist = HistorySync(conn)
+    watcher = await conn.watch([SH])
+    await hist.sync(watcher)
+
+    bytes_before = svr.bytes_out
+    t = time.perf_counter()
+    seen = 0
+
+    async def follow():
+        nonlocal seen
+        async for sh, status in watcher:
+            if incremental:
+                await hist.update(sh, status)
+            else:
+                await hist._fetch_all(sh)
+            seen += 1
+
+    task = asyncio.ensure_future(follow())
+    await activity(svr, changes)
+    await asyncio.sleep(0.1)
+    task.cancel()
+
+    dt = time.perf_counter() - t
+    assert hist.status(SH) == watcher.status[SH]
+    conn.close()
+
+    return dt, svr.bytes_out - bytes_before, seen, hist.stats()
+
+async def main(args):
+    svr = await FakeElectrumServer().start()
+    height = svr.chain.height
+
+    print("%d transactions in history, %d changes\n" % (args.history, args.changes))
+
+    for incremental in (False, True):
+        svr.mempool.pop(SH, None)
+        svr.set_history(SH, [dict(tx_hash=random_tx(), height=random.randint(1, height))
+                                    for _ in range(args.history)], notify=False)
+        svr.histories[SH].sort(key=lambda h: h['height'])
+
+        dt, nbytes, seen, stats = await run(svr, args.changes, incremental)
+        print("%-14s %7.3fs  %10d bytes from server  (%d changes seen; %d full fetches)" % (
+                    'incremental:' if incremental else 'full refetch:',
+                    dt, nbytes, seen, stats['full_fetches']))
+
+    await svr.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark incremental history sync')
+    parser.add_argument('--history', default=5000, type=int,
+                        help='Number of transactions already in the history')
+    parser.add_argument('--changes', default=200, type=int,
+                        help='Number of status changes to follow')
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
+
+# EOF
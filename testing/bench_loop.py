@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+#
+# The same client work on each kind of event loop (asyncio's own, and uvloop
+# if it's installed): one request at a time, many outstanding at once, and
+# a flood of notifications. The stand-in server runs in the same loop, so
+# it gets any speed up too, just like it would for the client alone.
+#
+#   python3 testing/bench_loop.py [--count 20000] [--rounds 3]
+#
+import sys, os, time, asyncio, argparse
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from connectrum.client import StratumClient
+from connectrum import runtime
+from fake_server import FakeElectrumServer
+
+WINDOW = 500        # requests outstanding at once
+
+async def round_trips(conn, count):
+    t = time.perf_counter()
+    for _ in range(count):
+        await conn.RPC('server.ping')
+    return time.perf_counter() - t
+
+async def pipelined(conn, count):
+    t = time.perf_counter()
+    for pos in range(0, count, WINDOW):
+        await asyncio.gather(*[conn.RPC('blockchain.block.header', (pos+i) % 1000)
+                                        for i in range(WINDOW)])
+    return time.perf_counter() - t
+
+async def notifications(svr, conn, count):
+    # keep them all (normally, only the latest header is kept)
+    fut, sub = conn.subscribe('blockchain.headers.subscribe', maxsize=count,
+                                                    overflow='drop_oldest')
+    tip = await fut
+
+    t = time.perf_counter()
+    for _ in range(count):
+        svr.notify('blockchain.headers.subscribe', None, [tip])
+    for _ in range(count):
+        await sub.get()
+    dt = time.perf_counter() - t
+
+    sub.close()
+    return dt
+
+async def one_loop(args):
+    svr = await FakeElectrumServer().start()
+    conn = StratumClient(metrics=False, auto_reconnect=False)
+    await conn.connect(svr.server_info(), 't', short_term=True)
+
+    best = {}
+    for _ in range(args.rounds):
+        for label, dt in [ ('round trips', await round_trips(conn, args.count // 4)),
+                           ('pipelined', await pipelined(conn, args.count)),
+                           ('notifications', await notifications(svr, conn, args.count)) ]:
+            best[label] = min(best.get(label, dt), dt)
+
+    conn.close()
+    await svr.close()
+
+    return runtime.loop_name(), best
+
+def main(args):
+    kinds = ['asyncio']
+    if runtime.have_uvloop:
+        kinds.append('uvloop')
+    else:
+        print("(uvloop isn't installed, so just asyncio)")
+
+    counts = {'round trips': args.count // 4, 'pipelined': args.count,
+                'notifications': args.count}
+    print("%d requests/notifications, best of %d\n" % (args.count, args.rounds))
+
+    results = {}
+    for kind in kinds:
+        name, best = runtime.run(one_loop(args), kind)
+        assert name == kind, name
+        results[kind] = best
+
+        for label, dt in best.items():
+            print("%-8s %-14s %7.3fs  %8.0f /sec" % (kind, label + ':', dt, counts[label] / dt))
+        print()
+
+    if len(results) > 1:
+        for label in counts:
+            print("uvloop speedup, %-14s %5.2fx" % (label + ':',
+                                    results['asyncio'][label] / results['uvloop'][label]))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the client on asyncio vs. uvloop')
+    parser.add_argument('--count', default=20000, type=int,
+                        help='Requests (and notifications) per round')
+    parser.add_argument('--rounds', default=3, type=int,
+                        help='Take the best of this many rounds')
+    args = parser.parse_args()
+
+    main(args)
+
+# EOF
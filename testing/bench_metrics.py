@@ -0,0 +1,78 @@
+#! /usr/bin/env python3
+#
+# What does leaving the metrics on cost? Request throughput with and without,
+# against the stand-in server, plus the bookkeeping alone.
+#
+#   python3 testing/bench_metrics.py [--count 50000] [--rounds 3]
+#
+import sys, os, time, asyncio, argparse, timeit
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from connectrum.client import StratumClient
+from connectrum.metrics import ClientMetrics, render_prometheus
+from fake_server import FakeElectrumServer
+
+WINDOW = 500        # requests outstanding at once
+
+async def run(svr, count, metrics):
+    conn = StratumClient(metrics=metrics)
+    await conn.connect(svr.server_info(), 't', short_term=True)
+
+    t = time.perf_counter()
+    for pos in range(0, count, WINDOW):
+        await asyncio.gather(*[conn.RPC('blockchain.block.header', (pos+i) % 1000)
+                                        for i in range(WINDOW)])
+    dt = time.perf_counter() - t
+
+    conn.close()
+    return dt, conn
+
+def bookkeeping(count):
+    # just the per-request work, no network
+    m = ClientMetrics()
+    fut = asyncio.new_event_loop().create_future()
+    fut.set_result(None)
+
+    def one():
+        m.request_sent('blockchain.block.header')
+        m.request_done('blockchain.block.header', 0.004, fut)
+
+    return timeit.timeit(one, number=count) / count
+
+async def main(args):
+    svr = await FakeElectrumServer().start()
+
+    print("%d requests, best of %d\n" % (args.count, args.rounds))
+
+    best = {}
+    for _ in range(args.rounds):
+        for metrics in (False, True):
+            dt, conn = await run(svr, args.count, metrics)
+            best[metrics] = min(best.get(metrics, dt), dt)
+            if metrics:
+                last = conn
+
+    for metrics in (False, True):
+        print("metrics %-4s %7.3fs  %8.0f req/sec" % ('on:' if metrics else 'off:',
+                        best[metrics], args.count / best[metrics]))
+    print("overhead:    %6.1f%%" % (100 * (best[True] - best[False]) / best[False]))
+    print("bookkeeping: %6.2f us/request\n" % (bookkeeping(args.count) * 1e6))
+
+    st = last.stats()
+    print("p50/p99 latency: %.2f / %.2f ms" % (st['latency']['blockchain.block.header']['p50'] * 1000,
+                                            st['latency']['blockchain.block.header']['p99'] * 1000))
+    print("render_prometheus: %d lines" % len(render_prometheus(last).splitlines()))
+
+    await svr.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark cost of client metrics')
+    parser.add_argument('--count', default=50000, type=int,
+                        help='Number of requests per round')
+    parser.add_argument('--rounds', default=3, type=int,
+                        help='Take the best of this many rounds')
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
+
+# EOF
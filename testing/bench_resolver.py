@@ -0,0 +1,85 @@
+#! /usr/bin/env python3
+#
+# Connecting to a server with a slow DNS lookup and two addresses, the first
+# of which doesn't answer (like a broken IPv6 route). The network is simulated
+# by the event loop: lookups take --dns-delay, connecting to the dead address
+# hangs for --dead-delay then fails. Compares asyncio's own lookup and
+# connect (as before), our cached lookup trying addresses in turn, and
+# cached lookup plus racing (happy eyeballs).
+#
+#   python3 testing/bench_resolver.py [--count 10]
+#
+import sys, os, time, asyncio, argparse, socket
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from connectrum.client import StratumClient
+from connectrum.resolver import Resolver
+from fake_server import FakeElectrumServer
+
+DEAD_ADDR = '127.0.0.254'
+
+class SimulatedNetLoop(asyncio.SelectorEventLoop):
+    dns_delay = 0.05
+    dead_delay = 2.0
+
+    async def getaddrinfo(self, host, port, **kws):
+        await asyncio.sleep(self.dns_delay)
+        if host != 'dual.example.com':
+            return await super().getaddrinfo(host, port, **kws)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (DEAD_ADDR, port)),
+                (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', port))]
+
+    async def sock_connect(self, sock, address):
+        if address[0] == DEAD_ADDR:
+            await asyncio.sleep(self.dead_delay)
+            raise TimeoutError("simulated: no answer from %s" % DEAD_ADDR)
+        return await super().sock_connect(sock, address)
+
+async def run(svr, count, **kws):
+    from connectrum.svr_info import ServerInfo
+    info = ServerInfo('dual', 'dual.example.com', 't%d' % svr.port)
+
+    times = []
+    for _ in range(count):
+        conn = StratumClient(metrics=False, auto_reconnect=False, **kws)
+        t = time.perf_counter()
+        await conn.connect(info, 't', short_term=True)
+        times.append(time.perf_counter() - t)
+        conn.close()
+
+    return times[0], sum(times[1:]) / (count - 1), conn.actual_connection
+
+async def main(args):
+    loop = asyncio.get_running_loop()
+    loop.dns_delay = args.dns_delay
+    loop.dead_delay = args.dead_delay
+
+    svr = await FakeElectrumServer().start()
+
+    print("DNS takes %dms, first address hangs %.1fs\n" % (args.dns_delay * 1000, args.dead_delay))
+
+    for label, kws in [ ('asyncio lookup + connect:', dict(resolver=False)),
+                        ('cached, one at a time:', dict(resolver=Resolver(), happy_eyeballs_delay=None)),
+                        ('cached + happy eyeballs:', dict(resolver=Resolver())) ]:
+        first, avg, conn = await run(svr, args.count, **kws)
+        print("%-26s %8.1fms first, %7.1fms after  (got %s)" % (label, first * 1000,
+                                                        avg * 1000, conn['ip_addr']))
+
+    await svr.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark DNS caching and address racing')
+    parser.add_argument('--count', default=10, type=int,
+                        help='Number of connections to make each way')
+    parser.add_argument('--dns-delay', default=0.05, type=float,
+                        help='Simulated DNS lookup time (seconds)')
+    parser.add_argument('--dead-delay', default=2.0, type=float,
+                        help='Simulated time until the dead address gives up (seconds)')
+    args = parser.parse_args()
+
+    loop = SimulatedNetLoop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(main(args))
+    loop.close()
+
+# EOF
@@ -0,0 +1,70 @@
+#! /usr/bin/env python3
+#
+# A big catalog of servers: time to load it from JSON, memory used, and how
+# fast KnownServers.select() filters it.
+#
+#   python3 testing/bench_servers.py [--count 50000]
+#
+import sys, os, time, json, random, argparse, tempfile, tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from connectrum.svr_info import KnownServers
+
+def fake_catalog(count):
+    rows = []
+    for n in range(count):
+        onion = (n % 5 == 0)
+        host = ('%016x.onion' % n) if onion else ('electrum%d.example.com' % n)
+        ports = random.choice([['t50001', 's50002'], ['s50002'], ['s'], ['t', 's'],
+                                    ['s50002', 't50001', 'g443'], ['t50001']])
+        rows.append(dict(nickname=None, hostname=host, ip_addr=None, ports=ports,
+                            version=random.choice(['1.4', '1.4.2', '1.2']),
+                            pruning_limit=random.choice([0, 0, 0, 1000, 10000]),
+                            seen_at=1533670768.0 + n))
+    return rows
+
+def main(args):
+    fname = os.path.join(tempfile.mkdtemp(), 'servers.json')
+    with open(fname, 'wt') as fp:
+        json.dump(fake_catalog(args.count), fp)
+
+    print("%d servers\n" % args.count)
+
+    t = time.perf_counter()
+    ks = KnownServers()
+    ks.from_json(fname)
+    dt = time.perf_counter() - t
+
+    # again, to see how much memory it takes (slower, when tracing)
+    del ks
+    tracemalloc.start()
+    ks = KnownServers()
+    ks.from_json(fname)
+    mem, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("%-34s %8.3fs  %6.1f MB" % ('load:', dt, mem / 1e6))
+
+    for label, kws in [ ('select(s):', dict(protocol='s')),
+                        ('select(t, is_onion=True):', dict(protocol='t', is_onion=True)),
+                        ('select(g, min_prune=1000):', dict(protocol='g', min_prune=1000)) ]:
+        t = time.perf_counter()
+        for _ in range(args.rounds):
+            n = len(ks.select(**kws))
+        dt = (time.perf_counter() - t) / args.rounds
+        print("%-34s %8.2fms  %6d found" % (label, dt * 1000, n))
+
+    t = time.perf_counter()
+    ks.save_json(fname)
+    print("%-34s %8.3fs" % ('save:', time.perf_counter() - t))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark a large KnownServers catalog')
+    parser.add_argument('--count', default=50000, type=int,
+                        help='Number of servers in the catalog')
+    parser.add_argument('--rounds', default=20, type=int,
+                        help='Times to run each select()')
+    args = parser.parse_args()
+
+    main(args)
+
+# EOF
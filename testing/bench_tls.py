@@ -0,0 +1,58 @@
+#! /usr/bin/env python3
+#
+# Short-term TLS connections, one after another: a new SSL context and full
+# handshake each time (as before), vs. the shared context resuming sessions.
+#
+#   python3 testing/bench_tls.py [--count 200]
+#
+import sys, os, time, asyncio, argparse, ssl
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from connectrum.client import StratumClient
+from connectrum import tls
+from fake_server import FakeElectrumServer, self_signed_context
+
+async def fresh_handshakes(svr, count):
+    # what connect() did with disable_cert_verify: a new context every time
+    hostname, port, _ = svr.server_info().get_port('s')
+    t = time.perf_counter()
+    for _ in range(count):
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+        transport, _ = await asyncio.get_running_loop().create_connection(asyncio.Protocol,
+                                                            hostname, port, ssl=ctx)
+        transport.close()
+    return time.perf_counter() - t
+
+async def client_connects(svr, count):
+    t = time.perf_counter()
+    for _ in range(count):
+        conn = StratumClient(metrics=False, auto_reconnect=False)
+        await conn.connect(svr.server_info(), 's', short_term=True, disable_cert_verify=True)
+        conn.close()
+    return time.perf_counter() - t
+
+async def main(args):
+    svr = await FakeElectrumServer(ssl=self_signed_context()).start()
+
+    dt = await fresh_handshakes(svr, args.count)
+    print("%-28s %7.3fs  %6.2fms each" % ('new context, full handshake:', dt,
+                                                    dt * 1000 / args.count))
+
+    dt = await client_connects(svr, args.count)
+    st = tls.stats()
+    print("%-28s %7.3fs  %6.2fms each  (%d of %d resumed)" % ('StratumClient.connect():', dt,
+                                    dt * 1000 / args.count, st['resumed'], st['handshakes']))
+
+    await svr.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark TLS session resumption')
+    parser.add_argument('--count', default=200, type=int,
+                        help='Number of connections to make')
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
+
+# EOF
@@ -0,0 +1,73 @@
+#! /usr/bin/env python3
+#
+# How long does a wallet take to get all its transactions at startup: from the
+# network (cold), or mostly from a TxStore on disk (warm)?
+#
+#   python3 testing/bench_txstore.py [--count 20000] [--latency 0.002]
+#
+import sys, os, time, asyncio, argparse, random, tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from connectrum.client import StratumClient
+from connectrum.txstore import TxStore
+from fake_server import FakeElectrumServer
+
+WINDOW = 200        # requests outstanding at once
+
+async def sync(svr, txids, store_path):
+    # what a wallet would do on startup
+    t = time.perf_counter()
+
+    store = TxStore(store_path) if store_path else None
+    conn = StratumClient(txstore=store)
+    await conn.connect(svr.server_info(), 't', short_term=True)
+
+    for pos in range(0, len(txids), WINDOW):
+        await asyncio.gather(*[conn.RPC('blockchain.transaction.get', txid)
+                                        for txid in txids[pos:pos+WINDOW]])
+
+    dt = time.perf_counter() - t
+    conn.close()
+    if store:
+        store.close()
+
+    return dt
+
+async def main(args):
+    svr = await FakeElectrumServer(latency=args.latency).start()
+
+    txids = [svr.add_tx(os.urandom(random.randint(200, 600))) for _ in range(args.count)]
+    print("%d transactions, %.1f ms server latency\n" % (args.count, args.latency*1000))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = svr.requests
+        dt = await sync(svr, txids, None)
+        print("no store:        %7.3fs  %6d requests" % (dt, svr.requests - before))
+
+        before = svr.requests
+        dt = await sync(svr, txids, tmp)
+        print("cold store:      %7.3fs  %6d requests" % (dt, svr.requests - before))
+
+        before = svr.requests
+        dt = await sync(svr, txids, tmp)
+        print("warm store:      %7.3fs  %6d requests" % (dt, svr.requests - before))
+
+        # more history arrived while we were down
+        txids += [svr.add_tx(os.urandom(300)) for _ in range(args.count // 10)]
+        before = svr.requests
+        dt = await sync(svr, txids, tmp)
+        print("warm + 10%% new:  %7.3fs  %6d requests" % (dt, svr.requests - before))
+
+    await svr.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark TxStore cold vs. warm start')
+    parser.add_argument('--count', default=20000, type=int,
+                        help='Number of transactions in the wallet')
+    parser.add_argument('--latency', default=0.002, type=float,
+                        help='Server response time (seconds)')
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
+
+# EOF
@@ -0,0 +1,9 @@
+#
+# py.test setup: find connectrum in this checkout, and fake_server next to us.
+#
+import sys, os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+# EOF
@@ -0,0 +1,339 @@
+#! /usr/bin/env python3
+#
+# A stand-in Electrum server, good enough to exercise the client library
+# and run benchmarks without touching the public network.
+#
+# Knows a fake (but properly linked) chain of headers, some transactions and
+# scripthash histories, and will push notifications to subscribers. Handles
+# batches. Can be made slow or unreliable on purpose.
+#
+#   python3 testing/fake_server.py [--port 50001]
+#
+import sys, os, asyncio, json, struct, argparse, random, ssl, subprocess, tempfile
+from hashlib import sha256
+import logging
+
+logger = logging.getLogger('fake_server')
+
+def dsha256(b):
+    return sha256(sha256(b).digest()).digest()
+
+def status_of(history):
+    # electrum's "status" of a scripthash, or None if no history
+    if not history:
+        return None
+    pre = ''.join('%s:%d:' % (h['tx_hash'], h['height']) for h in history)
+    return sha256(pre.encode('ascii')).hexdigest()
+
+
+class FakeChain:
+    '''
+        A chain of 80-byte headers, linked by hash. Changing the salt
+        for a range of heights makes a reorg.
+    '''
+    def __init__(self, height=1000):
+        self.salts = {}
+        self.headers = []
+        self.extend_to(height)
+
+    @property
+    def height(self):
+        return len(self.headers) - 1
+
+    def _make(self, h):
+        prev = dsha256(self.headers[h-1]) if h else bytes(32)
+        merkle = sha256(b'%d/%d' % (h, self.salts.get(h, 0))).digest()
+        return struct.pack('<I32s32sIII', 0x20000000, prev, merkle,
+                                                1231006505 + 600*h, 0x1d00ffff, h)
+
+    def extend_to(self, height):
+        while len(self.headers) <= height:
+            self.headers.append(self._make(len(self.headers)))
+
+    def reorg(self, depth, salt=1):
+        # replace the top few blocks
+        first = self.height - depth + 1
+        for h in range(first, self.height+1):
+            self.salts[h] = salt
+        del self.headers[first:]
+        self.extend_to(first + depth - 1)
+
+    def tip(self):
+        return {'height': self.height, 'hex': self.headers[-1].hex()}
+
+
+class FakeSession(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.buf = bytearray()
+        self.subs = set()       # (method, key)
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.sessions.add(self)
+
+    def connection_lost(self, exc):
+        self.server.sessions.discard(self)
+
+    def send(self, obj):
+        if self.transport and not self.transport.is_closing():
+            data = json.dumps(obj, separators=(',', ':')).encode()
+            self.server.bytes_out += len(data) + 1
+            self.transport.write(data + b'\n')
+
+    def data_received(self, data):
+        self.buf += data
+        while 1:
+            nl = self.buf.find(b'\n')
+            if nl < 0: break
+            line = bytes(self.buf[:nl])
+            del self.buf[:nl+1]
+            if line.strip():
+                self.handle(json.loads(line))
+
+    def handle(self, msg):
+        srv = self.server
+        if srv.drop_after is not None:
+            srv.drop_after -= 1
+            if srv.drop_after < 0:
+                srv.drop_after = None
+                self.transport.abort()
+                return
+
+        if isinstance(msg, list):
+            srv.requests += len(msg)
+            reply = [self.answer(m) for m in msg]
+            self.later(reply)
+        else:
+            srv.requests += 1
+            self.later(self.answer(msg))
+
+    def later(self, reply):
+        delay = self.server.latency
+        if callable(delay):
+            delay = delay()
+        if delay:
+            asyncio.get_running_loop().call_later(delay, self.send, reply)
+        else:
+            self.send(reply)
+
+    def answer(self, msg):
+        method = msg['method']
+        params = msg.get('params', [])
+        srv = self.server
+        srv.methods[method] = srv.methods.get(method, 0) + 1
+
+        try:
+            fn = getattr(srv, 'rpc_' + method.replace('.', '_'))
+            result = fn(self, *params)
+        except AttributeError:
+            return {'jsonrpc': '2.0', 'id': msg['id'],
+                        'error': {'code': -32601, 'message': 'unknown method "%s"' % method}}
+        except Exception as exc:
+            return {'jsonrpc': '2.0', 'id': msg['id'],
+                        'error': {'code': 1, 'message': str(exc)}}
+
+        if srv.id_first:
+            return {'id': msg['id'], 'jsonrpc': '2.0', 'result': result}
+        return {'jsonrpc': '2.0', 'result': result, 'id': msg['id']}
+
+
+class FakeElectrumServer:
+    '''
+        Listens on host:port (port=0 for any) and answers like an ElectrumX would.
+    '''
+    def __init__(self, host='127.0.0.1', port=0, *, height=1000, latency=0,
+                        peers=(), version='FakeElectrum 1.0', id_first=False, ssl=None):
+        self.host = host
+        self.port = port
+        self.ssl = ssl                      # server SSLContext, see self_signed_context()
+        self.chain = FakeChain(height)
+        self.latency = latency              # seconds, or a function giving seconds
+        self.peers = list(peers)            # as in server.peers.subscribe response
+        self.version = version
+        self.id_first = id_first            # put "id" before "result" in responses
+        self.drop_after = None              # abort connection after this many more requests
+
+        self.txns = {}                      # txid => raw hex
+        self.histories = {}                 # scripthash => list of {tx_hash, height}
+        self.mempool = {}                   # scripthash => list of {tx_hash, height, fee}
+        self.utxos = {}                     # scripthash => list for listunspent
+
+        self.sessions = set()
+        self.requests = 0
+        self.bytes_out = 0
+        self.methods = {}
+        self._server = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: FakeSession(self),
+                                                        self.host, self.port, ssl=self.ssl)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self.kill_sessions()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def kill_sessions(self):
+        for s in list(self.sessions):
+            s.transport.abort()
+
+    def server_info(self, proto_code=None):
+        # how a client would find us
+        from connectrum.svr_info import ServerInfo
+        proto_code = proto_code or ('s' if self.ssl else 't')
+        return ServerInfo(self.host, self.host, '%s%d' % (proto_code, self.port))
+
+    # -- data setup --
+
+    def add_tx(self, raw):
+        from connectrum.txstore import txid_of
+        if isinstance(raw, str):
+            raw = bytes.fromhex(raw)
+        txid = txid_of(raw)
+        self.txns[txid] = raw.hex()
+        return txid
+
+    def set_history(self, sh, history, mempool=None, notify=True):
+        self.histories[sh] = list(history)
+        if mempool is not None:
+            self.mempool[sh] = list(mempool)
+        if notify:
+            self.notify_scripthash(sh)
+
+    def full_history(self, sh):
+        return self.histories.get(sh, []) + self.mempool.get(sh, [])
+
+    def notify_scripthash(self, sh):
+        params = [sh, status_of(self.full_history(sh))]
+        self.notify('blockchain.scripthash.subscribe', sh, params)
+
+    def new_block(self, count=1):
+        self.chain.extend_to(self.chain.height + count)
+        self.notify('blockchain.headers.subscribe', None, [self.chain.tip()])
+
+    def notify(self, method, key, params):
+        for s in list(self.sessions):
+            if (method, key) in s.subs:
+                s.send({'jsonrpc': '2.0', 'method': method, 'params': params})
+
+    # -- RPC methods --
+
+    def rpc_server_version(self, sess, client_name=None, proto=None):
+        return [self.version, '1.4']
+
+    def rpc_server_ping(self, sess):
+        return None
+
+    def rpc_server_banner(self, sess):
+        return 'Welcome to a fake server'
+
+    def rpc_server_features(self, sess):
+        return {'server_version': self.version, 'protocol_max': '1.4',
+                    'protocol_min': '1.4', 'pruning': None, 'hash_function': 'sha256'}
+
+    def rpc_server_peers_subscribe(self, sess):
+        return self.peers
+
+    def rpc_blockchain_headers_subscribe(self, sess):
+        sess.subs.add(('blockchain.headers.subscribe', None))
+        return self.chain.tip()
+
+    def rpc_blockchain_block_header(self, sess, height, cp_height=0):
+        return self.chain.headers[height].hex()
+
+    def rpc_blockchain_block_headers(self, sess, start, count, cp_height=0):
+        count = min(count, 2016)
+        hdrs = self.chain.headers[start:start+count]
+        return {'count': len(hdrs), 'hex': b''.join(hdrs).hex(), 'max': 2016}
+
+    def rpc_blockchain_transaction_get(self, sess, txid, verbose=False):
+        try:
+            return self.txns[txid]
+        except KeyError:
+            raise ValueError('no such mempool or blockchain transaction')
+
+    def rpc_blockchain_scripthash_subscribe(self, sess, sh):
+        sess.subs.add(('blockchain.scripthash.subscribe', sh))
+        return status_of(self.full_history(sh))
+
+    def rpc_blockchain_scripthash_unsubscribe(self, sess, sh):
+        key = ('blockchain.scripthash.subscribe', sh)
+        rv = key in sess.subs
+        sess.subs.discard(key)
+        return rv
+
+    def rpc_blockchain_scripthash_get_history(self, sess, sh):
+        return self.full_history(sh)
+
+    def rpc_blockchain_scripthash_get_mempool(self, sess, sh):
+        return self.mempool.get(sh, [])
+
+    def rpc_blockchain_scripthash_get_balance(self, sess, sh):
+        value = sum(u['value'] for u in self.utxos.get(sh, []))
+        return {'confirmed': value, 'unconfirmed': 0}
+
+    def rpc_blockchain_scripthash_listunspent(self, sess, sh):
+        return self.utxos.get(sh, [])
+
+
+def self_signed_context(hostname='127.0.0.1'):
+    '''
+        Server SSLContext with a throw-away self-signed certificate (needs
+        the openssl command). Clients must connect with disable_cert_verify.
+    '''
+    tmp = tempfile.mkdtemp()
+    cert, key = os.path.join(tmp, 'cert.pem'), os.path.join(tmp, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '2',
+                        '-subj', '/CN=%s' % hostname, '-keyout', key, '-out', cert],
+                    check=True, capture_output=True)
+
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+    return ctx
+
+
+async def start_fleet(count, *, first_ip=2, port=50001, **kws):
+    '''
+        Start a number of servers on 127.0.0.x addresses, all on the same
+        port, so each gets a distinct "hostname". Every server knows
+        about a few of the others, like the real peer network.
+    '''
+    hosts = ['127.0.0.%d' % (first_ip + i) for i in range(count)]
+    fleet = []
+    for i, h in enumerate(hosts):
+        peers = [[p, p, ['v1.4', 't%d' % port]]
+                    for p in random.sample(hosts, min(count, 4)) if p != h]
+        # make sure the graph is connected
+        nxt = hosts[(i+1) % count]
+        if nxt != h:
+            peers.append([nxt, nxt, ['v1.4', 't%d' % port]])
+        fleet.append(await FakeElectrumServer(h, port, peers=peers, **kws).start())
+    return fleet
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a stand-in Electrum server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', default=50001, type=int)
+    parser.add_argument('--height', default=1000, type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    loop = asyncio.get_event_loop()
+    svr = loop.run_until_complete(FakeElectrumServer(args.host, args.port,
+                                                height=args.height).start())
+    print("Listening on %s:%d (TCP)" % (svr.host, svr.port))
+    loop.run_forever()
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+    main()
+
+# EOF
@@ -0,0 +1,86 @@
+#
+# Address to scripthash conversion: the BIP173/BIP350 test vectors, and a
+# few base58 ones.
+#
+import pytest
+
+from connectrum.address import address_script, address_to_scripthash, addresses_to_scripthashes
+
+# from BIP350 (which replaces BIP173's list for v1+)
+VALID_SEGWIT = [
+    ('BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4',
+        '0014751e76e8199196d454941c45d1b3a323f1433bd6'),
+    ('tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sl5k7',
+        '00201863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262'),
+    ('bc1pw508d6qejxtdg4y5r3zarvary0c5xw7kw508d6qejxtdg4y5r3zarvary0c5xw7kt5nd6y',
+        '5128751e76e8199196d454941c45d1b3a323f1433bd6751e76e8199196d454941c45d1b3a323f1433bd6'),
+    ('BC1SW50QGDZ25J', '6002751e'),
+    ('bc1zw508d6qejxtdg4y5r3zarvaryvaxxpcs', '5210751e76e8199196d454941c45d1b3a323'),
+    ('tb1qqqqqp399et2xygdj5xreqhjjvcmzhxw4aywxecjdzew6hylgvsesrxh6hy',
+        '0020000000c4a5cad46221b2a187905e5266362b99d5e91c6ce24d165dab93e86433'),
+    ('tb1pqqqqp399et2xygdj5xreqhjjvcmzhxw4aywxecjdzew6hylgvsesf3hn0c',
+        '5120000000c4a5cad46221b2a187905e5266362b99d5e91c6ce24d165dab93e86433'),
+    ('bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0',
+        '512079be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798'),
+]
+
+INVALID_SEGWIT = [
+    # BIP173
+    'tc1qw508d6qejxtdg4y5r3zarvary0c5xw7kg3g4ty',        # unknown hrp
+    'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t5',        # bad checksum
+    'BC13W508D6QEJXTDG4Y5R3ZARVARY0C5XW7KN40WF2',        # witness version 17
+    'bc1rw5uspcuh',                                      # program too short
+    'bc10w508d6qejxtdg4y5r3zarvary0c5xw7kw508d6qejxtdg4y5r3zarvary0c5xw7kw5rljs90',
+    'BC1QR508D6QEJXTDG4Y5R3ZARVARYV98GJ9P',              # v0, 16 bytes
+    'tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3q0sL5k7',   # mixed case
+    'bc1zw508d6qejxtdg4y5r3zarvaryvqyzf3du',             # padding too long
+    'tb1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3pjxtptv',   # non-zero padding
+    'bc1gmk9yu',                                         # empty data
+    # BIP350
+    'tc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vq5zuyut',   # unknown hrp
+    'bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqh2y7hd',   # bech32 for v1
+    'tb1z0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqglt7rf',
+    'BC1S0XLXVLHEMJA6C4DQV22UAPCTQUPFHLXM9H8Z3K2E72Q4K9HCZ7VQ54WELL',
+    'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kemeawh',        # bech32m for v0
+    'tb1q0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vq24jc47',
+    'bc1p38j9r5y49hruaue7wxjce0updqjuyyx0kh56v8s25huc6995vvpql3jow4',   # 'o' isn't bech32
+    'BC130XLXVLHEMJA6C4DQV22UAPCTQUPFHLXM9H8Z3K2E72Q4K9HCZ7VQ7ZWS8R',   # witness version 17
+    'bc1pw5dgrnzv',                                      # program too short
+    'bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7v8n0nx0muaewav253zgeav',
+    'BC1QR508D6QEJXTDG4Y5R3ZARVARYV98GJ9P',
+    'tb1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vq47Zagq',   # mixed case
+    'bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7v07qwwzcrf', # padding too long
+    'tb1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vpggkg4j',   # non-zero padding
+]
+
+@pytest.mark.parametrize('addr, script', VALID_SEGWIT)
+def test_segwit(addr, script):
+    assert address_script(addr).hex() == script
+
+@pytest.mark.parametrize('addr', INVALID_SEGWIT)
+def test_segwit_invalid(addr):
+    with pytest.raises(ValueError):
+        address_script(addr)
+
+def test_base58():
+    # P2PKH and P2SH
+    assert address_script('1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2').hex() \
+                == '76a91477bff20c60e522dfaa3350c39b030a5d004e839a88ac'
+    assert address_script('3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy').hex() \
+                == 'a914b472a266d0bd89c13706a4132ccfb16f7c3b9fcb87'
+
+    for bad in ['1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN3',      # bad checksum
+                '1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN0',      # '0' isn't base58
+                '1BvBMSEYstWetqTFn5Au4m4GFg7xJaNV',        # too short
+                '']:
+        with pytest.raises(ValueError):
+            address_script(bad)
+
+def test_scripthash():
+    # the example from the Electrum protocol docs (genesis coinbase address)
+    genesis = '1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa'
+    sh = '8b01df4e368ea28f8dc0423bcf7a4923e3a12d307c875e47a0cfbf90b5c39161'
+    assert address_to_scripthash(genesis) == sh
+    assert addresses_to_scripthashes([genesis, genesis]) == [sh, sh]
+
+# EOF
@@ -0,0 +1,96 @@
+#
+# ResponseCache: what is kept, and for how long.
+#
+import asyncio
+import pytest
+
+from connectrum import cache as cache_mod
+from connectrum.cache import ResponseCache
+from connectrum.client import StratumClient
+from fake_server import FakeElectrumServer
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(cache_mod, 'time', c)
+    return c
+
+def test_forever(clock):
+    c = ResponseCache()
+    c.put('blockchain.transaction.get', ['ab'*32], 'rawtx')
+    clock.now += 1e6
+    assert c.get('blockchain.transaction.get', ['ab'*32]) == (True, 'rawtx')
+
+def test_tip_not_following(clock):
+    # nothing subscribed to headers: we'd never hear of a new block
+    c = ResponseCache(tip_ttl=30)
+    c.put('blockchain.estimatefee', [6], 0.0001)
+    c.put('blockchain.block.header', [990], 'hdr')
+    c.put('blockchain.transaction.get', ['ab'*32, True], dict(confirmations=1))
+
+    assert c.get('blockchain.estimatefee', [6]) == (True, 0.0001)
+    clock.now += 31
+    assert c.get('blockchain.estimatefee', [6]) == (False, None)
+    assert c.get('blockchain.block.header', [990]) == (False, None)
+    assert c.get('blockchain.transaction.get', ['ab'*32, True]) == (False, None)
+
+def test_tip_following(clock):
+    c = ResponseCache(tip_ttl=30)
+    c.put('blockchain.headers.subscribe', [], dict(height=1000, hex='00'))
+    c.put('blockchain.estimatefee', [6], 0.0001)
+    c.put('blockchain.block.header', [998], 'recent')
+    c.put('blockchain.block.header', [900], 'deep')
+
+    # kept until the next block
+    clock.now += 1e6
+    assert c.get('blockchain.estimatefee', [6]) == (True, 0.0001)
+
+    c.notify('blockchain.headers.subscribe', [dict(height=1001, hex='00')])
+    assert c.get('blockchain.estimatefee', [6]) == (False, None)
+    assert c.get('blockchain.block.header', [998]) == (False, None)
+    assert c.get('blockchain.block.header', [900]) == (True, 'deep')
+
+def test_scripthash(clock):
+    sh = 'cd'*32
+    c = ResponseCache(unwatched_ttl=30)
+    c.put('blockchain.scripthash.get_balance', [sh], dict(confirmed=1))
+    clock.now += 31
+    assert c.get('blockchain.scripthash.get_balance', [sh]) == (False, None)
+
+    c.put('blockchain.scripthash.subscribe', [sh], None)
+    c.put('blockchain.scripthash.get_balance', [sh], dict(confirmed=1))
+    clock.now += 1e6
+    assert c.get('blockchain.scripthash.get_balance', [sh]) == (True, dict(confirmed=1))
+
+    c.notify('blockchain.scripthash.subscribe', [sh, 'status'])
+    assert c.get('blockchain.scripthash.get_balance', [sh]) == (False, None)
+
+def test_client_recent_header():
+    # without a headers subscription, recent headers aren't kept for good
+    async def doit():
+        svr = await FakeElectrumServer().start()
+        conn = StratumClient(cache=ResponseCache(tip_ttl=0.05), metrics=False,
+                                auto_reconnect=False)
+        await conn.connect(svr.server_info(), 't', short_term=True)
+
+        await conn.RPC('blockchain.block.header', 999)
+        await conn.RPC('blockchain.block.header', 999)
+        assert svr.methods['blockchain.block.header'] == 1
+
+        await asyncio.sleep(0.1)
+        await conn.RPC('blockchain.block.header', 999)
+        assert svr.methods['blockchain.block.header'] == 2
+
+        conn.close()
+        await svr.close()
+
+    asyncio.run(doit())
+
+# EOF
@@ -0,0 +1,85 @@
+#
+# StratumClient basics against the stand-in server: requests, and the
+# max_inflight window.
+#
+import asyncio
+
+from connectrum.client import StratumClient
+from fake_server import FakeElectrumServer
+
+def run(coro, timeout=20):
+    # fail, rather than hang
+    asyncio.run(asyncio.wait_for(coro, timeout))
+
+def test_rpc():
+    async def doit():
+        svr = await FakeElectrumServer().start()
+        conn = StratumClient(metrics=False, auto_reconnect=False)
+        await conn.connect(svr.server_info(), 't', short_term=True)
+
+        assert conn.server_version == 'FakeElectrum 1.0'
+        assert await conn.RPC('blockchain.block.header', 3) == svr.chain.headers[3].hex()
+        assert not conn.inflight
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+def test_window():
+    async def doit():
+        svr = await FakeElectrumServer(latency=0.05).start()
+        conn = StratumClient(metrics=False, auto_reconnect=False, max_inflight=2)
+        await conn.connect(svr.server_info(), 't', short_term=True)
+        before = svr.requests
+
+        futs = [conn.RPC('blockchain.block.header', n) for n in range(10)]
+        await asyncio.sleep(0.02)
+        assert svr.requests - before == 2
+        assert conn.waiters == 8
+
+        rv = await asyncio.gather(*futs)
+        assert rv == [h.hex() for h in svr.chain.headers[:10]]
+        assert not conn.sent and not conn.waiting
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+def test_window_before_connect():
+    # requests made before connecting don't hold up the handshake
+    async def doit():
+        svr = await FakeElectrumServer().start()
+        conn = StratumClient(metrics=False, auto_reconnect=False, max_inflight=2)
+
+        futs = [conn.RPC('blockchain.block.header', n) for n in range(3)]
+        await conn.connect(svr.server_info(), 't', short_term=True)
+
+        rv = await asyncio.gather(*futs)
+        assert rv == [h.hex() for h in svr.chain.headers[:3]]
+        assert not conn.sent
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+def test_window_auto_batch():
+    async def doit():
+        svr = await FakeElectrumServer().start()
+        conn = StratumClient(metrics=False, auto_reconnect=False, max_inflight=3,
+                                auto_batch=True)
+        await conn.connect(svr.server_info(), 't', short_term=True)
+
+        futs = [conn.RPC('blockchain.block.header', n) for n in range(10)]
+        assert len(conn.outbox) == 3
+        rv = await asyncio.gather(*futs)
+        assert rv == [h.hex() for h in svr.chain.headers[:10]]
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+# EOF
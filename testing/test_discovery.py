@@ -0,0 +1,49 @@
+#
+# PeerCrawler over a fleet of stand-in servers.
+#
+import asyncio
+
+from connectrum.discovery import PeerCrawler
+from connectrum.svr_info import KnownServers
+from fake_server import start_fleet
+
+PORT = 51101
+
+def run(coro, timeout=20):
+    # fail, rather than hang
+    asyncio.run(asyncio.wait_for(coro, timeout))
+
+async def setup(count, **kws):
+    fleet = await start_fleet(count, port=PORT)
+    ks = KnownServers()
+    ks.add_single(fleet[0].host, 't%d' % PORT)
+    return fleet, ks, PeerCrawler(ks, 't', connect_timeout=2, peers_timeout=2, **kws)
+
+def test_crawl():
+    async def doit():
+        fleet, ks, crawler = await setup(6)
+
+        stats = await crawler.crawl()
+        assert stats['connected'] == 6 and stats['failed'] == 0
+        assert sorted(ks) == sorted(s.host for s in fleet)
+
+        for s in fleet:
+            await s.close()
+
+    run(doit())
+
+def test_bad_peers(tmp_path):
+    # junk from one server, or trouble saving, doesn't stop the crawl
+    async def doit():
+        fleet, ks, crawler = await setup(4, workers=2, save_as=str(tmp_path), save_every=1)
+        fleet[0].peers.append(5)
+
+        stats = await crawler.crawl()
+        assert stats['tried'] == 4
+
+        for s in fleet:
+            await s.close()
+
+    run(doit())
+
+# EOF
@@ -0,0 +1,183 @@
+#
+# StratumClientPool against a few stand-in servers: routing, replacing
+# members that die, and hedging slow requests.
+#
+import asyncio, time
+import pytest
+
+from connectrum import pool as pool_mod
+from connectrum.pool import StratumClientPool
+from connectrum.svr_info import KnownServers
+from fake_server import start_fleet
+
+PORT = 51001
+
+def run(coro, timeout=20):
+    # fail, rather than hang, if the pool gets stuck
+    asyncio.run(asyncio.wait_for(coro, timeout))
+
+async def setup(count, size, **kws):
+    fleet = await start_fleet(count, port=PORT)
+    ks = KnownServers()
+    for s in fleet:
+        ks.add_single(s.host, 't%d' % PORT)
+
+    pool = StratumClientPool(ks, size=size, proto_code='t', short_term=True, **kws)
+    await pool.connect()
+    return fleet, pool
+
+async def teardown(fleet, pool):
+    pool.close()
+    for s in fleet:
+        await s.close()
+
+def server_for(fleet, member):
+    return [s for s in fleet if s.host == str(member.server_info)][0]
+
+async def wait_for_members(pool, count, timeout=5):
+    t = time.monotonic()
+    while len(pool.members) != count:
+        assert time.monotonic() - t < timeout, "pool has %d members" % len(pool.members)
+        await asyncio.sleep(0.02)
+
+def test_least_loaded():
+    async def doit():
+        fleet, pool = await setup(3, 3)
+        assert len(pool.members) == 3
+
+        rv = await asyncio.gather(*[pool.RPC('blockchain.block.header', n) for n in range(300)])
+        assert rv[10] == fleet[0].chain.headers[10].hex()
+
+        # spread over all of them
+        counts = [s.methods.get('blockchain.block.header', 0) for s in fleet]
+        assert sum(counts) == 300
+        assert min(counts) >= 50, counts
+
+        await teardown(fleet, pool)
+
+    run(doit())
+
+def test_fastest():
+    async def doit():
+        fleet, pool = await setup(3, 3, route='fastest')
+        slow = server_for(fleet, pool.members[0])
+        slow.latency = 0.05
+
+        for n in range(30):
+            await pool.RPC('blockchain.block.header', n)
+
+        before = slow.requests
+        for n in range(60):
+            await pool.RPC('blockchain.block.header', n)
+
+        # once it's known to be slow, it's left alone
+        assert slow.requests == before
+        assert pool.latency[pool.members[0]] > max(pool.latency[m] for m in pool.members[1:])
+
+        await teardown(fleet, pool)
+
+    run(doit())
+
+def test_batch_not_timed():
+    # a big batch takes a while, but that's not the member's response time
+    async def doit():
+        fleet, pool = await setup(2, 2)
+
+        rv = await pool.batch_rpc([('blockchain.block.header', n) for n in range(500)])
+        assert len(rv) == 500
+        assert not pool.samples
+        assert all(v is None for v in pool.latency.values())
+
+        await pool.RPC('server.ping')
+        assert len(pool.samples) == 1
+
+        await teardown(fleet, pool)
+
+    run(doit())
+
+def test_replace_member():
+    async def doit():
+        fleet, pool = await setup(4, 3)
+        victim = pool.members[0]
+        spare = [s for s in fleet if s.host not in [str(m.server_info) for m in pool.members]][0]
+
+        server_for(fleet, victim).kill_sessions()
+        await asyncio.sleep(0.05)
+        await wait_for_members(pool, 3)
+
+        hosts = [str(m.server_info) for m in pool.members]
+        assert str(victim.server_info) not in hosts
+        assert spare.host in hosts
+        assert str(victim.server_info) in pool.failed
+
+        assert await pool.RPC('server.ping') is None
+
+        await teardown(fleet, pool)
+
+    run(doit())
+
+def test_all_members_lost(monkeypatch):
+    # network blip: every member drops, and every server is "failed"
+    monkeypatch.setattr(pool_mod, 'RETRY_DELAY', 0.5)
+
+    async def doit():
+        fleet, pool = await setup(2, 2, connect_timeout=5)
+
+        for s in fleet:
+            s.kill_sessions()
+        await asyncio.sleep(0.05)
+        assert not pool.members
+
+        # waits for the servers to be tried again
+        assert await pool.RPC('server.ping') is None
+        await wait_for_members(pool, 2)
+
+        await teardown(fleet, pool)
+
+    run(doit())
+
+def test_no_servers_left():
+    async def doit():
+        fleet, pool = await setup(2, 2, connect_timeout=0.3)
+
+        for s in fleet:
+            await s.close()
+        await asyncio.sleep(0.05)
+        assert not pool.members
+
+        # doesn't wait forever
+        with pytest.raises(RuntimeError):
+            await pool.RPC('server.ping')
+        assert pool._refill is not None
+
+        await teardown([], pool)
+
+    run(doit())
+
+def test_hedging():
+    async def doit():
+        fleet, pool = await setup(2, 2, hedge_percentile=95)
+        slow = server_for(fleet, pool.members[0])
+        slow.latency = 2.0
+
+        # one goes to each member; the slow one is hedged to the other
+        t = time.monotonic()
+        rv = await asyncio.gather(*[pool.RPC('blockchain.block.header', n) for n in (5, 6)])
+        assert time.monotonic() - t < 1.5
+        assert rv == [fleet[0].chain.headers[n].hex() for n in (5, 6)]
+
+        assert pool.hedge_counts['fired'] == 1
+        assert pool.hedge_counts['won'] == 1
+
+        # loser was cancelled, and forgotten
+        await asyncio.sleep(0)
+        assert all(not m.inflight for m in pool.members)
+
+        # not for requests that change things
+        assert not pool_mod.can_hedge('blockchain.transaction.broadcast')
+
+        await teardown(fleet, pool)
+
+    run(doit())
+
+# EOF
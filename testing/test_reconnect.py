@@ -0,0 +1,182 @@
+#
+# StratumClient coming back after the connection drops: replaying requests,
+# backing off, and servers that misbehave while we reconnect.
+#
+import asyncio, time
+import pytest
+
+from connectrum import client as client_mod
+from connectrum.client import StratumClient
+from connectrum.exc import ConnectionLost
+from fake_server import FakeElectrumServer
+
+SH = 'ab' * 32
+
+def run(coro, timeout=20):
+    # fail, rather than hang
+    asyncio.run(asyncio.wait_for(coro, timeout))
+
+async def setup(**kws):
+    svr = await FakeElectrumServer().start()
+    svr.set_history(SH, [dict(tx_hash='%064x' % n, height=n) for n in range(100)], notify=False)
+
+    kws.setdefault('reconnect_delay', (0.05, 0.2))
+    conn = StratumClient(metrics=True, **kws)
+    await conn.connect(svr.server_info(), 't', short_term=True)
+    return svr, conn
+
+def test_replay():
+    async def doit():
+        svr, conn = await setup(max_inflight=4)
+        svr.latency = 0.2
+
+        futs = [conn.RPC('blockchain.scripthash.get_history', SH) for _ in range(3)]
+        fut2 = conn.RPC('blockchain.transaction.broadcast', '00')
+        await asyncio.sleep(0.05)
+        svr.latency = 0
+        svr.kill_sessions()
+
+        # read-only ones are sent again (and the window isn't full of the
+        # old connection's requests), others fail
+        rv = await asyncio.gather(*futs)
+        assert rv == [svr.histories[SH]] * 3
+        with pytest.raises(ConnectionLost):
+            await fut2
+
+        assert conn.metrics.connects == 2
+        assert not conn.sent and not conn.replays
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+def test_poison_request():
+    # answer is too big for us, and kills the connection each time
+    async def doit():
+        svr, conn = await setup(max_frame=2000)
+
+        t = time.monotonic()
+        with pytest.raises(ConnectionLost):
+            await conn.RPC('blockchain.scripthash.get_history', SH)
+
+        assert svr.methods['blockchain.scripthash.get_history'] == 1 + client_mod.MAX_REPLAYS
+        assert conn.metrics.connects == 1 + client_mod.MAX_REPLAYS
+
+        # and we waited between tries, even though each connect worked
+        assert time.monotonic() - t >= 0.05 / 2 + 0.1 / 2
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+def test_backoff_reset(monkeypatch):
+    monkeypatch.setattr(client_mod, 'STABLE_CONNECTION', 0.1)
+
+    async def doit():
+        svr, conn = await setup()
+        conn.backoff = 0.2
+
+        # a connection that lasted is a good one: straight back
+        await asyncio.sleep(0.15)
+        svr.kill_sessions()
+        await asyncio.sleep(0.01)
+        assert await conn.RPC('server.ping') is None
+        assert conn.backoff == 0
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+def test_handshake_timeout():
+    # server accepts the connection, but never answers server.version
+    async def doit():
+        svr, conn = await setup(reconnect_timeout=0.1)
+
+        svr.latency = 100
+        fut = conn.RPC('blockchain.scripthash.get_history', SH)
+        await asyncio.sleep(0.01)
+        svr.kill_sessions()
+
+        # keeps trying
+        await asyncio.sleep(0.5)
+        assert not fut.done()
+        assert conn.reconnecting and not conn.reconnecting.done()
+        assert svr.methods['server.version'] >= 3
+
+        # server is back to normal
+        svr.latency = 0
+        assert await fut == svr.histories[SH]
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+def test_handshake_error():
+    # server answers server.version with an error
+    async def doit():
+        svr, conn = await setup()
+
+        def refuse(sess, *args):
+            raise ValueError("go away")
+        svr.rpc_server_version = refuse
+        svr.latency = 0.05
+
+        fut = conn.RPC('blockchain.scripthash.get_history', SH)
+        await asyncio.sleep(0.01)
+        svr.kill_sessions()
+        await asyncio.sleep(0.3)
+        assert not fut.done()
+        assert conn.reconnecting and not conn.reconnecting.done()
+        assert svr.methods['server.version'] >= 3
+
+        del svr.rpc_server_version
+        svr.latency = 0
+        assert await fut == svr.histories[SH]
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+def test_closed():
+    # after close(), nothing is sent, and nobody waits for an answer
+    async def doit():
+        svr, conn = await setup()
+        conn.close()
+
+        for fut in [conn.RPC('server.ping'),
+                    conn.subscribe('blockchain.headers.subscribe')[0],
+                    conn.batch_rpc([('server.ping',), ('server.ping',)])]:
+            with pytest.raises(ConnectionLost):
+                await fut
+        assert not conn.inflight and not conn.unsent
+        assert not conn.reconnecting
+
+        await svr.close()
+
+    run(doit(), timeout=2)
+
+def test_subscribe_before_connect():
+    # subscribed before we were connected: asked for once, not "again" as well
+    async def doit():
+        svr = await FakeElectrumServer().start()
+        conn = StratumClient(metrics=False)
+
+        fut, sub = conn.subscribe('blockchain.headers.subscribe')
+        await conn.connect(svr.server_info(), 't')
+
+        assert (await fut)['height'] == len(svr.chain.headers) - 1
+        await asyncio.sleep(0.05)
+        assert svr.methods['blockchain.headers.subscribe'] == 1
+        assert sub.empty()
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+# EOF
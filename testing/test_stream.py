@@ -0,0 +1,86 @@
+#
+# RPC_stream(): list results decoded item by item, and only for the right request.
+#
+import asyncio
+import pytest
+
+from connectrum.client import StratumClient
+from fake_server import FakeElectrumServer
+
+SH_A = 'aa' * 32
+SH_B = 'bb' * 32
+
+def history(count, salt):
+    return [dict(tx_hash='%02x' % salt * 32, height=n) for n in range(count)]
+
+async def setup(**kws):
+    svr = await FakeElectrumServer(**kws).start()
+    svr.set_history(SH_A, history(5000, 0xa), notify=False)
+    svr.set_history(SH_B, history(3000, 0xb), notify=False)
+
+    conn = StratumClient(metrics=False, auto_reconnect=False)
+    await conn.connect(svr.server_info(), 't', short_term=True)
+    return svr, conn
+
+@pytest.mark.parametrize('id_first', [False, True])
+def test_streamed(id_first):
+    async def doit():
+        svr, conn = await setup(id_first=id_first)
+
+        stream = conn.RPC_stream('blockchain.scripthash.get_history', SH_A)
+        got = [item async for item in stream]
+        assert got == svr.histories[SH_A]
+        assert stream.streamed
+
+        conn.close()
+        await svr.close()
+
+    asyncio.run(doit())
+
+def test_cancelled_answer_not_streamed():
+    # answer to a cancelled request arrives while a stream is the only thing
+    # outstanding; with the id last, it must not be mistaken for the stream's
+    async def doit():
+        svr, conn = await setup(latency=0.1)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(conn.RPC('blockchain.scripthash.get_history', SH_A), 0.02)
+
+        stream = conn.RPC_stream('blockchain.scripthash.get_history', SH_B)
+        got = [item async for item in stream]
+        assert got == svr.histories[SH_B]
+        assert not conn.abandoned
+
+        # and once that's cleared, streaming works again
+        stream = conn.RPC_stream('blockchain.scripthash.get_history', SH_A)
+        got = [item async for item in stream]
+        assert got == svr.histories[SH_A]
+        assert stream.streamed
+
+        conn.close()
+        await svr.close()
+
+    asyncio.run(doit())
+
+def test_stream_closed_early():
+    # caller gives up on a stream while its answer is still arriving
+    async def doit():
+        svr, conn = await setup()
+
+        stream = conn.RPC_stream('blockchain.scripthash.get_history', SH_A)
+        async for item in stream:
+            break
+        stream.close()
+
+        stream = conn.RPC_stream('blockchain.scripthash.get_history', SH_B)
+        got = [item async for item in stream]
+        assert got == svr.histories[SH_B]
+        assert stream.streamed
+        assert not conn.abandoned
+
+        conn.close()
+        await svr.close()
+
+    asyncio.run(doit())
+
+# EOF
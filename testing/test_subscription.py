@@ -0,0 +1,80 @@
+#
+# Subscription: the async iterator / queue that notifications are delivered to.
+#
+import asyncio
+import pytest
+
+from connectrum.client import StratumClient
+from fake_server import FakeElectrumServer
+
+SH = 'ab' * 32
+
+def run(coro, timeout=10):
+    # fail, rather than hang
+    asyncio.run(asyncio.wait_for(coro, timeout))
+
+def test_queue_like():
+    async def doit():
+        sub = StratumClient(metrics=False).listen('blockchain.scripthash.subscribe', maxsize=2)
+        assert sub.empty()
+        with pytest.raises(asyncio.QueueEmpty):
+            sub.get_nowait()
+
+        for n in range(3):
+            sub._put([SH, n])
+        assert sub.qsize() == 2 and sub.full() and sub.dropped == 1
+        assert await sub.get() == [SH, 1]
+        assert sub.get_nowait() == [SH, 2]
+
+    run(doit())
+
+def test_concurrent_getters():
+    # like asyncio.Queue, each waiter gets an item
+    async def doit():
+        sub = StratumClient(metrics=False).listen('blockchain.scripthash.subscribe')
+
+        tasks = [asyncio.ensure_future(sub.get()) for _ in range(3)]
+        await asyncio.sleep(0)
+        sub._put([SH, 1])
+        sub._put([SH, 2])
+
+        done, pending = await asyncio.wait(tasks, timeout=0.1)
+        assert sorted(t.result()[1] for t in done) == [1, 2]
+        assert len(pending) == 1 and sub.empty()
+
+        # a waiter that gives up doesn't take one
+        pending.pop().cancel()
+        getter = asyncio.ensure_future(sub.get())
+        await asyncio.sleep(0)
+        sub._put([SH, 3])
+        assert await getter == [SH, 3]
+
+        # close() ends them all
+        tasks = [asyncio.ensure_future(sub.__anext__()) for _ in range(2)]
+        await asyncio.sleep(0)
+        sub.close()
+        for t in tasks:
+            with pytest.raises(StopAsyncIteration):
+                await t
+
+    run(doit())
+
+def test_notifications():
+    async def doit():
+        svr = await FakeElectrumServer().start()
+        conn = StratumClient(metrics=False, auto_reconnect=False)
+        await conn.connect(svr.server_info(), 't', short_term=True)
+
+        fut, sub = conn.subscribe('blockchain.scripthash.subscribe', SH)
+        assert await fut is None
+
+        svr.set_history(SH, [dict(tx_hash='11' * 32, height=5)])
+        sh, status = await sub.get()
+        assert sh == SH and status is not None
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+# EOF
@@ -0,0 +1,85 @@
+#
+# KnownServers: select() by its indexes, keeping them right as the list
+# changes, and saving/loading.
+#
+import itertools, random, json
+
+from connectrum.svr_info import KnownServers, ServerInfo
+
+PROTOCOLS = ['s', 't', 'g']
+
+def make_servers(count=200, seed=1):
+    rnd = random.Random(seed)
+    ks = KnownServers()
+    for n in range(count):
+        host = ('srv%d.onion' if rnd.random() < 0.3 else 'srv%d.example.com') % n
+        ports = [p + str(50000 + n) for p in PROTOCOLS if rnd.random() < 0.6] or ['t']
+        prune = rnd.choice([None, 'p100', 'p1000', 'p10000'])
+        ks.add_single(host, ' '.join(ports + ([prune] if prune else [])),
+                        version=rnd.choice(['1.4', '1.4.2']))
+    return ks
+
+def linear(ks, protocol, is_onion, min_prune):
+    # what select() would give, without indexes
+    return sorted(str(s) for s in ks.values() if s.select(protocol, is_onion, min_prune))
+
+def check_select(ks):
+    for protocol, is_onion, min_prune in itertools.product(PROTOCOLS, [None, True, False],
+                                                            [0, 100, 1000, 5000, 10000]):
+        got = sorted(str(s) for s in ks.select(protocol, is_onion, min_prune))
+        assert got == linear(ks, protocol, is_onion, min_prune), (protocol, is_onion, min_prune)
+
+def test_select():
+    ks = make_servers()
+    check_select(ks)
+
+    # same again, from the weighted path
+    ks.health_of(next(iter(ks.values()))).failed()
+    check_select(ks)
+
+def test_index_changes():
+    ks = make_servers()
+    check_select(ks)
+
+    # replace some, with different ports/pruning
+    for key in list(ks)[:20]:
+        ks[key] = ServerInfo(key, key, 's50002 p5000')
+    check_select(ks)
+
+    del ks[list(ks)[0]]
+    ks.pop(list(ks)[0])
+    ks.pop('not-there', None)
+    ks.popitem()
+    ks.setdefault('new.example.com', ServerInfo('new', 'new.example.com', 'g p20000'))
+    ks.update({'new.onion': ServerInfo('x', 'new.onion', 't s')})
+    check_select(ks)
+
+    ks.clear()
+    assert ks.select('s') == []
+    ks.add_single('again.example.com', 't s')
+    assert [str(s) for s in ks.select('s')] == ['again.example.com']
+
+def test_json(tmp_path):
+    ks = make_servers(50)
+    ks['srv1.example.com']['seen_at'] = 1465686119.022801
+    ks['srv1.example.com']['something'] = 'else'
+    ks.health_of(ks['srv2.example.com']).connected(0.1, 'ElectrumX 1.16')
+
+    fname = str(tmp_path / 'servers.json')
+    ks.save_json(fname)
+
+    ks2 = KnownServers()
+    ks2.from_json(fname)
+    assert sorted(ks2) == sorted(ks)
+    for key, svr in ks.items():
+        assert ks2[key].to_dict() == svr.to_dict()
+    assert ks2['srv1.example.com']['something'] == 'else'
+    assert ks2.health['srv2.example.com'].to_dict() == ks.health['srv2.example.com'].to_dict()
+    check_select(ks2)
+
+    # not a dict anymore; to_dict() is what goes into JSON
+    svr = ks2['srv1.example.com']
+    assert not isinstance(svr, dict)
+    assert json.loads(json.dumps(svr.to_dict())) == svr.to_dict()
+
+# EOF
@@ -0,0 +1,65 @@
+#
+# TLS sessions: resumed on reconnect, but never over Tor (or a proxy).
+#
+import asyncio, ssl
+import pytest
+
+from connectrum import client as client_mod, tls
+from connectrum.client import StratumClient
+from fake_server import FakeElectrumServer, self_signed_context
+
+def run(coro, timeout=20):
+    # fail, rather than hang
+    asyncio.run(asyncio.wait_for(coro, timeout))
+
+async def connect_twice(svr, **kws):
+    rv = []
+    for _ in range(2):
+        conn = StratumClient(metrics=False, auto_reconnect=False)
+        await conn.connect(svr.server_info(), 's', disable_cert_verify=True,
+                                short_term=True, **kws)
+        await conn.RPC('server.ping')
+        rv.append(conn.actual_connection)
+        conn.close()
+    return rv
+
+def test_resume():
+    async def doit():
+        svr = await FakeElectrumServer(ssl=self_signed_context()).start()
+        tls.get_context(verify=False).forget(svr.host)
+
+        first, second = await connect_twice(svr)
+        assert first['tls_resumed'] is False
+        assert second['tls_resumed'] is True
+
+        await svr.close()
+
+    run(doit())
+
+@pytest.mark.skipif(client_mod.have_aiosocks, reason="would need a real Tor proxy")
+def test_no_resume_over_tor():
+    # (without aiosocks, use_tor connects directly; still no sessions kept)
+    async def doit():
+        svr = await FakeElectrumServer(ssl=self_signed_context()).start()
+        ctx = tls.get_context(verify=False)
+        ctx.forget(svr.host)
+
+        for conn in await connect_twice(svr, use_tor=True):
+            assert 'tls_resumed' not in conn
+        assert svr.host not in ctx.sessions
+
+        await svr.close()
+
+    run(doit())
+
+def test_private_context():
+    ctx = tls.get_context(verify=True, resume=False)
+    assert ctx is tls.get_context(verify=True, resume=False)
+    assert not isinstance(ctx, tls.ResumingContext)
+    assert ctx.options & ssl.OP_NO_TICKET
+    assert ctx.verify_mode == ssl.CERT_REQUIRED
+
+    ctx = tls.get_context(verify=False, resume=False)
+    assert ctx.verify_mode == ssl.CERT_NONE and not ctx.check_hostname
+
+# EOF
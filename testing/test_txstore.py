@@ -0,0 +1,94 @@
+#
+# TxStore, and the txid checks made before anything goes in it.
+#
+import asyncio
+import pytest
+
+from connectrum.txstore import TxStore, txid_of, strip_witness
+from connectrum.client import StratumClient
+from fake_server import FakeElectrumServer
+
+# coinbase of the genesis block
+GENESIS_TX = bytes.fromhex(
+    '01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4d04'
+    'ffff001d0104455468652054696d65732030332f4a616e2f32303039204368616e63656c6c6f72206f6e20'
+    '6272696e6b206f66207365636f6e64206261696c6f757420666f722062616e6b73ffffffff0100f2052a01'
+    '000000434104678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4c'
+    'ef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac00000000')
+GENESIS_TXID = '4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b'
+
+def segwit_form(legacy, witnesses):
+    # add marker, flag and a witness stack per input to a legacy serialization
+    wit = b''
+    for stack in witnesses:
+        wit += bytes([len(stack)]) + b''.join(bytes([len(i)]) + i for i in stack)
+    return legacy[:4] + b'\x00\x01' + legacy[4:-4] + wit + legacy[-4:]
+
+def p2wpkh_spend():
+    # one input spending a P2WPKH output (empty scriptSig), one P2WPKH output
+    legacy = (bytes.fromhex('02000000') + b'\x01' + bytes(range(32)) + bytes(4)
+                + b'\x00' + b'\xfd\xff\xff\xff'
+                + b'\x01' + (50000).to_bytes(8, 'little') + b'\x16\x00\x14' + bytes(20)
+                + bytes(4))
+    return legacy, segwit_form(legacy, [[b'\x30' * 71, b'\x02' * 33]])
+
+def test_legacy_txid():
+    assert txid_of(GENESIS_TX) == GENESIS_TXID
+    assert strip_witness(GENESIS_TX) is GENESIS_TX
+
+def test_segwit_txid():
+    # same transaction, witness added: txid doesn't change
+    sw = segwit_form(GENESIS_TX, [[bytes(32)]])
+    assert strip_witness(sw) == GENESIS_TX
+    assert txid_of(sw) == GENESIS_TXID
+
+    legacy, sw = p2wpkh_spend()
+    assert txid_of(sw) == txid_of(legacy)
+
+def test_not_really_segwit():
+    # 00 01 after the version, but doesn't parse as segwit: hashed as-is
+    raw = bytes.fromhex('0100000000010203')
+    assert strip_witness(raw) is raw
+
+def test_put_get(tmp_path):
+    legacy, sw = p2wpkh_spend()
+    st = TxStore(str(tmp_path))
+    st.put(txid_of(legacy), sw)
+    st.put(GENESIS_TXID, GENESIS_TX)
+    assert st.get(txid_of(legacy)) == sw
+    assert len(st) == 2
+
+    with pytest.raises(ValueError):
+        st.put(GENESIS_TXID, sw)
+
+    # another reader sees them
+    again = TxStore(str(tmp_path))
+    assert again.get(GENESIS_TXID) == GENESIS_TX
+    st.close()
+    again.close()
+
+def test_client_segwit_fetch(tmp_path):
+    async def doit():
+        svr = await FakeElectrumServer().start()
+        _, sw = p2wpkh_spend()
+        txid = svr.add_tx(sw)
+
+        st = TxStore(str(tmp_path))
+        conn = StratumClient(txstore=st, metrics=False, auto_reconnect=False)
+        await conn.connect(svr.server_info(), 't', short_term=True)
+
+        assert await conn.RPC('blockchain.transaction.get', txid) == sw.hex()
+        assert st.get(txid) == sw
+
+        # second time, from the store
+        before = svr.requests
+        assert await conn.RPC('blockchain.transaction.get', txid) == sw.hex()
+        assert svr.requests == before
+
+        conn.close()
+        await svr.close()
+        st.close()
+
+    asyncio.run(doit())
+
+# EOF
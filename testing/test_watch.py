@@ -0,0 +1,84 @@
+#
+# ScripthashWatcher: many scripthashes at once, and what happens when
+# some (or all) of them can't be subscribed.
+#
+import asyncio
+
+from connectrum.client import StratumClient
+from fake_server import FakeElectrumServer, status_of
+
+def run(coro, timeout=20):
+    # fail, rather than hang
+    asyncio.run(asyncio.wait_for(coro, timeout))
+
+SHS = ['%064x' % n for n in range(1000)]
+
+async def setup(**kws):
+    svr = await FakeElectrumServer().start()
+    svr.set_history(SHS[7], [dict(tx_hash='11' * 32, height=5)], notify=False)
+
+    conn = StratumClient(metrics=False, **kws)
+    await conn.connect(svr.server_info(), 't', short_term=True)
+    return svr, conn
+
+def test_watch():
+    async def doit():
+        svr, conn = await setup()
+
+        watcher = await conn.watch(SHS, chunk_size=100)
+        assert len(watcher) == len(SHS)
+        assert watcher.status[SHS[0]] is None
+        assert watcher.status[SHS[7]] == status_of(svr.histories[SHS[7]])
+
+        svr.set_history(SHS[3], [dict(tx_hash='22' * 32, height=6)])
+        sh, status = await watcher.get()
+        assert sh == SHS[3] and status == watcher.status[SHS[3]]
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+def test_refused():
+    async def doit():
+        svr, conn = await setup()
+
+        real = svr.rpc_blockchain_scripthash_subscribe
+        def picky(sess, sh):
+            if sh in SHS[:5]:
+                raise ValueError("no")
+            return real(sess, sh)
+        svr.rpc_blockchain_scripthash_subscribe = picky
+
+        watcher = await conn.watch([])
+        failed = await watcher.add(SHS[:10])
+        assert failed == SHS[:5]
+        assert sorted(watcher.status) == SHS[5:10]
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+def test_connection_lost():
+    # no answers at all: nothing is watched with a bogus status
+    async def doit():
+        svr, conn = await setup(auto_reconnect=False)
+        svr.latency = 0.1
+
+        watcher = await conn.watch([])
+        task = asyncio.ensure_future(watcher.add(SHS))
+        await asyncio.sleep(0.05)
+        svr.kill_sessions()
+
+        failed = await task
+        assert failed == SHS
+        assert len(watcher) == len(SHS)
+        assert all(status is Ellipsis for status in watcher.status.values())
+
+        conn.close()
+        await svr.close()
+
+    run(doit())
+
+# EOF